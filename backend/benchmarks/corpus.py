@@ -0,0 +1,42 @@
+"""Synthetic PDF articles for benchmarking."""
+import os
+import random
+import textwrap
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+from benchmarks.fake_services import WORDS
+
+LINES_PER_PAGE = 45
+CHARS_PER_LINE = 90
+
+
+def article_text(seed: int, pages: int) -> list[str]:
+    """Return the lines of a deterministic, seed-specific article."""
+    rng = random.Random(seed)
+    vocabulary = WORDS + [f"term{seed}x{i}" for i in range(50)]
+    words = [rng.choice(vocabulary) for _ in range(pages * LINES_PER_PAGE * CHARS_PER_LINE // 8)]
+    return textwrap.wrap(" ".join(words), CHARS_PER_LINE)[: pages * LINES_PER_PAGE]
+
+
+def write_pdf(path: str, seed: int, pages: int) -> str:
+    pdf = canvas.Canvas(path, pagesize=letter)
+    lines = article_text(seed, pages)
+    for page_start in range(0, len(lines), LINES_PER_PAGE):
+        y = 750
+        for line in lines[page_start : page_start + LINES_PER_PAGE]:
+            pdf.drawString(40, y, line)
+            y -= 16
+        pdf.showPage()
+    pdf.save()
+    return path
+
+
+def build_corpus(directory: str, documents: int, pages: int, seed: int = 0) -> list[str]:
+    """Write `documents` distinct PDFs of `pages` pages each and return their paths."""
+    os.makedirs(directory, exist_ok=True)
+    return [
+        write_pdf(os.path.join(directory, f"article-{seed + i}.pdf"), seed + i, pages)
+        for i in range(documents)
+    ]
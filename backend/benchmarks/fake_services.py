@@ -0,0 +1,203 @@
+"""Local stand-ins for the OpenAI, Anthropic and ElevenLabs APIs, with configurable
+latency and payload sizes, so the pipeline can be benchmarked offline."""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# One silent MPEG-1 Layer III frame: 32 kbps, 44.1 kHz, mono, 104 bytes, 26 ms
+MP3_FRAME = b"\xff\xfb\x10\xc0" + bytes(100)
+
+WORDS = (
+    "energy system model process theory structure history market network signal "
+    "evidence method value culture policy language memory pattern design practice"
+).split()
+
+
+class _FakeServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        self._lock = threading.Lock()
+        self.requests = {}
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def count(self, kind: str) -> None:
+        with self._lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                fake.handle(self, self.path, json.loads(body or b"{}"))
+
+        return Handler
+
+    def handle(self, handler: BaseHTTPRequestHandler, path: str, body: dict) -> None:
+        raise NotImplementedError
+
+
+def _send(handler, status, content_type, payload: bytes) -> None:
+    handler.send_response(status)
+    handler.send_header("Content-Type", content_type)
+    handler.send_header("Content-Length", str(len(payload)))
+    handler.end_headers()
+    handler.wfile.write(payload)
+
+
+def _start_stream(handler, content_type) -> None:
+    handler.send_response(200)
+    handler.send_header("Content-Type", content_type)
+    handler.send_header("Transfer-Encoding", "chunked")
+    handler.end_headers()
+
+
+def _write_chunk(handler, data: bytes) -> None:
+    handler.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+    handler.wfile.flush()
+
+
+def _end_stream(handler) -> None:
+    handler.wfile.write(b"0\r\n\r\n")
+    handler.wfile.flush()
+
+
+class FakeLLMServer(_FakeServer):
+    """Answers OpenAI ChatCompletion (/v1/chat/completions) and Anthropic Messages
+    (/v1/messages) requests with well-formed topics or lessons JSON.
+
+    latency is the time to the first token; streamed responses are then sent in
+    stream_chunk_chars pieces every stream_chunk_seconds.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.5,
+        topics: int = 2,
+        lessons_per_topic: int = 5,
+        lesson_chars: int = 600,
+        stream_chunk_chars: int = 40,
+        stream_chunk_seconds: float = 0.005,
+        **kwargs,
+    ) -> None:
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.topics = topics
+        self.lessons_per_topic = lessons_per_topic
+        self.lesson_chars = lesson_chars
+        self.stream_chunk_chars = stream_chunk_chars
+        self.stream_chunk_seconds = stream_chunk_seconds
+
+    def _text(self, rng, chars):
+        words = []
+        while sum(len(w) + 1 for w in words) < chars:
+            words.append(rng.choice(WORDS))
+        return " ".join(words)
+
+    def _lessons(self, rng):
+        return [
+            {
+                "lesson": self._text(rng, self.lesson_chars),
+                "question": self._text(rng, 80),
+                "right_answer": self._text(rng, 60),
+                "wrong_answer": self._text(rng, 60),
+                "right_answer_explanation": self._text(rng, 120),
+            }
+            for _ in range(self.lessons_per_topic)
+        ]
+
+    def completion(self, prompt: str) -> tuple[str, str]:
+        """Return (kind, content) for a rendered prompt."""
+        rng = random.Random(prompt)
+        if '"instruction"' in prompt and '"topics"' in prompt:
+            listed = prompt.split("each of these topics:", 1)[1].split("For every topic", 1)[0]
+            topics = [line.strip()[2:] for line in listed.splitlines() if line.strip().startswith("- ")]
+            batch = [{"topic": t, "instruction": self._lessons(rng)} for t in topics]
+            return "lessons_batch", json.dumps({"subject": "benchmark", "topics": batch})
+        if '"instruction"' in prompt:
+            return "lessons", json.dumps({"subject": "benchmark", "instruction": self._lessons(rng)})
+        topics = [
+            {"topic": f"{self._text(rng, 12).title()} {i}", "relevance_to_subject": "high"}
+            for i in range(self.topics)
+        ]
+        return "topics", json.dumps({"subject": "benchmark", "topics": topics})
+
+    def handle(self, handler, path, body):
+        prompt = body["messages"][-1]["content"]
+        kind, content = self.completion(prompt)
+        self.count(kind)
+        time.sleep(self.latency)
+        anthropic = path.rstrip("/").endswith("/messages")
+
+        if not body.get("stream"):
+            if anthropic:
+                response = {"type": "message", "content": [{"type": "text", "text": content}]}
+            else:
+                response = {
+                    "id": "benchmark",
+                    "object": "chat.completion",
+                    "choices": [
+                        {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+                    ],
+                }
+            _send(handler, 200, "application/json", json.dumps(response).encode())
+            return
+
+        _start_stream(handler, "text/event-stream")
+        for i in range(0, len(content), self.stream_chunk_chars):
+            piece = content[i : i + self.stream_chunk_chars]
+            if anthropic:
+                event = {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": piece}}
+            else:
+                event = {
+                    "id": "benchmark",
+                    "object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+                }
+            _write_chunk(handler, b"data: " + json.dumps(event).encode() + b"\n\n")
+            time.sleep(self.stream_chunk_seconds)
+        if anthropic:
+            _write_chunk(handler, b'data: {"type": "message_stop"}\n\n')
+        else:
+            _write_chunk(handler, b"data: [DONE]\n\n")
+        _end_stream(handler)
+
+
+class FakeTTSServer(_FakeServer):
+    """Answers ElevenLabs text-to-speech requests with audio_bytes of silent mp3,
+    streamed after latency seconds."""
+
+    def __init__(self, latency: float = 0.3, audio_bytes: int = 64 * 1024, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.audio = MP3_FRAME * max(1, audio_bytes // len(MP3_FRAME))
+
+    def handle(self, handler, path, body):
+        self.count("tts")
+        time.sleep(self.latency)
+        _start_stream(handler, "audio/mpeg")
+        for i in range(0, len(self.audio), 16 * 1024):
+            _write_chunk(handler, self.audio[i : i + 16 * 1024])
+        _end_stream(handler)
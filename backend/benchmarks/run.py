@@ -0,0 +1,188 @@
+"""End-to-end benchmark of /generate-course against local fake LLM and TTS servers.
+
+Run from the backend directory:
+
+    python -m benchmarks.run --requests 20 --concurrency 4
+
+Reports throughput, request latency percentiles and a per-stage breakdown. Pass
+--database-url to use a local Postgres instead of a throwaway SQLite file, and
+--json to save the report for comparison across runs.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.corpus import build_corpus
+from benchmarks.fake_services import FakeLLMServer, FakeTTSServer
+
+PERCENTILES = (50, 95, 99)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=10, help="course generations to run")
+    parser.add_argument("--concurrency", type=int, default=2, help="requests in flight at once")
+    parser.add_argument("--documents", type=int, default=None, help="distinct PDFs; fewer than --requests exercises dedup (default: one per request)")
+    parser.add_argument("--pages", type=int, default=3, help="pages per synthetic PDF")
+    parser.add_argument("--topics", type=int, default=2, help="topics per fake topics response")
+    parser.add_argument("--lessons", type=int, default=5, help="lessons per fake lessons response")
+    parser.add_argument("--lesson-chars", type=int, default=600, help="characters per fake lesson")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds to first token")
+    parser.add_argument("--tts-latency", type=float, default=0.3, help="seconds before audio starts")
+    parser.add_argument("--tts-bytes", type=int, default=64 * 1024, help="bytes of audio per narration")
+    parser.add_argument("--mode", choices=("per_topic", "batch"), default="per_topic", help="LESSON_GENERATION_MODE for the run")
+    parser.add_argument("--providers", default="openai", help="LESSON_TEXT_PROVIDERS for the run")
+    parser.add_argument("--llm-cache", action="store_true", help="keep the LLM response cache enabled")
+    parser.add_argument("--database-url", default=None, help="SQLAlchemy URL (default: temporary SQLite)")
+    parser.add_argument("--json", dest="json_path", default=None, help="also write the report here")
+    return parser.parse_args(argv)
+
+
+def configure_environment(workdir, llm, tts, args):
+    """Point the app at the fakes and at throwaway local state. Must run before the
+    app is imported, since settings are read at import time."""
+    os.environ.update(
+        {
+            "OPENAI_API_BASE": f"{llm.url}/v1",
+            "OPENAI_API_KEY": "benchmark",
+            "ANTHROPIC_API_URL": llm.url,
+            "ANTHROPIC_API_KEY": "benchmark",
+            "ELEVEN_LABS_API_URL": tts.url,
+            "ELEVEN_LABS_API_KEY": "benchmark",
+            "LESSON_TEXT_PROVIDERS": args.providers,
+            "LESSON_GENERATION_MODE": args.mode,
+            # The fake LLM server has no embeddings endpoint
+            "EMBEDDING_BACKEND": "hashing",
+            "LLM_CACHE_PATH": os.path.join(workdir, "llm_cache.sqlite3") if args.llm_cache else "",
+            "JOBS_DB_PATH": os.path.join(workdir, "jobs.sqlite3"),
+            "INGEST_JOBS_DB_PATH": os.path.join(workdir, "ingest_jobs.sqlite3"),
+            "COURSE_CACHE_PATH": os.path.join(workdir, "course_cache.sqlite3"),
+            "NARRATION_DIR": os.path.join(workdir, "narration"),
+        }
+    )
+
+
+def create_benchmark_app(workdir, database_url):
+    from config import Config
+    from server import create_app
+    from edutainment.database import db
+
+    class BenchmarkConfig(Config):
+        SQLALCHEMY_DATABASE_URI = database_url or f"sqlite:///{os.path.join(workdir, 'benchmark.sqlite3')}"
+        SQLALCHEMY_ENGINE_OPTIONS = dict(Config.SQLALCHEMY_ENGINE_OPTIONS)
+        if SQLALCHEMY_DATABASE_URI.startswith("sqlite"):
+            # statement_timeout is a Postgres option
+            SQLALCHEMY_ENGINE_OPTIONS.pop("connect_args", None)
+
+    app = create_app(BenchmarkConfig)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def serve(app):
+    from werkzeug.serving import make_server
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def generate_course(base_url, pdf_path):
+    started = time.perf_counter()
+    with open(pdf_path, "rb") as f:
+        response = requests.post(
+            f"{base_url}/generate-course",
+            files={"selectedFile": (os.path.basename(pdf_path), f, "application/pdf")},
+            data={"sessionId": str(uuid.uuid4()), "age": "30", "expertise": "intermediate"},
+            timeout=600,
+        )
+    return time.perf_counter() - started, response.status_code
+
+
+def summarize(values):
+    from edutainment.tracing import percentile
+
+    summary = {"count": len(values), "total_seconds": round(sum(values), 3)}
+    for q in PERCENTILES:
+        value = percentile(values, q)
+        summary[f"p{q}_seconds"] = round(value, 3) if value is not None else None
+    return summary
+
+
+def run(args):
+    from edutainment.tracing import get_stage_timer
+
+    workdir = tempfile.mkdtemp(prefix="edutainment-benchmark-")
+    llm = FakeLLMServer(
+        latency=args.llm_latency, topics=args.topics, lessons_per_topic=args.lessons, lesson_chars=args.lesson_chars
+    ).start()
+    tts = FakeTTSServer(latency=args.tts_latency, audio_bytes=args.tts_bytes).start()
+    configure_environment(workdir, llm, tts, args)
+
+    app = create_benchmark_app(workdir, args.database_url)
+    server, base_url = serve(app)
+    corpus = build_corpus(os.path.join(workdir, "corpus"), args.documents or args.requests, args.pages)
+    pdfs = [corpus[i % len(corpus)] for i in range(args.requests)]
+
+    get_stage_timer().reset()
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            results = list(executor.map(lambda path: generate_course(base_url, path), pdfs))
+    finally:
+        server.shutdown()
+    elapsed = time.perf_counter() - started
+
+    latencies = [seconds for seconds, status in results if status == 200]
+    return {
+        "parameters": vars(args),
+        "wall_seconds": round(elapsed, 3),
+        "throughput_per_minute": round(len(latencies) / elapsed * 60, 2),
+        "succeeded": len(latencies),
+        "failed": len(results) - len(latencies),
+        "latency": summarize(latencies),
+        "stages": {
+            name: {**summarize(stage["recent"]), "errors": stage["errors"]}
+            for name, stage in sorted(get_stage_timer().snapshot().items())
+        },
+        "fake_requests": {"llm": llm.requests, "tts": tts.requests},
+    }
+
+
+def print_report(report):
+    latency = report["latency"]
+    print(
+        f"{report['succeeded']} succeeded, {report['failed']} failed in {report['wall_seconds']}s "
+        f"({report['throughput_per_minute']} courses/min)"
+    )
+    print("latency  " + "  ".join(f"p{q} {latency[f'p{q}_seconds']}s" for q in PERCENTILES))
+    print(f"{'stage':<16}{'count':>7}{'errors':>8}{'total s':>10}" + "".join(f"{'p' + str(q) + ' s':>9}" for q in PERCENTILES))
+    for name, stage in report["stages"].items():
+        print(
+            f"{name:<16}{stage['count']:>7}{stage['errors']:>8}{stage['total_seconds']:>10}"
+            + "".join(f"{stage[f'p{q}_seconds']:>9}" for q in PERCENTILES)
+        )
+    print(f"fake requests: {report['fake_requests']}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if report["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,6 +3,8 @@ import os
 import openai
 from dotenv import load_dotenv
 
+from edutainment.database import TimedQueuePool
+
 load_dotenv()
 debug_status = os.getenv("DEBUG") == "TRUE"
 openai.api_key = os.getenv("OPENAI_API_KEY")
@@ -28,3 +30,40 @@ class Config:
         f"postgresql+psycopg2://{os.getenv('DB_PROD_USERNAME')}:{os.getenv('DB_PROD_PASSWORD')}"
         f"@{os.getenv('DB_PROD_HOSTNAME')}/{os.getenv('DB_PROD_DB_NAME')}"
     )
+
+    # Engine pool; no connection is held during LLM or TTS calls, so a small pool
+    # serves many concurrent generations
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "poolclass": TimedQueuePool,
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_POOL_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "10")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800")),
+        "pool_pre_ping": True,
+        "connect_args": {
+            "options": f"-c statement_timeout={int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '30000'))}"
+        },
+    }
+
+    # Concurrent per-topic lesson generation in /generate-course
+    COURSE_GENERATION_MAX_WORKERS = int(os.getenv("COURSE_GENERATION_MAX_WORKERS", "4"))
+    TOPIC_TIMEOUT_SECONDS = float(os.getenv("TOPIC_TIMEOUT_SECONDS", "180"))
+    # "per_topic" streams each topic's lessons from its own completion; "batch" writes
+    # the lessons of several topics per completion, see BaseLessonText.get_lessons_batch
+    LESSON_GENERATION_MODE = os.getenv("LESSON_GENERATION_MODE", "per_topic")
+
+    # Seconds a worker may spend importing and building the app before a warning is logged
+    STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "2"))
+
+    # Narration audio, resolved once instead of per request
+    NARRATION_DIR = os.path.abspath(os.getenv("NARRATION_DIR", "narration"))
+    # Browser cache lifetime for narrations that are not content-addressed; those
+    # that are never change and are cached for a year
+    NARRATION_MAX_AGE_SECONDS = int(os.getenv("NARRATION_MAX_AGE_SECONDS", "86400"))
+    # Let a fronting nginx/Apache send audio files with X-Sendfile
+    USE_X_SENDFILE = os.getenv("USE_X_SENDFILE") == "TRUE"
+
+    # Bearer token for POST /ingest; the endpoint is disabled while unset
+    INGEST_API_TOKEN = os.getenv("INGEST_API_TOKEN")
+    # Server-side directory that POST /ingest may read PDFs from by path
+    INGEST_ROOT = os.getenv("INGEST_ROOT")
@@ -0,0 +1,224 @@
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterator
+
+from dotenv import find_dotenv, load_dotenv
+
+from edutainment.narration_cache import NARRATION_DIR, file_etag
+
+logger = logging.getLogger(__name__)
+
+_ = load_dotenv(find_dotenv())
+
+# Concatenate each topic's narrations into one track after they are generated
+AUDIO_POSTPROCESS = os.getenv("AUDIO_POSTPROCESS") == "TRUE"
+# Re-encode topic tracks at this bitrate; 0 keeps the TTS encoding as is
+AUDIO_BITRATE_KBPS = int(os.getenv("AUDIO_BITRATE_KBPS", "64"))
+AUDIO_POSTPROCESS_WORKERS = int(os.getenv("AUDIO_POSTPROCESS_WORKERS", "2"))
+TOPIC_TRACK_DIR = os.getenv("TOPIC_TRACK_DIR", os.path.join(NARRATION_DIR, "topics"))
+
+# MPEG audio Layer III tables, indexed by version bits (3: MPEG-1, 2: MPEG-2, 0: MPEG-2.5)
+_BITRATES_KBPS = {
+    3: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    0: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    0: (11025, 12000, 8000),
+}
+_SAMPLES_PER_FRAME = {3: 1152, 2: 576, 0: 576}
+
+
+def _id3v2_size(data: bytes) -> int:
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _parse_frame_header(data: bytes, offset: int):
+    """Return (frame length, duration in seconds) of the Layer III frame at offset,
+    or None if there is no valid frame header there."""
+    if offset + 4 > len(data):
+        return None
+    b1, b2 = data[offset + 1], data[offset + 2]
+    if data[offset] != 0xFF or b1 & 0xE0 != 0xE0:
+        return None
+    version = (b1 >> 3) & 0x3
+    layer = (b1 >> 1) & 0x3
+    bitrate_index = b2 >> 4
+    sample_rate_index = (b2 >> 2) & 0x3
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    bitrate = _BITRATES_KBPS[version][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][sample_rate_index]
+    samples = _SAMPLES_PER_FRAME[version]
+    padding = (b2 >> 1) & 0x1
+    length = samples // 8 * bitrate // sample_rate + padding
+    return length, samples / sample_rate
+
+
+def iter_mp3_frames(data: bytes) -> Iterator[tuple[int, int, float]]:
+    """Yield (offset, length, duration in seconds) of each audio frame in an mp3.
+
+    ID3 tags, junk between frames and the Xing/Info/VBRI header frame, whose frame
+    counts would be wrong once clips are joined, are skipped.
+    """
+    offset = _id3v2_size(data)
+    first = True
+    while offset < len(data):
+        header = _parse_frame_header(data, offset)
+        if header is None:
+            offset += 1
+            continue
+        length, duration = header
+        if offset + length > len(data):
+            break
+        if first:
+            first = False
+            head = data[offset : offset + min(length, 64)]
+            if b"Xing" in head or b"Info" in head or b"VBRI" in head:
+                offset += length
+                continue
+        yield offset, length, duration
+        offset += length
+
+
+def concatenate_mp3(paths: list[str], output_path: str) -> list[dict]:
+    """Join mp3 clips frame by frame, without re-encoding.
+
+    Returns:
+    --------
+    list[dict[str, float]]
+        Where each clip starts in the joined track. Formatted like this:
+
+        [
+            {"start_seconds": 0.0, "duration_seconds": 12.3},
+            ...
+        ]
+    """
+    chapters = []
+    start = 0.0
+    with open(output_path, "wb") as out:
+        for path in paths:
+            with open(path, "rb") as f:
+                data = f.read()
+            duration = 0.0
+            for offset, length, frame_duration in iter_mp3_frames(data):
+                out.write(data[offset : offset + length])
+                duration += frame_duration
+            chapters.append({"start_seconds": round(start, 3), "duration_seconds": round(duration, 3)})
+            start += duration
+    return chapters
+
+
+def ffmpeg_executable() -> str:
+    """Return the ffmpeg bundled with imageio-ffmpeg, else the one on PATH, else None."""
+    try:
+        import imageio_ffmpeg
+
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        return shutil.which("ffmpeg")
+
+
+def transcode_mp3(input_path: str, output_path: str, bitrate_kbps: int) -> None:
+    """Re-encode an mp3 at a constant bitrate with ffmpeg."""
+    ffmpeg = ffmpeg_executable()
+    if ffmpeg is None:
+        raise FileNotFoundError("ffmpeg is not available")
+    subprocess.run(
+        [
+            ffmpeg, "-v", "error", "-y", "-i", input_path,
+            "-codec:a", "libmp3lame", "-b:a", f"{bitrate_kbps}k", "-write_xing", "0",
+            "-f", "mp3", output_path,
+        ],
+        check=True,
+        capture_output=True,
+    )
+
+
+def topic_track_key(narration_files: list[str], bitrate_kbps: int) -> str:
+    """Content address of the track built from narration_files."""
+    payload = json.dumps(
+        {"clips": [file_etag(path) for path in narration_files], "bitrate_kbps": bitrate_kbps},
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def topic_track_files(track: str) -> list[str]:
+    """The files stored for a topic track: the mp3 and its chapter list."""
+    return [track, f"{os.path.splitext(track)[0]}.json"]
+
+
+def build_topic_track(
+    narration_files: list[str],
+    output_dir: str = TOPIC_TRACK_DIR,
+    bitrate_kbps: int = AUDIO_BITRATE_KBPS,
+) -> dict:
+    """Concatenate a topic's narrations into one track, re-encoded at bitrate_kbps.
+
+    Tracks are content-addressed, so rebuilding an existing one is a no-op.
+
+    Returns:
+    --------
+    dict
+        {"narration_track": "<output_dir>/<key>.mp3", "chapters": [...]}, with the
+        chapters of concatenate_mp3, one per narration file.
+    """
+    key = topic_track_key(narration_files, bitrate_kbps)
+    track, index = topic_track_files(os.path.join(output_dir, f"{key}.mp3"))
+    if os.path.exists(track) and os.path.exists(index):
+        with open(index) as f:
+            return {"narration_track": track, "chapters": json.load(f)}
+
+    os.makedirs(output_dir, exist_ok=True)
+    partial = f"{track}.{os.getpid()}.part"
+    joined = f"{partial}.joined"
+    try:
+        chapters = concatenate_mp3(narration_files, joined)
+        if bitrate_kbps:
+            transcode_mp3(joined, partial, bitrate_kbps)
+        else:
+            os.replace(joined, partial)
+        with open(f"{index}.{os.getpid()}.part", "w") as f:
+            json.dump(chapters, f)
+        os.replace(f"{index}.{os.getpid()}.part", index)
+        os.replace(partial, track)
+    finally:
+        for path in (joined, partial, f"{index}.{os.getpid()}.part"):
+            if os.path.exists(path):
+                os.remove(path)
+    return {"narration_track": track, "chapters": chapters}
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Not forked: the pool is created from a worker thread, long after others started
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _executor = ProcessPoolExecutor(
+                max_workers=AUDIO_POSTPROCESS_WORKERS, mp_context=multiprocessing.get_context(start_method)
+            )
+        return _executor
+
+
+def submit_topic_track(narration_files: list[str]) -> Future:
+    """Build a topic track on the post-processing process pool."""
+    return _get_executor().submit(build_topic_track, narration_files)
@@ -0,0 +1,93 @@
+import math
+import re
+from collections import Counter
+
+# Rough average for English text with OpenAI tokenizers; avoids a tokenizer dependency
+CHARS_PER_TOKEN = 4
+
+_paragraph_break = re.compile(r"\n\s*\n")
+_sentence_break = re.compile(r"(?<=[.!?])\s+")
+_word = re.compile(r"[a-z0-9]+")
+
+# Too common to say anything about which passage a topic is in
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this "
+    "to was were which with".split()
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Return an estimate of the number of tokens in text."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _pieces(text: str, max_tokens: int) -> list[str]:
+    """Split text into paragraphs, breaking any that are too long by sentence and
+    then by character count."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    pieces = []
+    for paragraph in _paragraph_break.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        for sentence in _sentence_break.split(paragraph):
+            pieces.extend(
+                sentence[i : i + max_chars] for i in range(0, len(sentence), max_chars)
+            )
+    return pieces
+
+
+def split_into_chunks(text: str, max_tokens: int) -> list[str]:
+    """Split text into chunks of at most max_tokens, on paragraph boundaries where
+    possible."""
+    chunks = []
+    current = []
+    current_tokens = 0
+    for piece in _pieces(text, max_tokens):
+        piece_tokens = estimate_tokens(piece) + 1
+        if current and current_tokens + piece_tokens > max_tokens:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += piece_tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def terms(text: str) -> list[str]:
+    """Return the lowercase words of text, without stopwords."""
+    return [w for w in _word.findall(text.lower()) if w not in STOPWORDS]
+
+
+def select_relevant_chunks(chunks: list[str], topic: str, max_tokens: int) -> list[str]:
+    """Return the chunks most relevant to topic that fit in max_tokens, in their
+    original order.
+
+    Chunks are ranked by how often they mention the topic's terms, weighting rare
+    terms higher (tf-idf).
+    """
+    topic_terms = set(terms(topic))
+    chunk_terms = [Counter(terms(chunk)) for chunk in chunks]
+    document_frequency = Counter(t for terms in chunk_terms for t in topic_terms if t in terms)
+
+    def score(i):
+        terms = chunk_terms[i]
+        length = sum(terms.values()) or 1
+        return sum(
+            terms[t] / length * math.log((1 + len(chunks)) / (1 + document_frequency[t]))
+            for t in topic_terms
+        )
+
+    selected = []
+    used_tokens = 0
+    for i in sorted(range(len(chunks)), key=score, reverse=True):
+        chunk_tokens = estimate_tokens(chunks[i])
+        if used_tokens + chunk_tokens > max_tokens:
+            continue
+        selected.append(i)
+        used_tokens += chunk_tokens
+    return [chunks[i] for i in sorted(selected)]
@@ -0,0 +1,159 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from dotenv import find_dotenv, load_dotenv
+
+from edutainment.database import db
+from edutainment.llm_cache import (
+    BaseResponseCache,
+    MemoryResponseCache,
+    SQLiteResponseCache,
+    TieredResponseCache,
+)
+from edutainment.models import Article, ArticleTopic, Lesson
+
+logger = logging.getLogger(__name__)
+
+_ = load_dotenv(find_dotenv())
+
+# Shared by the workers on a host; entries are dropped whenever a course is regenerated
+COURSE_CACHE_PATH = os.getenv("COURSE_CACHE_PATH", "course_cache.sqlite3")
+COURSE_CACHE_TTL_SECONDS = float(os.getenv("COURSE_CACHE_TTL_SECONDS", str(24 * 3600)))
+# Bounds how long another worker's in-process copy can outlive an invalidation
+COURSE_CACHE_MEMORY_TTL_SECONDS = float(os.getenv("COURSE_CACHE_MEMORY_TTL_SECONDS", "30"))
+COURSE_CACHE_MEMORY_ENTRIES = int(os.getenv("COURSE_CACHE_MEMORY_ENTRIES", "512"))
+
+LESSON_COLUMNS = (
+    Lesson.lesson_id,
+    Lesson.lesson_content,
+    Lesson.question,
+    Lesson.right_answer,
+    Lesson.wrong_answer,
+    Lesson.right_answer_explanation,
+    Lesson.order_num,
+    Lesson.narration_file,
+    Lesson.video_file,
+)
+
+
+def load_course(article_id: str) -> dict:
+    """Read an article's topics and lessons in a single query.
+
+    Returns:
+    --------
+    dict
+        None if there is no such article, otherwise formatted like this:
+
+        {
+            "article_id": "...",
+            "filename": "article.pdf",
+            "topics": [
+                {
+                    "topic": "topic 1",
+                    "article_topic_id": "...",
+                    "narration_track": "narration/topics/<key>.mp3" or None,
+                    "chapters": [{"start_seconds": 0.0, "duration_seconds": 12.3}, ...] or None,
+                    "lessons": [{"lesson_id": "...", "lesson_content": "...", ...}, ...]
+                },
+                ...
+            ]
+        }
+    """
+    filename = db.session.execute(
+        db.select(Article.filename).where(Article.article_id == article_id)
+    ).scalar_one_or_none()
+    if filename is None:
+        return None
+
+    # Served by the (article_id, topic_name) index
+    rows = db.session.execute(
+        db.select(
+            ArticleTopic.article_topic_id,
+            ArticleTopic.topic_name,
+            ArticleTopic.narration_track,
+            ArticleTopic.narration_chapters,
+            *LESSON_COLUMNS,
+        )
+        .outerjoin(Lesson, Lesson.article_topic_id == ArticleTopic.article_topic_id)
+        .where(ArticleTopic.article_id == article_id)
+        .order_by(ArticleTopic.topic_name, Lesson.order_num)
+    ).all()
+
+    topics = {}
+    for row in rows:
+        topic = topics.setdefault(
+            row.article_topic_id,
+            {
+                "topic": row.topic_name,
+                "article_topic_id": row.article_topic_id,
+                "narration_track": row.narration_track,
+                "chapters": json.loads(row.narration_chapters) if row.narration_chapters else None,
+                "lessons": [],
+            },
+        )
+        if row.lesson_id is not None:
+            topic["lessons"].append({c.key: getattr(row, c.key) for c in LESSON_COLUMNS})
+    return {"article_id": article_id, "filename": filename, "topics": list(topics.values())}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_course_cache() -> BaseResponseCache:
+    """Return the process-wide cache of serialized courses: memory LRU, backed by
+    SQLite unless COURSE_CACHE_PATH is empty."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            tiers = [
+                MemoryResponseCache(
+                    COURSE_CACHE_MEMORY_ENTRIES, ttl_seconds=COURSE_CACHE_MEMORY_TTL_SECONDS
+                )
+            ]
+            if COURSE_CACHE_PATH:
+                try:
+                    tiers.append(
+                        SQLiteResponseCache(COURSE_CACHE_PATH, ttl_seconds=COURSE_CACHE_TTL_SECONDS)
+                    )
+                except sqlite3.Error as e:
+                    logger.error("Unable to open course cache at %s: %s", COURSE_CACHE_PATH, e)
+            _cache = TieredResponseCache(*tiers)
+        return _cache
+
+
+def get_course_json(article_id: str) -> str:
+    """Return the course as JSON, from cache if possible; None if there is no such
+    article. Only complete courses are cached."""
+    cache = get_course_cache()
+    payload = cache.get(article_id)
+    if payload is not None:
+        return payload
+
+    course = load_course(article_id)
+    if course is None:
+        return None
+    payload = json.dumps(course, separators=(",", ":"))
+    if is_complete(course):
+        # A course still being generated would otherwise be served stale until expiry
+        cache.set(article_id, payload)
+    return payload
+
+
+def is_complete(course: dict) -> bool:
+    """Whether every topic has lessons and every lesson has been narrated."""
+    return bool(course["topics"]) and all(
+        topic["lessons"] and all(lesson["narration_file"] for lesson in topic["lessons"])
+        for topic in course["topics"]
+    )
+
+
+def invalidate_course(article_id: str) -> None:
+    """Drop the cached course, after its topics, lessons or narrations change."""
+    try:
+        get_course_cache().delete(article_id)
+    except sqlite3.Error as e:
+        logger.error("Unable to invalidate cached course %s: %s", article_id, e)
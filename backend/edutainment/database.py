@@ -0,0 +1,82 @@
+import threading
+import time
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+from edutainment.tracing import record_stage
+
+# Bound to the app in server.create_app, so importing models never needs an app
+db = SQLAlchemy()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait to check out a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._wait_lock = threading.Lock()
+        self.wait_count = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            with self._wait_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self._wait_lock:
+                self.wait_count += 1
+                self.wait_seconds_total += waited
+                self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+
+def pool_metrics(engine) -> dict:
+    """Return checkout, overflow and wait-time figures for an engine's pool."""
+    pool = engine.pool
+    metrics = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        metrics.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=max(pool.overflow(), 0),
+            max_overflow=pool._max_overflow,
+        )
+    if isinstance(pool, TimedQueuePool):
+        metrics.update(
+            wait_count=pool.wait_count,
+            wait_seconds_total=pool.wait_seconds_total,
+            wait_seconds_max=pool.wait_seconds_max,
+            timeouts=pool.timeouts,
+        )
+    return metrics
+
+
+@event.listens_for(Engine, "begin")
+def _on_begin(connection):
+    connection.info["transaction_started"] = time.perf_counter()
+
+
+def _record_transaction(connection, outcome):
+    started = connection.info.pop("transaction_started", None)
+    if started is not None:
+        record_stage("db_transaction", time.perf_counter() - started, outcome=outcome)
+
+
+@event.listens_for(Engine, "commit")
+def _on_commit(connection):
+    _record_transaction(connection, "commit")
+
+
+@event.listens_for(Engine, "rollback")
+def _on_rollback(connection):
+    _record_transaction(connection, "rollback")
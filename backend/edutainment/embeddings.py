@@ -0,0 +1,129 @@
+import logging
+import os
+import zlib
+from abc import ABC, abstractmethod
+
+import numpy as np
+import openai
+from dotenv import find_dotenv, load_dotenv
+
+from edutainment.chunking import estimate_tokens, terms
+
+logger = logging.getLogger(__name__)
+
+_ = load_dotenv(find_dotenv())
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")
+EMBEDDING_BATCH_SIZE = 256
+
+
+class BaseEmbedder(ABC):
+    """Turns texts into unit-length float32 vectors."""
+
+    name: str
+    dim: int
+
+    @abstractmethod
+    def embed(self, texts: list[str]) -> np.ndarray:
+        """Return a (len(texts), dim) float32 array of L2-normalized embeddings."""
+        pass
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return (vectors / norms).astype(np.float32)
+
+
+class HashingEmbedder(BaseEmbedder):
+    """Deterministic local embedding: signed feature hashing of words.
+
+    Needs no network, so it suits tests and offline runs; retrieval quality is that of
+    keyword overlap.
+    """
+
+    def __init__(self, dim: int = 512) -> None:
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for term in terms(text):
+                h = zlib.crc32(term.encode("utf-8"))
+                vectors[row, h % self.dim] += 1 if h & 0x80000000 else -1
+        return _normalize(vectors)
+
+
+class OpenAIEmbedder(BaseEmbedder):
+    def __init__(self, model: str = "text-embedding-ada-002", dim: int = 1536) -> None:
+        self.model = model
+        self.dim = dim
+        self.name = model
+
+    def embed(self, texts):
+        openai.api_key = os.getenv("OPENAI_API_KEY")
+        vectors = []
+        for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+            response = openai.Embedding.create(
+                model=self.model, input=texts[start : start + EMBEDDING_BATCH_SIZE]
+            )
+            data = sorted(response["data"], key=lambda d: d["index"])
+            vectors.extend(d["embedding"] for d in data)
+        return _normalize(np.array(vectors, dtype=np.float32).reshape(-1, self.dim))
+
+
+def get_embedder() -> BaseEmbedder:
+    """Return the embedder selected by EMBEDDING_BACKEND ("openai" or "hashing")."""
+    if EMBEDDING_BACKEND == "hashing":
+        return HashingEmbedder()
+    return OpenAIEmbedder()
+
+
+class PassageIndex:
+    """Embeddings of an article's passages, searchable by cosine similarity."""
+
+    def __init__(self, passages: list[str], vectors: np.ndarray, embedder: BaseEmbedder) -> None:
+        if len(passages) != len(vectors):
+            raise ValueError(f"{len(passages)} passages but {len(vectors)} embeddings")
+        self.passages = passages
+        self.vectors = vectors
+        self.embedder = embedder
+
+    @classmethod
+    def build(cls, passages: list[str], embedder: BaseEmbedder) -> "PassageIndex":
+        return cls(passages, embedder.embed(passages), embedder)
+
+    @classmethod
+    def from_bytes(cls, passages: list[str], data: bytes, embedder: BaseEmbedder) -> "PassageIndex":
+        vectors = np.frombuffer(data, dtype=np.float32).reshape(-1, embedder.dim)
+        return cls(passages, vectors, embedder)
+
+    def to_bytes(self) -> bytes:
+        return np.ascontiguousarray(self.vectors, dtype=np.float32).tobytes()
+
+    def top_k(self, query: str, k: int) -> np.ndarray:
+        """Return indices of the k passages most similar to query, best first."""
+        k = min(k, len(self.passages))
+        if k <= 0:
+            return np.array([], dtype=int)
+        scores = self.vectors @ self.embedder.embed([query])[0]
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+
+    def select(self, query: str, max_tokens: int) -> list[str]:
+        """Return the passages most relevant to query that fit in max_tokens, in
+        their original order."""
+        passage_tokens = [estimate_tokens(p) for p in self.passages]
+        average_tokens = max(sum(passage_tokens) // max(len(passage_tokens), 1), 1)
+        # Candidates for the budget, with slack for passages that turn out too long
+        candidates = self.top_k(query, 2 * (max_tokens // average_tokens) + 1)
+
+        selected = []
+        used_tokens = 0
+        for i in candidates:
+            if used_tokens + passage_tokens[i] > max_tokens:
+                continue
+            selected.append(i)
+            used_tokens += passage_tokens[i]
+        return [self.passages[i] for i in sorted(selected)]
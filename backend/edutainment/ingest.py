@@ -0,0 +1,201 @@
+import logging
+import os
+import shutil
+import tarfile
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from dotenv import find_dotenv, load_dotenv
+from flask import Flask
+
+from edutainment.courses import is_complete, load_course
+from edutainment.database import db
+from edutainment.lesson_planner import LessonPlan
+from edutainment.models import Article, article_fingerprint
+from edutainment.pdf import PDFLimitError, extract_text, spool_to_file
+from edutainment.tracing import in_current_context, stage
+
+logger = logging.getLogger(__name__)
+
+_ = load_dotenv(find_dotenv())
+
+# Articles processed at once; each also fans out over its topics and narrations,
+# all sharing the process-wide LLM and TTS rate limits
+INGEST_MAX_ARTICLES = int(os.getenv("INGEST_MAX_ARTICLES", "2"))
+INGEST_MAX_ARCHIVE_BYTES = int(os.getenv("INGEST_MAX_ARCHIVE_BYTES", str(2 * 1024**3)))
+# Ingestion jobs are kept apart from course jobs: their own store, so course job
+# lookups never see them, and their own workers, so a long ingest never holds up
+# uploads. Each job already works on INGEST_MAX_ARTICLES articles at once.
+INGEST_JOBS_DB_PATH = os.getenv("INGEST_JOBS_DB_PATH", "ingest_jobs.sqlite3")
+INGEST_JOB_MAX_WORKERS = int(os.getenv("INGEST_JOB_MAX_WORKERS", "1"))
+# Every bulk-ingested article is generated for this customer and session
+INGEST_SESSION_ID = str(uuid.uuid5(uuid.NAMESPACE_URL, "edutainment/bulk-ingest"))
+
+DONE, PARTIAL, SKIPPED, FAILED = "done", "partial", "skipped", "failed"
+
+
+@dataclass
+class PDFSource:
+    name: str
+    path: str = None
+    error: str = None
+
+
+@contextmanager
+def pdf_sources(path: str):
+    """Yield the PDFs in a directory (recursively) or a zip or tar archive, sorted by
+    name. Archive members are copied to temporary files, removed on exit; members over
+    the PDF size limit are yielded with an error instead of a path."""
+    if os.path.isdir(path):
+        sources = [
+            PDFSource(os.path.relpath(os.path.join(root, f), path), os.path.join(root, f))
+            for root, _, files in os.walk(path)
+            for f in files
+            if f.lower().endswith(".pdf")
+        ]
+        yield sorted(sources, key=lambda s: s.name)
+        return
+
+    if zipfile.is_zipfile(path):
+        archive = zipfile.ZipFile(path)
+        members = [(m.filename, m) for m in archive.infolist() if not m.is_dir()]
+        open_member = archive.open
+    elif tarfile.is_tarfile(path):
+        archive = tarfile.open(path)
+        members = [(m.name, m) for m in archive.getmembers() if m.isfile()]
+        open_member = archive.extractfile
+    else:
+        raise ValueError(f"{path} is not a directory, zip or tar archive")
+
+    sources = []
+    try:
+        # Members are copied by content only, so their paths never touch the filesystem
+        for name, member in sorted(members, key=lambda m: m[0]):
+            if not name.lower().endswith(".pdf"):
+                continue
+            try:
+                with open_member(member) as f:
+                    sources.append(PDFSource(name, spool_to_file(f)))
+            except PDFLimitError as e:
+                sources.append(PDFSource(name, error=str(e)))
+        yield sources
+    finally:
+        archive.close()
+        for source in sources:
+            if source.path is not None and os.path.exists(source.path):
+                os.remove(source.path)
+
+
+def _find_complete_course(app: Flask, article_text: str) -> str:
+    """Return the id of the article with this text if its course is complete."""
+    with app.app_context():
+        article_id = db.session.execute(
+            db.select(Article.article_id).where(Article.content_hash == article_fingerprint(article_text))
+        ).scalar_one_or_none()
+        if article_id is not None and is_complete(load_course(article_id)):
+            return article_id
+    return None
+
+
+def ingest_article(app: Flask, source: PDFSource, session_id: str = INGEST_SESSION_ID) -> dict:
+    """Generate and narrate the course for one PDF.
+
+    Articles whose course is already complete are skipped. Anything else resumes from
+    what the tables already hold: LessonPlan reuses stored topics and lessons and
+    narrations are content-addressed, so a rerun only generates what is missing.
+    """
+    started = time.monotonic()
+    result = {"article": source.name, "status": FAILED, "topics": 0, "lessons": 0, "failed_topics": []}
+    try:
+        if source.error:
+            raise PDFLimitError(source.error)
+        with stage("ingest_article"):
+            with open(source.path, "rb") as f:
+                article_text = extract_text(f).strip()
+            if not article_text:
+                raise ValueError("No text could be extracted")
+
+            article_id = _find_complete_course(app, article_text)
+            if article_id is not None:
+                result.update(status=SKIPPED, article_id=article_id)
+                return result
+
+            plan = LessonPlan(session_id, os.path.basename(source.name), article_text, app=app)
+            topics = plan.get_topics()
+            if not topics:
+                raise ValueError("No topics were generated")
+            result.update(article_id=plan.article_id, topics=len(topics))
+            for topic, lessons in plan.iter_lessons(topics):
+                if lessons is None:
+                    result["failed_topics"].append(topic)
+                else:
+                    result["lessons"] += len(lessons)
+            result["status"] = PARTIAL if result["failed_topics"] else DONE
+    except Exception as e:
+        logger.error("Unable to ingest %s: %s", source.name, e)
+        result["error"] = str(e)
+    finally:
+        result["seconds"] = round(time.monotonic() - started, 3)
+    return result
+
+
+def summarize(results: list[dict], seconds: float) -> dict:
+    summary = {status: 0 for status in (DONE, PARTIAL, SKIPPED, FAILED)}
+    for result in results:
+        summary[result["status"]] += 1
+    processed = summary[DONE] + summary[PARTIAL]
+    summary.update(
+        articles=len(results),
+        lessons=sum(r["lessons"] for r in results),
+        seconds=round(seconds, 3),
+        articles_per_hour=round(processed / seconds * 3600, 2) if seconds else None,
+    )
+    return summary
+
+
+def ingest(app: Flask, path: str, max_articles: int = INGEST_MAX_ARTICLES, on_result=None) -> dict:
+    """Ingest every PDF in a directory or archive, max_articles at a time.
+
+    on_result(result, report) is called after each article, with the report so far.
+
+    Returns:
+    --------
+    dict
+        {"summary": {...counts by status, throughput...}, "articles": [...per-article results]}
+    """
+    started = time.monotonic()
+    results = []
+    with pdf_sources(path) as sources:
+        logger.info("Ingesting %d PDFs from %s", len(sources), path)
+        with ThreadPoolExecutor(max_workers=max_articles, thread_name_prefix="ingest") as executor:
+            futures = [executor.submit(in_current_context(ingest_article), app, source) for source in sources]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                report = {"summary": summarize(results, time.monotonic() - started), "articles": list(results)}
+                logger.info("Ingested %s: %s in %ss", result["article"], result["status"], result["seconds"])
+                if on_result is not None:
+                    on_result(result, report)
+    results.sort(key=lambda r: r["article"])
+    return {"summary": summarize(results, time.monotonic() - started), "articles": results}
+
+
+def run_ingest_job(progress, app: Flask, path: str, remove_after: bool = False) -> dict:
+    """JobQueue entry point: ingest path, reporting the summary as progress."""
+    try:
+        return ingest(app, path, on_result=lambda result, report: progress(**report))
+    finally:
+        if remove_after:
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.exists(path):
+                os.remove(path)
+
+
+def spool_archive(archive_file) -> str:
+    """Copy an uploaded archive to a temporary file and return its path."""
+    return spool_to_file(archive_file, INGEST_MAX_ARCHIVE_BYTES)
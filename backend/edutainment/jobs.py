@@ -0,0 +1,228 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import find_dotenv, load_dotenv
+
+logger = logging.getLogger(__name__)
+
+_ = load_dotenv(find_dotenv())
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "jobs.sqlite3")
+JOB_MAX_WORKERS = int(os.getenv("JOB_MAX_WORKERS", "2"))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", str(24 * 3600)))
+# Unfinished jobs are touched this often by the process holding them; one not touched
+# for JOB_STALE_SECONDS belongs to a process that exited, and is marked failed
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "30"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", str(5 * JOB_HEARTBEAT_SECONDS)))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED_STATUSES = (SUCCEEDED, FAILED)
+UNFINISHED_STATUSES = (QUEUED, RUNNING)
+
+
+def _placeholders(values) -> str:
+    return ", ".join("?" * len(values))
+
+
+class JobStore:
+    """Job state in SQLite, so any worker process on the host can report on a job
+    no matter which process runs it."""
+
+    def __init__(self, path: str = JOBS_DB_PATH) -> None:
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, status TEXT NOT NULL, progress TEXT NOT NULL, "
+                "result TEXT, error TEXT, created_at REAL NOT NULL, "
+                "updated_at REAL NOT NULL, version INTEGER NOT NULL)"
+            )
+
+    def create(self, job_id: str) -> None:
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO jobs (job_id, status, progress, created_at, updated_at, version) "
+                "VALUES (?, ?, '{}', ?, ?, 0)",
+                (job_id, QUEUED, now, now),
+            )
+
+    def update(self, job_id: str, status: str = None, progress: dict = None, result=None, error: str = None) -> None:
+        """Update a job; progress is merged into the stored progress."""
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT status, progress, result, error FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return
+            merged_progress = json.loads(row[1])
+            merged_progress.update(progress or {})
+            self._connection.execute(
+                "UPDATE jobs SET status = ?, progress = ?, result = ?, error = ?, "
+                "updated_at = ?, version = version + 1 WHERE job_id = ?",
+                (
+                    status or row[0],
+                    json.dumps(merged_progress, default=str),
+                    json.dumps(result, default=str) if result is not None else row[2],
+                    error if error is not None else row[3],
+                    time.time(),
+                    job_id,
+                ),
+            )
+
+    def get(self, job_id: str) -> dict:
+        """Return a snapshot of the job, or None if it does not exist."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT job_id, status, progress, result, error, created_at, updated_at, version "
+                "FROM jobs WHERE job_id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row[0],
+            "status": row[1],
+            "progress": json.loads(row[2]),
+            "result": json.loads(row[3]) if row[3] is not None else None,
+            "error": row[4],
+            "created_at": row[5],
+            "updated_at": row[6],
+            "version": row[7],
+        }
+
+    def touch(self, job_ids) -> None:
+        """Record that the given jobs are still held by a live process."""
+        job_ids = list(job_ids)
+        if not job_ids:
+            return
+        with self._lock, self._connection:
+            self._connection.execute(
+                f"UPDATE jobs SET updated_at = ? WHERE job_id IN ({_placeholders(job_ids)})",
+                (time.time(), *job_ids),
+            )
+
+    def prune(self, older_than: float) -> None:
+        """Delete finished jobs last updated before the older_than timestamp."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                f"DELETE FROM jobs WHERE updated_at < ? AND status IN ({_placeholders(FINISHED_STATUSES)})",
+                (older_than, *FINISHED_STATUSES),
+            )
+
+    def fail_stale(self, older_than: float) -> int:
+        """Mark queued and running jobs last updated before the older_than timestamp
+        as failed: the process that held them is gone. Returns how many were marked."""
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ?, version = version + 1 "
+                f"WHERE updated_at < ? AND status IN ({_placeholders(UNFINISHED_STATUSES)})",
+                (
+                    FAILED,
+                    "Interrupted: the worker running this job stopped",
+                    time.time(),
+                    older_than,
+                    *UNFINISHED_STATUSES,
+                ),
+            )
+        return cursor.rowcount
+
+
+class JobQueue:
+    """Runs jobs on a bounded thread pool and tracks their state in a JobStore.
+
+    A job function is called as fn(progress, *args, **kwargs), where
+    progress(**fields) merges fields into the job's reported progress. Its return
+    value becomes the job result.
+
+    Jobs live only in the process that queued them. While they are unfinished a
+    heartbeat keeps them fresh in the store, and jobs left behind by a process that
+    exited are marked failed when a queue starts.
+    """
+
+    def __init__(
+        self,
+        store: JobStore = None,
+        max_workers: int = JOB_MAX_WORKERS,
+        heartbeat_seconds: float = JOB_HEARTBEAT_SECONDS,
+        stale_seconds: float = JOB_STALE_SECONDS,
+        name: str = "jobs",
+    ) -> None:
+        self.store = store or JobStore()
+        self.heartbeat_seconds = heartbeat_seconds
+        self.name = name
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._active = set()
+        self._lock = threading.Lock()
+        self._heartbeat = None
+        stale = self.store.fail_stale(time.time() - stale_seconds)
+        if stale:
+            logger.warning("Marked %d jobs abandoned by an exited worker as failed", stale)
+
+    def submit(self, fn, *args, **kwargs) -> str:
+        """Queue fn and return the new job's id."""
+        self.store.prune(time.time() - JOB_RETENTION_SECONDS)
+        job_id = str(uuid.uuid4())
+        self.store.create(job_id)
+        with self._lock:
+            self._active.add(job_id)
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._beat, name=f"{self.name}-heartbeat", daemon=True)
+                self._heartbeat.start()
+        self._executor.submit(self._run, job_id, fn, *args, **kwargs)
+        return job_id
+
+    def get(self, job_id: str) -> dict:
+        return self.store.get(job_id)
+
+    def iter_updates(self, job_id: str, poll_interval: float = 0.5):
+        """Yield a snapshot of the job every time it changes, until it finishes."""
+        version = None
+        while True:
+            job = self.store.get(job_id)
+            if job is None:
+                return
+            if job["version"] != version:
+                version = job["version"]
+                yield job
+            if job["status"] in FINISHED_STATUSES:
+                return
+            time.sleep(poll_interval)
+
+    def _run(self, job_id, fn, *args, **kwargs):
+        self.store.update(job_id, status=RUNNING)
+
+        def progress(**fields):
+            self.store.update(job_id, progress=fields)
+
+        try:
+            result = fn(progress, *args, **kwargs)
+        except Exception as e:
+            logger.exception("Job %s failed", job_id)
+            self.store.update(job_id, status=FAILED, error=str(e))
+        else:
+            self.store.update(job_id, status=SUCCEEDED, result=result)
+        finally:
+            with self._lock:
+                self._active.discard(job_id)
+
+    def _beat(self):
+        while True:
+            time.sleep(self.heartbeat_seconds)
+            with self._lock:
+                job_ids = list(self._active)
+            try:
+                self.store.touch(job_ids)
+            except sqlite3.Error:
+                logger.exception("Unable to record the job heartbeat")
@@ -0,0 +1,71 @@
+import json
+from typing import Iterable, Iterator
+
+
+class JSONArrayItemParser:
+    """Incrementally extracts the items of one array from a JSON document.
+
+    Feed the document in arbitrary pieces; each object in the array stored under `key`
+    (at the top level of the document) is returned as soon as its closing brace
+    arrives, without waiting for the rest of the document.
+    """
+
+    def __init__(self, key: str) -> None:
+        self.key = key
+        self.buffer = []
+        self.position = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.string_start = None
+        self.last_string = None
+        self.array_depth = None
+        self.item_start = None
+        self.done = False
+
+    def feed(self, text: str) -> list[dict]:
+        """Consume more of the document and return the items it completes."""
+        items = []
+        for char in text:
+            self.buffer.append(char)
+            i = self.position
+            self.position += 1
+
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                    if self.depth == 1 and self.item_start is None:
+                        self.last_string = "".join(self.buffer[self.string_start + 1 : i])
+                continue
+
+            if char == '"':
+                self.in_string = True
+                self.string_start = i
+            elif char in "{[":
+                self.depth += 1
+                if char == "[" and self.depth == 2 and self.last_string == self.key:
+                    self.array_depth = self.depth
+                elif char == "{" and self.array_depth and self.depth == self.array_depth + 1:
+                    self.item_start = i
+            elif char in "}]":
+                if char == "}" and self.item_start is not None and self.depth == self.array_depth + 1:
+                    items.append(json.loads("".join(self.buffer[self.item_start : i + 1])))
+                    self.item_start = None
+                elif char == "]" and self.depth == self.array_depth:
+                    self.array_depth = None
+                    self.done = True
+                self.depth -= 1
+            elif char == "," and self.depth == 1:
+                self.last_string = None
+        return items
+
+
+def iter_array_items(chunks: Iterable[str], key: str) -> Iterator[dict]:
+    """Yield the objects of the top-level array under key as chunks arrive."""
+    parser = JSONArrayItemParser(key)
+    for chunk in chunks:
+        yield from parser.feed(chunk)
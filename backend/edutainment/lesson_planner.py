@@ -1,216 +1,563 @@
 import datetime
+import functools
+import json
 import logging
 import os
+import time
 import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 import sqlalchemy
+from sqlalchemy.dialects import postgresql, sqlite
 from dotenv import find_dotenv, load_dotenv
-from flask import Flask
+from flask import Flask, current_app
 
-from edutainment.models import Customer, CustomerSession, Article, ArticleTopic, CustomerArticleTopic, Lesson, LessonCompletion
+from edutainment.models import Customer, CustomerSession, Article, ArticleTopic, CustomerArticleTopic, Lesson, LessonCompletion, article_fingerprint
 
-from edutainment.narration import get_narration
-from edutainment.text import GPTLessonText
-from server import app, db
+from edutainment.audio import AUDIO_POSTPROCESS, submit_topic_track, topic_track_files
+from edutainment.courses import invalidate_course
+from edutainment.embeddings import PassageIndex, get_embedder
+from edutainment.narration import NarrationPipeline
+from edutainment.narration_cache import get_cache
+from edutainment.routing import get_lesson_text
+from edutainment.text import LESSON_BATCH_TOPICS
+from edutainment.tracing import in_current_context, stage
+from edutainment.database import db
 
 logger = logging.getLogger(__name__)
 
-with app.app_context():
-    metadata = db.MetaData()
-    metadata.reflect(bind=db.engine)
-    
-    article_topics = db.Table("article_topics", metadata)
-    articles = db.Table("articles", metadata)
-    lesson_completions = db.Table("lesson_completions", metadata)
-    lessons = db.Table("lessons", metadata)
-    user_article_topics = db.Table("user_article_topics", metadata)
-    user_sessions = db.Table("user_sessions", metadata)
-    users = db.Table("users", metadata)
-
-    def get_or_create(session, model, **kwargs):
-        # Exclude primary key fields from the filter_by method
-        filter_args = {k: v for k, v in kwargs.items() if not k.endswith('_id')}
-        
-        instance = session.query(model).filter_by(**filter_args).first()
-        if instance:
-            return instance
-        else:
-            instance = model(**kwargs)
-            session.add(instance)
+
+def get_or_create(session, model, defaults=None, **kwargs):
+    """Return the row matching all of kwargs, creating it (with defaults) if missing."""
+    instance = session.query(model).filter_by(**kwargs).first()
+    if instance:
+        return instance
+    else:
+        # defaults are only used when creating, never to look the row up
+        instance = model(**kwargs, **(defaults or {}))
+        try:
+            # A savepoint, so losing a race to a concurrent insert only undoes this
+            # row and leaves the caller's transaction usable
+            with session.begin_nested():
+                session.add(instance)
+        except sqlalchemy.exc.IntegrityError:
+            # Re-query the database to get the existing instance
+            instance = session.query(model).filter_by(**kwargs).first()
+            if instance is None:
+                # If instance is still None, raise the original IntegrityError
+                raise
+        return instance
+
+
+def bulk_upsert(session, model, rows, index_elements, update_columns=None):
+    """Insert rows with a single INSERT ... ON CONFLICT statement and return them.
+
+    index_elements must match a unique constraint of the model. Rows that already
+    exist keep their values, except for update_columns which are overwritten, and
+    are returned together with the new rows, so no SELECT is needed afterwards.
+    """
+    # Postgres refuses to touch the same row twice in one statement
+    rows = list({tuple(r[k] for k in index_elements): r for r in rows}.values())
+    if not rows:
+        return []
+
+    dialect = session.get_bind().dialect.name
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    stmt = insert(model).values(rows)
+    # A no-op update still makes RETURNING include the conflicting rows
+    set_columns = update_columns or index_elements[-1:]
+    stmt = stmt.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={c: stmt.excluded[c] for c in set_columns},
+    )
+    return session.scalars(
+        stmt.returning(model), execution_options={"populate_existing": True}
+    ).all()
+
+
+def forget_audio(app: Flask, paths: list[str]) -> None:
+    """Clear references to audio files evicted from the narration cache, so their
+    lessons and topic tracks are made again the next time the topic is requested."""
+    with app.app_context():
+        try:
+            with db.session.begin():
+                article_ids = set(
+                    db.session.scalars(
+                        db.select(ArticleTopic.article_id)
+                        .join(Lesson)
+                        .where(Lesson.narration_file.in_(paths))
+                    )
+                ) | set(
+                    db.session.scalars(
+                        db.select(ArticleTopic.article_id).where(ArticleTopic.narration_track.in_(paths))
+                    )
+                )
+                db.session.execute(
+                    db.update(Lesson).where(Lesson.narration_file.in_(paths)).values(narration_file=None)
+                )
+                db.session.execute(
+                    db.update(ArticleTopic)
+                    .where(ArticleTopic.narration_track.in_(paths))
+                    .values(narration_track=None, narration_chapters=None)
+                )
+            for article_id in article_ids:
+                invalidate_course(article_id)
+        except Exception as e:
+            logging.error(f"Unable to clear references to evicted audio: {e}")
+            db.session.rollback()
+
+
+def bulk_insert_new(session, model, rows, index_elements):
+    """Insert rows with a single INSERT ... ON CONFLICT DO NOTHING statement and
+    return only the rows this statement inserted, never ones already stored."""
+    if not rows:
+        return []
+    dialect = session.get_bind().dialect.name
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    stmt = insert(model).values(rows).on_conflict_do_nothing(index_elements=index_elements)
+    return session.scalars(stmt.returning(model)).all()
+
+
+class _LostWriteRace(Exception):
+    """Another request stored the rows first."""
+
+
+@functools.cache
+def _column_keys(model):
+    return tuple(c.key for c in sqlalchemy.inspect(model).column_attrs)
+
+
+def to_dict(obj):
+    return {key: getattr(obj, key) for key in _column_keys(type(obj))}
+
+
+class LessonPlan:
+    """Represents an entire LessonPlan, including text, audio, and video
+
+    TODO: allow article search by session? Article ID?
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        article_filename: str,  # TODO: handle missing article
+        article_text: str,  # TODO: handle missing article
+        age: int = None,
+        debug: bool = False,
+        app: Flask = None,
+    ) -> None:
+        # Kept so worker threads can open their own app contexts
+        self.app = app or current_app._get_current_object()
+        # Futures of batch generations running ahead of get_lessons, by topic
+        self._pregenerated = {}
+        with self.app.app_context(), stage("plan_setup"):
             try:
-                session.flush()
-            except sqlalchemy.exc.IntegrityError:
-                session.rollback()
-                # Re-query the database to get the existing instance
-                instance = session.query(model).filter_by(**filter_args).first()
-                if instance is None:
-                    # If instance is still None, raise the original IntegrityError
-                    raise
-            return instance
-
-
-    def to_dict(obj):
-        return {
-            c.key: getattr(obj, c.key) for c in sqlalchemy.inspect(obj).mapper.column_attrs
-        }
+                with db.session.begin():
+                    self.debug = debug
+                    self.customer = get_or_create(
+                        db.session,
+                        Customer,
+                        customer_id=session_id,
+                        defaults={"debug": self.debug},
+                    )
+                    self.customer.year_of_birth = datetime.date.today().year - age if age else None
 
+                    self.customer_session = get_or_create(
+                        db.session,
+                        CustomerSession,
+                        customer_session_id=session_id,
+                        defaults={"customer_id": self.customer.customer_id, "debug": self.debug},
+                    )
 
-    class LessonPlan:
-        """Represents an entire LessonPlan, including text, audio, and video
+                    # Look the article up by its indexed fingerprint, not its full text
+                    self.article = get_or_create(
+                        db.session,
+                        Article,
+                        content_hash=article_fingerprint(article_text),
+                        defaults={
+                            "filename": article_filename,
+                            "content": article_text,
+                            "debug": self.debug,
+                        },
+                    )
+                    self.text_generator = get_lesson_text(article_text)
+                    db.session.flush()
+                    # Plain ids outlive the session, so worker threads can use them
+                    # without touching the (detached) ORM instances.
+                    self.customer_id = self.customer.customer_id
+                    self.article_id = self.article.article_id
+                    logging.info("Attempting to commit to the database.")
+                # Leaving the begin() block committed; nothing may autobegin a new
+                # transaction here, or _get_passage_index cannot begin its own
+                logging.info("Commit successful.")
 
-        TODO: allow article search by session? Article ID?
-        TODO: asynchronous processing?
-        """
+                passages = self.text_generator.get_passages()
+                if passages:
+                    with stage("passage_index"):
+                        self.text_generator.passage_index = self._get_passage_index(passages)
+            except Exception as e:
+                logging.error(f"Database commit failed in __init__: {e}")
+                db.session.rollback()
 
-        def __init__(
-            self,
-            session_id: str,
-            article_filename: str,  # TODO: handle missing article
-            article_text: str,  # TODO: handle missing article
-            age: int = None,
-            debug: bool = False,
-        ) -> None:
-            with app.app_context():
-                try:
-                    with db.session.begin():
-                        self.debug = debug
-                        self.customer = get_or_create(
-                            db.session,
-                            Customer,
-                            customer_id=session_id,
-                            debug=self.debug,
-                        )
-                        self.customer.year_of_birth = datetime.date.today().year - age if age else None
-
-                        self.customer_session = get_or_create(
-                            db.session,
-                            CustomerSession,
-                            customer_session_id=session_id,
-                            customer_id=self.customer.customer_id,
-                            debug=self.debug,
-                        )
 
-                        self.article = get_or_create(
-                            db.session,
-                            Article,
-                            filename=article_filename,
-                            content=article_text,
-                            debug=self.debug,
-                        )
-                        self.text_generator = GPTLessonText(article_text)
-                        logging.info("Attempting to commit to the database.")
-                    db.session.commit()
-                    saved_customer = db.session.query(Customer).get(self.customer.customer_id)
-                    if not saved_customer:
-                        logging.error("Customer not saved in __init__")
-                    logging.info("Commit successful.")
-                except Exception as e:
-                    logging.error(f"Database commit failed in __init__: {e}")
-                    db.session.rollback()
-
-
-        def get_topics(self):
-            """Return list of topics"""
-            with app.app_context():
+    def _get_passage_index(self, passages):
+        """Load the article's passage embeddings, embedding and storing them the first
+        time the article is seen. Returns None if embedding fails."""
+        embedder = get_embedder()
+        try:
+            with db.session.begin():
+                article = db.session.get(Article, self.article_id)
+                stored, embedding_model = article.passage_embeddings, article.embedding_model
+            if stored is not None and embedding_model == embedder.name:
                 try:
-                    with db.session.begin():
-                        self.article = db.session.merge(self.article)
-                        self.topics = self.text_generator.get_topics()
-                        for t in self.topics:
-                            _ = get_or_create(
-                                db.session,
-                                ArticleTopic,
-                                article_id=self.article.article_id,
-                                topic_name=t,
-                                debug=self.debug,
-                            )
-                        db.session.commit()
-                        return self.topics
-                except Exception as e:
-                    logging.error(f"Database commit failed in get_topics: {e}")
-                    db.session.rollback()
-
-        def get_lessons(self, topic_name: str, topic_expertise: str = "intermediate"):
-            with app.app_context():
-                try:
-                    with db.session.begin():
-                        # Fetch the topic
-                        topic = db.session.query(ArticleTopic).filter_by(topic_name=topic_name).first()
-
-                        # Create the topic if it does not exist
-                        if not topic:
-                            topic = get_or_create(
-                                db.session,
-                                ArticleTopic,
-                                article_id=self.article.article_id,
-                                topic_name=topic_name,
-                                debug=self.debug,
-                            )
-
-                        # Fetch or create the CustomerArticleTopic entry
-                        customer_artice_topic = get_or_create(
-                            db.session,
-                            CustomerArticleTopic,
-                            article_topic_id=topic.article_topic_id,
-                            customer_id=self.customer.customer_id,
-                            topic_expertise=topic_expertise,
-                            debug=self.debug,
-                        )
+                    return PassageIndex.from_bytes(passages, stored, embedder)
+                except ValueError as e:
+                    logging.info(f"Rebuilding passage index: {e}")
+
+            index = PassageIndex.build(passages, embedder)
+            with db.session.begin():
+                db.session.query(Article).filter_by(article_id=self.article_id).update(
+                    {"passage_embeddings": index.to_bytes(), "embedding_model": embedder.name}
+                )
+            return index
+        except Exception as e:
+            logging.error(f"Unable to build passage index: {e}")
+            db.session.rollback()
+            return None
+
+    def get_topics(self):
+        """Return list of topics
+
+        The LLM is called between transactions, so no pooled connection is held
+        while waiting for it.
+        """
+        with self.app.app_context():
+            try:
+                # A re-uploaded article reuses its topics (and their lessons)
+                with db.session.begin():
+                    existing_topics = (
+                        db.session.query(ArticleTopic.topic_name)
+                        .filter_by(article_id=self.article_id)
+                        .all()
+                    )
+                if existing_topics:
+                    self.topics = [t.topic_name for t in existing_topics]
+                    return self.topics
+
+                with stage("llm_topics") as span:
+                    self.topics = self.text_generator.get_topics()
+                    span.set(topics=len(self.topics))
+
+                with db.session.begin():
+                    bulk_upsert(
+                        db.session,
+                        ArticleTopic,
+                        [
+                            {"article_id": self.article_id, "topic_name": t, "debug": self.debug}
+                            for t in self.topics
+                        ],
+                        index_elements=["article_id", "topic_name"],
+                    )
+                invalidate_course(self.article_id)
+                return self.topics
+            except Exception as e:
+                logging.error(f"Database commit failed in get_topics: {e}")
+                db.session.rollback()
+
+    def get_lessons(self, topic_name: str, topic_expertise: str = "intermediate"):
+        """Return the lessons for a topic as dicts, generating them if needed.
+
+        Lesson generation and narration both run between transactions, so no pooled
+        connection is held while waiting for the LLM or TTS APIs.
+        """
+        with self.app.app_context(), stage("get_lessons", topic=topic_name):
+            try:
+                with db.session.begin():
+                    # Fetch the topic, creating it if it does not exist
+                    (topic,) = bulk_upsert(
+                        db.session,
+                        ArticleTopic,
+                        [{"article_id": self.article_id, "topic_name": topic_name, "debug": self.debug}],
+                        index_elements=["article_id", "topic_name"],
+                    )
+
+                    # Fetch or create the CustomerArticleTopic entry
+                    customer_artice_topic = get_or_create(
+                        db.session,
+                        CustomerArticleTopic,
+                        article_topic_id=topic.article_topic_id,
+                        customer_id=self.customer_id,
+                        topic_expertise=topic_expertise,
+                        defaults={"debug": self.debug},
+                    )
+
+                    article_topic_id = topic.article_topic_id
+                    # Stored audio may have been evicted from the narration cache since
+                    has_topic_track = topic.narration_track is not None and os.path.exists(topic.narration_track)
+
+                    lessons_dict = self._load_lessons(article_topic_id)
+
+                # If no lessons are found in the database, generate them using the text_generator
+                if not lessons_dict:
+                    # Each lesson's narration starts as soon as the lesson is streamed
+                    with NarrationPipeline() as narrations:
+                        generated_lessons = []
+                        batch = self._pregenerated.pop(topic_name, None)
+                        with stage("llm_lessons", topic=topic_name) as span:
+                            pregenerated = batch.result().get(topic_name) if batch is not None else None
+                            if pregenerated is None:
+                                pregenerated = self.text_generator.stream_lessons(topic_name)
+                            for l in pregenerated:
+                                generated_lessons.append(l)
+                                narrations.submit(l["lesson"])
+                            span.set(lessons=len(generated_lessons))
+
+                        lessons_dict = self._insert_lessons(article_topic_id, generated_lessons)
+                        if lessons_dict:
+                            # Narrate outside the transaction, saving each file as it completes
+                            with stage("narration_wait"):
+                                self._save_narrations(lessons_dict, narrations)
+                    if lessons_dict:
+                        invalidate_course(self.article_id)
+                        self._postprocess_audio(article_topic_id, lessons_dict)
+                        return lessons_dict
+                    # Another request stored this topic first; use its lessons
+                    lessons_dict = self._load_lessons(article_topic_id)
+
+                missing_narrations = [
+                    l for l in lessons_dict if not l["narration_file"] or not os.path.exists(l["narration_file"])
+                ]
+                if missing_narrations:
+                    self._narrate_lessons(missing_narrations)
+                    invalidate_course(self.article_id)
+                if not has_topic_track:
+                    self._postprocess_audio(article_topic_id, lessons_dict)
+                return lessons_dict
+            except Exception as e:
+                logging.error(f"Database commit failed in get_lessons: {e}")
+                db.session.rollback()
+
+    def _lesson_dict(self, lesson):
+        # Lessons carry their article so clients can reload the course from /courses
+        return {**to_dict(lesson), "article_id": self.article_id}
+
+    def _load_lessons(self, article_topic_id):
+        return [
+            self._lesson_dict(lesson)
+            for lesson in db.session.query(Lesson)
+            .filter_by(article_topic_id=article_topic_id)
+            .order_by(Lesson.order_num)
+        ]
+
+    def _insert_lessons(self, article_topic_id, generated_lessons):
+        """Store a topic's generated lessons, all or nothing, and return them as dicts.
+
+        Returns an empty list if another request stored lessons for the topic first:
+        the topic then keeps those, so it never mixes two generations.
+        """
+        rows = [
+            {
+                "article_topic_id": article_topic_id,
+                "lesson_content": l["lesson"],
+                "question": l["question"],
+                "right_answer": l["right_answer"],
+                "wrong_answer": l["wrong_answer"],
+                "right_answer_explanation": l["right_answer_explanation"],
+                "order_num": i,
+                "debug": self.debug,
+            }
+            for i, l in enumerate(generated_lessons)
+        ]
+        try:
+            with db.session.begin():
+                lessons = bulk_insert_new(db.session, Lesson, rows, ["article_topic_id", "order_num"])
+                if len(lessons) != len(rows):
+                    raise _LostWriteRace()
+                lessons.sort(key=lambda lesson: lesson.order_num)
+                return [self._lesson_dict(lesson) for lesson in lessons]
+        except _LostWriteRace:
+            logging.info(f"Lessons for topic {article_topic_id} were stored by another request")
+            return []
+
+    def _narrate_lessons(self, lessons_dict):
+        """Synthesize narrations concurrently and record each on its Lesson row."""
+        with NarrationPipeline() as narrations:
+            for l in lessons_dict:
+                narrations.submit(l["lesson_content"])
+            self._save_narrations(lessons_dict, narrations)
+
+    def _save_narrations(self, lessons_dict, narrations):
+        """Record each narration on its Lesson row as soon as it is saved.
+
+        lessons_dict must be in the order the texts were submitted to narrations.
+        """
+        for i, narration_file_name in narrations.as_completed():
+            lessons_dict[i]["narration_file"] = narration_file_name
+            try:
+                db.session.query(Lesson).filter_by(
+                    lesson_id=lessons_dict[i]["lesson_id"]
+                ).update({"narration_file": narration_file_name})
+                db.session.commit()
+            except Exception as e:
+                logging.error(f"Unable to save narration {narration_file_name}: {e}")
+                db.session.rollback()
 
-                        # Query for existing lessons in the database
-                        lessons = (
-                            db.session.query(Lesson)
-                            .filter_by(article_topic_id=topic.article_topic_id)
-                            .all()
+    def _postprocess_audio(self, article_topic_id, lessons_dict):
+        """Build the topic's single narration track on the audio process pool, if
+        enabled and every lesson is narrated. Returns without waiting for it."""
+        if not AUDIO_POSTPROCESS or not lessons_dict:
+            return
+        if not all(l["narration_file"] for l in lessons_dict):
+            return
+        future = submit_topic_track([l["narration_file"] for l in lessons_dict])
+        future.add_done_callback(functools.partial(self._save_topic_track, article_topic_id))
+
+    def _save_topic_track(self, article_topic_id, future):
+        with self.app.app_context():
+            try:
+                track = future.result()
+                for path in topic_track_files(track["narration_track"]):
+                    get_cache().add(path)
+                with db.session.begin():
+                    db.session.query(ArticleTopic).filter_by(
+                        article_topic_id=article_topic_id
+                    ).update(
+                        {
+                            "narration_track": track["narration_track"],
+                            "narration_chapters": json.dumps(track["chapters"]),
+                        }
+                    )
+                invalidate_course(self.article_id)
+            except Exception as e:
+                logging.error(f"Unable to build narration track for topic {article_topic_id}: {e}")
+                db.session.rollback()
+
+    def _pregenerate_lessons(self, topics):
+        """Write the lessons of every topic that has none yet with as few completions
+        as possible. Topics left out are generated per topic by get_lessons."""
+        with self.app.app_context():
+            try:
+                with db.session.begin():
+                    generated = {
+                        name
+                        for (name,) in db.session.query(ArticleTopic.topic_name)
+                        .join(Lesson, Lesson.article_topic_id == ArticleTopic.article_topic_id)
+                        .filter(ArticleTopic.article_id == self.article_id)
+                        .distinct()
+                    }
+            except Exception as e:
+                logging.error(f"Unable to look up generated topics: {e}")
+                db.session.rollback()
+                return
+
+        missing = [t for t in topics if t not in generated]
+        if not missing:
+            return
+        # Every batch is written at once, and each topic waits only for its own batch
+        batches = [missing[i : i + LESSON_BATCH_TOPICS] for i in range(0, len(missing), LESSON_BATCH_TOPICS)]
+        executor = ThreadPoolExecutor(max_workers=len(batches), thread_name_prefix="lesson-batches")
+        for batch in batches:
+            future = executor.submit(in_current_context(self._generate_lesson_batch), batch)
+            for topic_name in batch:
+                self._pregenerated[topic_name] = future
+        executor.shutdown(wait=False)
+
+    def _generate_lesson_batch(self, topics):
+        try:
+            with stage("llm_lessons_batch", topics=len(topics)):
+                return self.text_generator.get_lessons_batch(topics)
+        except Exception as e:
+            logging.error(f"Batch lesson generation failed, generating per topic: {e}")
+            return {}
+
+    def _timed_get_lessons(self, started, topic_name, topic_expertise):
+        started[topic_name] = time.monotonic()
+        return self.get_lessons(topic_name, topic_expertise)
+
+    def iter_lessons(
+        self,
+        topics,
+        topic_expertise: str = "intermediate",
+        max_workers: int = None,
+        timeout: float = None,
+    ):
+        """Generate lessons for several topics concurrently.
+
+        Yields (topic, lessons) tuples in completion order. Each topic runs
+        `get_lessons` in its own thread, app context and transaction, so one
+        topic failing never rolls back another. Topics that fail, or that run
+        longer than `timeout` seconds, yield None for their lessons.
+
+        In the "batch" LESSON_GENERATION_MODE, the lessons of all new topics are
+        written in as few completions as possible, all started up front; each
+        per-topic thread stores and narrates its topic as soon as its batch returns.
+        """
+        max_workers = max_workers or self.app.config["COURSE_GENERATION_MAX_WORKERS"]
+        timeout = timeout or self.app.config["TOPIC_TIMEOUT_SECONDS"]
+        topics = list(dict.fromkeys(topics))
+        if self.app.config.get("LESSON_GENERATION_MODE") == "batch":
+            self._pregenerate_lessons(topics)
+
+        started = {}
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="lessons")
+        pending = {
+            executor.submit(in_current_context(self._timed_get_lessons), started, t, topic_expertise): t
+            for t in topics
+        }
+        try:
+            while pending:
+                now = time.monotonic()
+                remaining = [
+                    timeout - (now - started[t]) for t in pending.values() if t in started
+                ]
+                done, _ = wait(
+                    pending,
+                    timeout=max(min(remaining), 0) if remaining else timeout,
+                    return_when=FIRST_COMPLETED,
+                )
+                for future in done:
+                    topic_name = pending.pop(future)
+                    try:
+                        yield topic_name, future.result()
+                    except Exception as e:
+                        logging.error(f"Lesson generation failed for topic {topic_name}: {e}")
+                        yield topic_name, None
+
+                now = time.monotonic()
+                for future, topic_name in list(pending.items()):
+                    if topic_name in started and now - started[topic_name] >= timeout:
+                        del pending[future]
+                        logging.error(
+                            f"Lesson generation for topic {topic_name} timed out after {timeout}s"
                         )
+                        yield topic_name, None
+        finally:
+            # Timed-out workers finish in the background; queued ones are dropped.
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+class LessonProgress:
+    """Records one learner's answer to a lesson as a LessonCompletion.
+
+    Writes go through the app's CompletionBuffer, so they land in a batch within
+    PROGRESS_FLUSH_SECONDS rather than committing one row per answer.
+    """
+
+    def __init__(self, lesson_id, customer_session_id, debug: bool = False, app: Flask = None):
+        self.lesson_id = lesson_id
+        self.customer_session_id = customer_session_id
+        self.debug = debug
+        self.app = app or current_app._get_current_object()
 
-                        # If no lessons are found in the database, generate them using the text_generator
-                        if not lessons:
-                            generated_lessons = self.text_generator.get_lessons(topic_name)
-                            for i, l in enumerate(generated_lessons):
-                                try:
-                                    narration_file_name = get_narration(l["lesson"], topic.article_topic_id)
-                                    print(narration_file_name)
-                                except Exception as e:
-                                    logging.error(f"Unable to get narration: {e}")
-                                lesson = get_or_create(
-                                    db.session,
-                                    Lesson,
-                                    article_topic_id=topic.article_topic_id,
-                                    lesson_content=l["lesson"],
-                                    question=l["question"],
-                                    right_answer=l["right_answer"],
-                                    wrong_answer=l["wrong_answer"],
-                                    narration_file=narration_file_name if narration_file_name else None,
-                                    right_answer_explanation=l["right_answer_explanation"],
-                                    order_num=i,
-                                    debug=self.debug,
-                                )
-                                lessons.append(lesson)
-
-                        # Convert the lessons to dictionary format
-                        lessons_dict = [to_dict(lesson) for lesson in lessons]
-
-                        # Commit the session
-                        db.session.commit()
-                        return lessons_dict  
-                except Exception as e:
-                    logging.error(f"Database commit failed in get_lessons: {e}")
-                    db.session.rollback()
-
-
-
-    class LessonProgress:
-        def __init__(self, lesson_id, customer_session_id):
-            self.lesson_progress = get_or_create(
-                db.session,
-                LessonProgress,
-                lesson_id=lesson_id,
-                customer_session_id=customer_session_id,
-                debug=self.debug,
-            )
-
-        def update_progress(self, lesson_complete: bool, answer_correct: bool):
-            self.lesson_progress.lesson_complete = lesson_complete
-            self.lesson_progress.answer_correct = answer_correct
-            db.session.commit()
+    def update_progress(self, lesson_complete: bool, answer_correct: bool):
+        self.app.extensions["lesson_progress"].add(
+            [
+                {
+                    "customer_session_id": self.customer_session_id,
+                    "lesson_id": self.lesson_id,
+                    "lesson_complete": lesson_complete,
+                    "answer_correct": answer_correct,
+                    "debug": self.debug,
+                }
+            ]
+        )
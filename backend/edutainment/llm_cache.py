@@ -0,0 +1,236 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from dotenv import find_dotenv, load_dotenv
+
+logger = logging.getLogger(__name__)
+
+_ = load_dotenv(find_dotenv())
+
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3")
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "256"))
+# Expired rows are deleted when read, and all at once at most this often on writes
+CACHE_PURGE_SECONDS = float(os.getenv("CACHE_PURGE_SECONDS", "3600"))
+
+
+def response_cache_key(model: str, messages: list[dict], **params) -> str:
+    """Return a hash of the fully rendered messages and model parameters."""
+    payload = json.dumps(
+        {"model": model, "messages": messages, "params": params},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class BaseResponseCache(ABC):
+    """Stores model responses by key, counting hits and misses."""
+
+    # Label for this tier in exported metrics
+    tier = "all"
+
+    def __init__(self, ttl_seconds: float = LLM_CACHE_TTL_SECONDS) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> str:
+        """Return the cached response for key, or None on a miss or expiry."""
+        value = self._get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        """Cache a response for ttl_seconds."""
+        self._set(key, value, time.time() + self.ttl_seconds)
+
+    def delete(self, key: str) -> None:
+        """Drop key, if cached."""
+        self._delete(key)
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+    @abstractmethod
+    def _get(self, key: str) -> str:
+        pass
+
+    @abstractmethod
+    def _set(self, key: str, value: str, expires_at: float) -> None:
+        pass
+
+    @abstractmethod
+    def _delete(self, key: str) -> None:
+        pass
+
+
+class MemoryResponseCache(BaseResponseCache):
+    """In-process LRU tier."""
+
+    tier = "memory"
+
+    def __init__(
+        self,
+        max_entries: int = LLM_CACHE_MEMORY_ENTRIES,
+        ttl_seconds: float = LLM_CACHE_TTL_SECONDS,
+    ) -> None:
+        super().__init__(ttl_seconds)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class SQLiteResponseCache(BaseResponseCache):
+    """Persistent tier, shared by every worker process on the host."""
+
+    tier = "sqlite"
+
+    def __init__(
+        self,
+        path: str = LLM_CACHE_PATH,
+        ttl_seconds: float = LLM_CACHE_TTL_SECONDS,
+        purge_seconds: float = CACHE_PURGE_SECONDS,
+    ) -> None:
+        super().__init__(ttl_seconds)
+        self.path = path
+        self.purge_seconds = purge_seconds
+        self._purged_at = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS llm_response_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS llm_response_cache_expires_at ON llm_response_cache (expires_at)"
+            )
+
+    def _get(self, key):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, expires_at FROM llm_response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at < time.time():
+                with self._connection:
+                    self._connection.execute(
+                        "DELETE FROM llm_response_cache WHERE key = ?", (key,)
+                    )
+                return None
+            return value
+
+    def _set(self, key, value, expires_at):
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO llm_response_cache (key, value, expires_at) "
+                "VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+            # Entries that are never read again would otherwise stay forever
+            if now - self._purged_at >= self.purge_seconds:
+                self._purged_at = now
+                self._connection.execute("DELETE FROM llm_response_cache WHERE expires_at < ?", (now,))
+
+    def _delete(self, key):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM llm_response_cache WHERE key = ?", (key,))
+
+
+class TieredResponseCache(BaseResponseCache):
+    """Checks each tier in order and backfills faster tiers on a hit."""
+
+    def __init__(self, *tiers: BaseResponseCache) -> None:
+        super().__init__()
+        self.tiers = tiers
+
+    def _get(self, key):
+        for i, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not None:
+                for faster_tier in self.tiers[:i]:
+                    faster_tier.set(key, value)
+                return value
+        return None
+
+    def _set(self, key, value, expires_at):
+        for tier in self.tiers:
+            tier.set(key, value)
+
+    def _delete(self, key):
+        for tier in self.tiers:
+            tier.delete(key)
+
+    def stats(self):
+        stats = super().stats()
+        for tier in self.tiers:
+            for name, count in tier.stats().items():
+                stats[f"{type(tier).__name__}_{name}"] = count
+        return stats
+
+    def counters(self, cache: str) -> dict[str, list[tuple[dict, int]]]:
+        """Hits and misses overall and per tier, as render_prometheus counters."""
+        return {
+            f"edutainment_response_cache_{kind}_total": [
+                ({"cache": cache, "tier": tier.tier}, tier.stats()[kind]) for tier in (self, *self.tiers)
+            ]
+            for kind in ("hits", "misses")
+        }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> BaseResponseCache:
+    """Return the process-wide cache: memory LRU, backed by SQLite unless
+    LLM_CACHE_PATH is empty."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            tiers = [MemoryResponseCache()]
+            if LLM_CACHE_PATH:
+                try:
+                    tiers.append(SQLiteResponseCache(LLM_CACHE_PATH))
+                except sqlite3.Error as e:
+                    logger.error("Unable to open LLM cache at %s: %s", LLM_CACHE_PATH, e)
+            _default_cache = TieredResponseCache(*tiers)
+        return _default_cache
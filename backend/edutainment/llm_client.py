@@ -0,0 +1,379 @@
+import asyncio
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+
+import aiohttp
+import openai
+from dotenv import find_dotenv, load_dotenv
+
+from edutainment.chunking import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+_ = load_dotenv(find_dotenv())
+
+# Size these to the organization's OpenAI limits
+OPENAI_REQUESTS_PER_MINUTE = float(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "3500"))
+OPENAI_TOKENS_PER_MINUTE = float(os.getenv("OPENAI_TOKENS_PER_MINUTE", "180000"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "120"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+
+ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
+ANTHROPIC_API_URL = os.getenv("ANTHROPIC_API_URL", "https://api.anthropic.com")
+ANTHROPIC_VERSION = "2023-06-01"
+ANTHROPIC_REQUESTS_PER_MINUTE = float(os.getenv("ANTHROPIC_REQUESTS_PER_MINUTE", "1000"))
+ANTHROPIC_TOKENS_PER_MINUTE = float(os.getenv("ANTHROPIC_TOKENS_PER_MINUTE", "100000"))
+ANTHROPIC_MAX_TOKENS = 4096
+
+# Output tokens to reserve per call when rate limiting, as they are unknown up front
+EXPECTED_COMPLETION_TOKENS = 1500
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+RETRYABLE_STATUSES = (408, 429, 500, 502, 503, 504, 529)
+
+
+class CompletionError(Exception):
+    """HTTP error from a completion API, with the response status and headers."""
+
+    def __init__(self, message: str, status: int = None, headers=None) -> None:
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+    @property
+    def retryable(self) -> bool:
+        return self.status in RETRYABLE_STATUSES
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, CompletionError):
+        return error.retryable
+    return isinstance(
+        error,
+        (
+            openai.error.RateLimitError,
+            openai.error.APIConnectionError,
+            openai.error.ServiceUnavailableError,
+            openai.error.Timeout,
+            openai.error.TryAgain,
+            aiohttp.ClientConnectionError,
+            asyncio.TimeoutError,
+        ),
+    )
+
+
+class TokenBucket:
+    """Async token bucket refilling at rate_per_minute, holding at most one minute's
+    worth."""
+
+    def __init__(self, rate_per_minute: float) -> None:
+        self.rate = rate_per_minute / 60
+        self.capacity = rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: float = 1) -> None:
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+def backoff_delay(attempt: int, error: Exception = None) -> float:
+    """Full-jitter exponential backoff, honoring a server's Retry-After if longer."""
+    delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2**attempt))
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return max(delay, float(headers.get("retry-after", 0)))
+    except (TypeError, ValueError):
+        return delay
+
+
+class BaseCompletionClient(ABC):
+    """Rate-limited, retrying client for a chat completion API.
+
+    All calls run on one background event loop sharing a single aiohttp connection
+    pool, so concurrent lesson generation from many threads stays within the
+    provider's request and token limits. Synchronous callers use `complete` and
+    `stream`; async code can await `acomplete` or iterate `astream` on the client's
+    loop.
+    """
+
+    name: str
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        max_retries: int = OPENAI_MAX_RETRIES,
+        timeout: float = OPENAI_TIMEOUT_SECONDS,
+        max_connections: int = OPENAI_MAX_CONNECTIONS,
+    ) -> None:
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name=f"{self.name}-client", daemon=True
+        )
+        self._thread.start()
+        self._session = None
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+
+    @abstractmethod
+    async def _acomplete_once(self, model: str, messages: list[dict], **params) -> str:
+        """Make one completion request and return its text."""
+        pass
+
+    @abstractmethod
+    async def _aopen_stream(self, model: str, messages: list[dict], **params):
+        """Start one streamed completion request and return an async iterator of
+        text pieces. Errors opening the stream must be raised here so they can be
+        retried."""
+        pass
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections)
+            )
+        return self._session
+
+    async def _with_retries(self, request, messages):
+        expected_tokens = (
+            sum(estimate_tokens(m["content"]) for m in messages) + EXPECTED_COMPLETION_TOKENS
+        )
+        for attempt in range(self.max_retries + 1):
+            await self._requests.acquire()
+            await self._tokens.acquire(expected_tokens)
+            try:
+                return await asyncio.wait_for(request(), self.timeout)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                delay = backoff_delay(attempt, e)
+                logger.warning(
+                    "%s completion failed (%s), retry %d in %.1fs",
+                    self.name,
+                    type(e).__name__,
+                    attempt + 1,
+                    delay,
+                )
+                await asyncio.sleep(delay)
+
+    async def acomplete(self, model: str, messages: list[dict], **params) -> str:
+        """Return the stripped content of a completion, retrying transient failures."""
+        content = await self._with_retries(
+            lambda: self._acomplete_once(model, messages, **params), messages
+        )
+        return content.strip()
+
+    async def astream(self, model: str, messages: list[dict], **params):
+        """Yield the content of a streamed completion piece by piece.
+
+        Failures before the first piece are retried like acomplete; once content has
+        been yielded, errors propagate to the caller.
+        """
+        pieces = await self._with_retries(
+            lambda: self._aopen_stream(model, messages, **params), messages
+        )
+        async for piece in pieces:
+            if piece:
+                yield piece
+
+    def complete(self, model: str, messages: list[dict], **params) -> str:
+        """Blocking wrapper around acomplete, safe to call from any thread."""
+        future = asyncio.run_coroutine_threadsafe(
+            self.acomplete(model, messages, **params), self._loop
+        )
+        return future.result()
+
+    def stream(self, model: str, messages: list[dict], **params):
+        """Blocking generator around astream, safe to use from any thread.
+
+        Raises openai.error.Timeout if no content arrives for `timeout` seconds.
+        """
+        pieces = queue.Queue()
+        finished = object()
+
+        async def pump():
+            try:
+                async for content in self.astream(model, messages, **params):
+                    pieces.put(content)
+            except Exception as e:
+                pieces.put(e)
+            finally:
+                pieces.put(finished)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self._loop)
+        try:
+            while True:
+                try:
+                    piece = pieces.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise openai.error.Timeout(f"No streamed content for {self.timeout}s")
+                if piece is finished:
+                    return
+                if isinstance(piece, Exception):
+                    raise piece
+                yield piece
+        finally:
+            future.cancel()
+
+    def close(self) -> None:
+        """Close the connection pool and stop the event loop."""
+        if self._session is not None:
+            asyncio.run_coroutine_threadsafe(self._session.close(), self._loop).result()
+            self._session = None
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+class ChatCompletionClient(BaseCompletionClient):
+    """OpenAI ChatCompletion client. Set OPENAI_API_BASE to use a local fake server."""
+
+    name = "openai"
+
+    def __init__(
+        self,
+        requests_per_minute: float = OPENAI_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = OPENAI_TOKENS_PER_MINUTE,
+        **kwargs,
+    ) -> None:
+        super().__init__(requests_per_minute, tokens_per_minute, **kwargs)
+
+    async def _acomplete_once(self, model, messages, **params):
+        openai.aiosession.set(self._get_session())
+        response = await openai.ChatCompletion.acreate(
+            model=model, messages=messages, request_timeout=self.timeout, **params
+        )
+        return response.choices[0].message.content
+
+    async def _aopen_stream(self, model, messages, **params):
+        openai.aiosession.set(self._get_session())
+        response = await openai.ChatCompletion.acreate(
+            model=model, messages=messages, request_timeout=self.timeout, stream=True, **params
+        )
+
+        async def pieces():
+            async for chunk in response:
+                yield chunk.choices[0].delta.get("content")
+
+        return pieces()
+
+
+class ClaudeMessagesClient(BaseCompletionClient):
+    """Anthropic Messages API client. Set ANTHROPIC_API_URL to use a local fake
+    server."""
+
+    name = "anthropic"
+
+    def __init__(
+        self,
+        requests_per_minute: float = ANTHROPIC_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = ANTHROPIC_TOKENS_PER_MINUTE,
+        api_url: str = ANTHROPIC_API_URL,
+        api_key: str = ANTHROPIC_API_KEY,
+        **kwargs,
+    ) -> None:
+        super().__init__(requests_per_minute, tokens_per_minute, **kwargs)
+        self.url = f"{api_url}/v1/messages"
+        self.headers = {
+            "x-api-key": api_key or "",
+            "anthropic-version": ANTHROPIC_VERSION,
+            "content-type": "application/json",
+        }
+
+    @staticmethod
+    def _body(model, messages, **params):
+        # The Messages API takes the system prompt separately
+        system = "\n".join(m["content"] for m in messages if m["role"] == "system")
+        body = {
+            "model": model,
+            "max_tokens": params.pop("max_tokens", ANTHROPIC_MAX_TOKENS),
+            "messages": [m for m in messages if m["role"] != "system"],
+            **params,
+        }
+        if system:
+            body["system"] = system
+        return body
+
+    async def _raise_for_status(self, response):
+        if response.status != 200:
+            text = await response.text()
+            response.release()
+            raise CompletionError(
+                f"Anthropic API returned {response.status}: {text[:200]}",
+                status=response.status,
+                headers=response.headers,
+            )
+
+    async def _acomplete_once(self, model, messages, **params):
+        async with self._get_session().post(
+            self.url, json=self._body(model, messages, **params), headers=self.headers
+        ) as response:
+            await self._raise_for_status(response)
+            data = await response.json()
+        return "".join(block.get("text", "") for block in data["content"])
+
+    async def _aopen_stream(self, model, messages, **params):
+        response = await self._get_session().post(
+            self.url,
+            json=self._body(model, messages, stream=True, **params),
+            headers=self.headers,
+        )
+        await self._raise_for_status(response)
+
+        async def pieces():
+            async with response:
+                async for line in response.content:
+                    line = line.decode("utf-8").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    event = json.loads(line[len("data:") :])
+                    if event.get("type") == "content_block_delta":
+                        yield event["delta"].get("text")
+                    elif event.get("type") == "error":
+                        raise CompletionError(event["error"].get("message", "stream error"))
+
+        return pieces()
+
+
+_default_clients = {}
+_default_clients_lock = threading.Lock()
+
+
+def _get_shared_client(client_class) -> BaseCompletionClient:
+    with _default_clients_lock:
+        if client_class not in _default_clients:
+            client = client_class()
+            atexit.register(client.close)
+            _default_clients[client_class] = client
+        return _default_clients[client_class]
+
+
+def get_default_client() -> ChatCompletionClient:
+    """Return the process-wide OpenAI client, so every caller shares its limits and
+    pool."""
+    return _get_shared_client(ChatCompletionClient)
+
+
+def get_default_claude_client() -> ClaudeMessagesClient:
+    """Return the process-wide Anthropic client."""
+    return _get_shared_client(ClaudeMessagesClient)
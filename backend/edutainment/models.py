@@ -1,128 +1,149 @@
+import hashlib
+import re
+import unicodedata
 import uuid
 from datetime import datetime
 
-from flask import Flask
-from server import db, app
-
-
-with app.app_context():
-    class Customer(db.Model):
-        customer_id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-        customername = db.Column(db.String(255))
-        year_of_birth = db.Column(db.Integer)
-        debug = db.Column(db.Boolean, default=False)
-        date_created = db.Column(db.Date, default=datetime.utcnow)
-
-        # Relationships
-        customer_sessions = db.relationship(
-            "CustomerSession", backref="customer", lazy=True
-        )
-        customer_article_topic = db.relationship(
-            "CustomerArticleTopic", backref="customer", lazy=True
-        )
-
-    class CustomerArticleTopic(db.Model):
-        customer_article_topic_id = db.Column(
-            db.String(36), primary_key=True, default=lambda: str(uuid.uuid4())
-        )
-        article_topic_id = db.Column(
-            db.String(36), db.ForeignKey("article_topic.article_topic_id"), nullable=False
-        )
-        customer_id = db.Column(
-            db.String(36), db.ForeignKey("customer.customer_id"), nullable=False
-        )
-        topic_expertise = db.Column(db.String(255))
-        debug = db.Column(db.Boolean, default=False)
-        date_created = db.Column(db.Date, default=datetime.utcnow)
-
-        # Relationships
-        article_topics = db.relationship(
-            "ArticleTopic", backref="customer_article_topic", lazy=True
-        )
-
-
-    class CustomerSession(db.Model):
-        customer_session_id = db.Column(
-            db.String(36), primary_key=True, default=lambda: str(uuid.uuid4())
-        )
-        customer_id = db.Column(
-            db.String(36), db.ForeignKey("customer.customer_id"), nullable=False
-        )
-        debug = db.Column(db.Boolean, default=False)
-        date_created = db.Column(db.Date, default=datetime.utcnow)
-
-        # Relationships
-        lesson_completions = db.relationship(
-            "LessonCompletion", backref="customer", lazy=True
-        )
-
-
-    class Article(db.Model):
-        article_id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-        filename = db.Column(db.String(255), nullable=False)
-        content = db.Column(db.Text, nullable=False)
-        # embeddings = db.Column(db.PickleType, nullable=False)
-        debug = db.Column(db.Boolean, default=False)
-        date_created = db.Column(db.Date, default=datetime.utcnow)
-
-        # Relationships
-        article_topics = db.relationship("ArticleTopic", backref="article", lazy=True)
-
-
-    class ArticleTopic(db.Model):
-        article_topic_id = db.Column(
-            db.String(36), primary_key=True, default=lambda: str(uuid.uuid4())
-        )
-        article_id = db.Column(
-            db.String(36), db.ForeignKey("article.article_id"), nullable=False
-        )
-        topic_name = db.Column(db.String(255), nullable=False)
-        debug = db.Column(db.Boolean, default=False)
-        date_created = db.Column(db.Date, default=datetime.utcnow)
-
-        # Relationships
-        lessons = db.relationship("Lesson", backref="article_topic", lazy=True)
-
-
-    class Lesson(db.Model):
-        lesson_id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-        article_topic_id = db.Column(
-            db.String(36), db.ForeignKey("article_topic.article_topic_id"), nullable=False
-        )
-        lesson_content = db.Column(db.Text, nullable=False)
-        question = db.Column(db.Text, nullable=False)
-        right_answer = db.Column(db.Text, nullable=False)
-        wrong_answer = db.Column(db.Text, nullable=False)
-        right_answer_explanation = db.Column(db.Text, nullable=False)
-        order_num = db.Column(db.Integer, nullable=False)
-        debug = db.Column(db.Boolean, default=False)
-        narration_file = db.Column(db.String(256))  
-        video_file = db.Column(db.String(256))  
-        date_created = db.Column(db.Date, default=datetime.utcnow)
-
-        # Relationships
-        lesson_completions = db.relationship(
-            "LessonCompletion", backref="lesson", lazy=True
-        )
-
-
-    class LessonCompletion(db.Model):
-        lesson_completion_id = db.Column(
-            db.String(36), primary_key=True, default=lambda: str(uuid.uuid4())
-        )
-        customer_session_id = db.Column(
-            db.String(36),
-            db.ForeignKey("customer_session.customer_session_id"),
-            nullable=False,
-        )
-        lesson_id = db.Column(
-            db.String(36), db.ForeignKey("lesson.lesson_id"), nullable=False
-        )
-        lesson_complete = db.Column(db.Boolean, nullable=False)
-        answer_correct = db.Column(db.Boolean, nullable=False)
-        debug = db.Column(db.Boolean, default=False)
-        date_created = db.Column(db.Date, default=datetime.utcnow)
-
-
-    # if __name__ == "__main__":
-    #     db.create_all()
+from edutainment.database import db
+
+
+def article_fingerprint(text: str) -> str:
+    """Hash normalized article text, so re-extractions and re-uploads of the same
+    document under another filename map to the same Article."""
+    normalized = re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip().casefold()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class Customer(db.Model):
+    customer_id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    customername = db.Column(db.String(255))
+    year_of_birth = db.Column(db.Integer)
+    debug = db.Column(db.Boolean, default=False)
+    date_created = db.Column(db.Date, default=datetime.utcnow)
+
+    # Relationships
+    customer_sessions = db.relationship(
+        "CustomerSession", backref="customer", lazy=True
+    )
+    customer_article_topic = db.relationship(
+        "CustomerArticleTopic", backref="customer", lazy=True
+    )
+
+class CustomerArticleTopic(db.Model):
+    customer_article_topic_id = db.Column(
+        db.String(36), primary_key=True, default=lambda: str(uuid.uuid4())
+    )
+    article_topic_id = db.Column(
+        db.String(36), db.ForeignKey("article_topic.article_topic_id"), nullable=False
+    )
+    customer_id = db.Column(
+        db.String(36), db.ForeignKey("customer.customer_id"), nullable=False
+    )
+    topic_expertise = db.Column(db.String(255))
+    debug = db.Column(db.Boolean, default=False)
+    date_created = db.Column(db.Date, default=datetime.utcnow)
+
+    # Relationships
+    article_topics = db.relationship(
+        "ArticleTopic", backref="customer_article_topic", lazy=True
+    )
+
+
+class CustomerSession(db.Model):
+    customer_session_id = db.Column(
+        db.String(36), primary_key=True, default=lambda: str(uuid.uuid4())
+    )
+    customer_id = db.Column(
+        db.String(36), db.ForeignKey("customer.customer_id"), nullable=False
+    )
+    debug = db.Column(db.Boolean, default=False)
+    date_created = db.Column(db.Date, default=datetime.utcnow)
+
+    # Relationships
+    lesson_completions = db.relationship(
+        "LessonCompletion", backref="customer", lazy=True
+    )
+
+
+class Article(db.Model):
+    article_id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    filename = db.Column(db.String(255), nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    content_hash = db.Column(db.String(64), unique=True, index=True)
+    # float32 embeddings of the article's passages, see edutainment.embeddings
+    passage_embeddings = db.Column(db.LargeBinary)
+    embedding_model = db.Column(db.String(64))
+    debug = db.Column(db.Boolean, default=False)
+    date_created = db.Column(db.Date, default=datetime.utcnow)
+
+    # Relationships
+    article_topics = db.relationship("ArticleTopic", backref="article", lazy=True)
+
+
+class ArticleTopic(db.Model):
+    __table_args__ = (db.UniqueConstraint("article_id", "topic_name"),)
+
+    article_topic_id = db.Column(
+        db.String(36), primary_key=True, default=lambda: str(uuid.uuid4())
+    )
+    article_id = db.Column(
+        db.String(36), db.ForeignKey("article.article_id"), nullable=False
+    )
+    topic_name = db.Column(db.String(255), nullable=False)
+    # All lesson narrations in one track, see edutainment.audio
+    narration_track = db.Column(db.String(256))
+    narration_chapters = db.Column(db.Text)  # JSON list of lesson start/duration
+    debug = db.Column(db.Boolean, default=False)
+    date_created = db.Column(db.Date, default=datetime.utcnow)
+
+    # Relationships
+    lessons = db.relationship("Lesson", backref="article_topic", lazy=True)
+
+
+class Lesson(db.Model):
+    __table_args__ = (db.UniqueConstraint("article_topic_id", "order_num"),)
+
+    lesson_id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    article_topic_id = db.Column(
+        db.String(36), db.ForeignKey("article_topic.article_topic_id"), nullable=False
+    )
+    lesson_content = db.Column(db.Text, nullable=False)
+    question = db.Column(db.Text, nullable=False)
+    right_answer = db.Column(db.Text, nullable=False)
+    wrong_answer = db.Column(db.Text, nullable=False)
+    right_answer_explanation = db.Column(db.Text, nullable=False)
+    order_num = db.Column(db.Integer, nullable=False)
+    debug = db.Column(db.Boolean, default=False)
+    narration_file = db.Column(db.String(256))  
+    video_file = db.Column(db.String(256))  
+    date_created = db.Column(db.Date, default=datetime.utcnow)
+
+    # Relationships
+    lesson_completions = db.relationship(
+        "LessonCompletion", backref="lesson", lazy=True
+    )
+
+
+class LessonCompletion(db.Model):
+    # One row per learner and lesson; resubmitted answers update it in place
+    __table_args__ = (db.UniqueConstraint("customer_session_id", "lesson_id"),)
+
+    lesson_completion_id = db.Column(
+        db.String(36), primary_key=True, default=lambda: str(uuid.uuid4())
+    )
+    customer_session_id = db.Column(
+        db.String(36),
+        db.ForeignKey("customer_session.customer_session_id"),
+        nullable=False,
+    )
+    lesson_id = db.Column(
+        db.String(36), db.ForeignKey("lesson.lesson_id"), nullable=False
+    )
+    lesson_complete = db.Column(db.Boolean, nullable=False)
+    answer_correct = db.Column(db.Boolean, nullable=False)
+    debug = db.Column(db.Boolean, default=False)
+    date_created = db.Column(db.Date, default=datetime.utcnow)
+
+
+# if __name__ == "__main__":
+#     db.create_all()
@@ -1,20 +1,33 @@
 import logging
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import requests
 from dotenv import find_dotenv, load_dotenv
+from requests.adapters import HTTPAdapter
+
+from edutainment.narration_cache import get_cache, narration_key
+from edutainment.tracing import in_current_context, stage
 
 logger = logging.getLogger(__name__)
 
 _ = load_dotenv(find_dotenv())
 
 ELEVEN_LABS_API_KEY = os.getenv("ELEVEN_LABS_API_KEY")
+ELEVEN_LABS_API_URL = os.getenv("ELEVEN_LABS_API_URL", "https://api.elevenlabs.io")
 DEBUG = os.getenv("DEBUG")
 CHUNK_SIZE = 1024
+NARRATION_MAX_WORKERS = int(os.getenv("NARRATION_MAX_WORKERS", "4"))
+NARRATION_TIMEOUT_SECONDS = float(os.getenv("NARRATION_TIMEOUT_SECONDS", "60"))
+# Concurrent TTS requests across the whole process, however many pipelines are running
+ELEVEN_LABS_MAX_CONCURRENCY = int(os.getenv("ELEVEN_LABS_MAX_CONCURRENCY", "8"))
 
 voice_id = "ThT5KcBeYPX3keUQqHPh" 
+model_id = "eleven_monolingual_v1"
+voice_settings = {"stability": 0.5, "similarity_boost": 0.5}
 
-url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
+url = f"{ELEVEN_LABS_API_URL}/v1/text-to-speech/{voice_id}"
 
 headers = {
     "Accept": "audio/mpeg",
@@ -22,36 +35,110 @@ headers = {
     "xi-api-key": ELEVEN_LABS_API_KEY,
 }
 
-
-def get_narration(text: str, id: str) -> str:
-    """Save an mp3 file with narration and return the filename."""
-    
-    # Replace spaces with underscores in the text
-    sanitized_text = text.replace(' ', '_')[:30]
-    
-    # Prepend the id to the filename
-    filename = f"narration/{id[:8]}_{sanitized_text}.mp3"
-
+_session = None
+_session_lock = threading.Lock()
+_tts_slots = threading.BoundedSemaphore(ELEVEN_LABS_MAX_CONCURRENCY)
+
+
+def get_session() -> requests.Session:
+    """Return the process-wide HTTP session, with a connection for every TTS request
+    that may run at once."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.headers.update(headers)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=ELEVEN_LABS_MAX_CONCURRENCY)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def get_narration(text: str) -> str:
+    """Save an mp3 file with narration and return the filename.
+
+    Narrations are content-addressed by text, voice and model settings, so identical
+    requests are served from the cache without calling the TTS API.
+    """
+    with stage("narration", chars=len(text)) as span:
+        cache = get_cache()
+        key = narration_key(text, voice_id, model_id, voice_settings)
+        filename = cache.get(key)
+        span.set(cached=filename is not None)
+        if filename:
+            return filename
+        with _tts_slots, stage("tts") as tts_span:
+            filename = _synthesize(text, cache, key)
+            tts_span.set(bytes=os.path.getsize(filename))
+        return filename
+
+
+def _synthesize(text, cache, key):
     data = {
         "text": text,
-        "model_id": "eleven_monolingual_v1",
-        "voice_settings": {"stability": 0.5, "similarity_boost": 0.5},
+        "model_id": model_id,
+        "voice_settings": voice_settings,
     }
 
-    response = requests.post(url, json=data, headers=headers)
-    if response.status_code == 200:
-        narration = response.content
+    with get_session().post(
+        url, json=data, stream=True, timeout=NARRATION_TIMEOUT_SECONDS
+    ) as response:
+        if response.status_code != 200:
+            raise requests.ConnectionError(
+                f"Expected status code 200, but got {response.status_code}"
+            )
+
+        # Stream to a temporary file so a failed download never leaves a truncated mp3
+        os.makedirs(cache.directory, exist_ok=True)
+        partial_filename = f"{cache.filename(key)}.{threading.get_ident()}.part"
+        try:
+            with open(partial_filename, "wb") as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    f.write(chunk)
+            filename = cache.put(key, partial_filename)
+        finally:
+            if os.path.exists(partial_filename):
+                os.remove(partial_filename)
 
-        os.makedirs(os.path.dirname(filename), exist_ok=True)
-        with open(filename, "wb") as f:
-            f.write(response.content)
+    return filename
 
-    else:
-        raise requests.ConnectionError(
-            f"Expected status code 200, but got {response.status_code}"
-        )
 
-    return filename
+class NarrationPipeline:
+    """Synthesizes narrations concurrently, starting each as soon as it is submitted.
+
+    Use as a context manager: submit texts as they become available, then iterate
+    `as_completed()` to handle each saved file without waiting for the rest.
+    """
+
+    def __init__(self, max_workers: int = None) -> None:
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or NARRATION_MAX_WORKERS, thread_name_prefix="narration"
+        )
+        self._futures = {}
+
+    def submit(self, text: str) -> int:
+        """Queue text for narration and return its index."""
+        index = len(self._futures)
+        self._futures[self._executor.submit(in_current_context(get_narration), text)] = index
+        return index
+
+    def as_completed(self):
+        """Yield (index, filename) for each narration as it is saved; failures are
+        logged and skipped."""
+        for future in as_completed(self._futures):
+            try:
+                yield self._futures[future], future.result()
+            except Exception as e:
+                logger.error(f"Unable to get narration: {e}")
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
 
 if __name__ == "__main__":
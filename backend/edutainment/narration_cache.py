@@ -0,0 +1,202 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from dotenv import find_dotenv, load_dotenv
+
+logger = logging.getLogger(__name__)
+
+_ = load_dotenv(find_dotenv())
+
+NARRATION_DIR = os.getenv("NARRATION_DIR", "narration")
+NARRATION_CACHE_MAX_BYTES = int(os.getenv("NARRATION_CACHE_MAX_BYTES", str(2 * 1024**3)))
+# Last-use times are written at most this often per file and process, so playback
+# rarely takes the index's write lock
+NARRATION_TOUCH_SECONDS = float(os.getenv("NARRATION_TOUCH_SECONDS", "300"))
+# Files whose last write time each process remembers before starting over
+NARRATION_TOUCHED_MAX = 10000
+INDEX_FILENAME = "index.sqlite3"
+
+_key_pattern = re.compile(r"^[0-9a-f]{64}\.mp3$")
+_etags = {}  # (path, size, mtime) -> etag, for files that are not content-addressed
+_etags_lock = threading.Lock()
+
+
+def narration_key(text: str, voice_id: str, model_id: str, voice_settings: dict) -> str:
+    """Return the content address of a narration request."""
+    payload = json.dumps(
+        {
+            "text": text,
+            "voice_id": voice_id,
+            "model_id": model_id,
+            "voice_settings": voice_settings,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def is_content_addressed(path: str) -> bool:
+    """Whether path is named by its narration key, so its bytes never change."""
+    return bool(_key_pattern.match(os.path.basename(path)))
+
+
+def file_etag(path: str) -> str:
+    """Return a strong ETag for a narration file.
+
+    Content-addressed files use their key. Anything else is hashed once per size and
+    modification time.
+    """
+    if is_content_addressed(path):
+        return os.path.basename(path)[:-4]
+    stat = os.stat(path)
+    fingerprint = (path, stat.st_size, stat.st_mtime_ns)
+    with _etags_lock:
+        etag = _etags.get(fingerprint)
+    if etag is None:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        etag = digest.hexdigest()
+        with _etags_lock:
+            _etags[fingerprint] = etag
+    return etag
+
+
+class NarrationCache:
+    """Content-addressed store of narration mp3s with size-bounded LRU eviction.
+
+    Files are saved as `<directory>/<key>.mp3`. The index of files, sizes and last
+    use is kept in SQLite at `<directory>/index.sqlite3`, shared by every worker
+    process on the host, so they see each other's narrations and the size bound
+    applies to their total. Other audio derived from narrations, such as topic
+    tracks, is counted against the bound once registered with add().
+
+    Evicted files may still be referenced by lessons; on_evict(paths), if set, is
+    called after each eviction so those references can be cleared.
+    """
+
+    def __init__(self, directory: str = NARRATION_DIR, max_bytes: int = NARRATION_CACHE_MAX_BYTES, on_evict=None) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self._lock = threading.Lock()
+        self._touched = {}  # path -> when this process last wrote its last_used
+        os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(
+            os.path.join(directory, INDEX_FILENAME), check_same_thread=False, timeout=30, isolation_level=None
+        )
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS narrations "
+                "(path TEXT PRIMARY KEY, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS narrations_last_used ON narrations (last_used)")
+
+    def filename(self, key: str) -> str:
+        return f"{self.directory}/{key}.mp3"
+
+    def get(self, key: str) -> str:
+        """Return the cached filename for key, or None on a miss."""
+        filename = self.filename(key)
+        with self._lock:
+            row = self._connection.execute("SELECT 1 FROM narrations WHERE path = ?", (filename,)).fetchone()
+            if row is None:
+                return None
+            if not os.path.exists(filename):
+                # Removed behind our back; forget it so it is synthesized again
+                self._connection.execute("DELETE FROM narrations WHERE path = ?", (filename,))
+                return None
+        self.touch(filename)
+        return filename
+
+    def put(self, key: str, source_filename: str) -> str:
+        """Move a finished file into the cache under key and return its filename."""
+        filename = self.filename(key)
+        os.replace(source_filename, filename)
+        self.add(filename)
+        return filename
+
+    def add(self, path: str) -> None:
+        """Count an existing file against the size bound, as most recently used."""
+        size = os.path.getsize(path)
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO narrations (path, size, last_used) VALUES (?, ?, ?)",
+                (path, size, now),
+            )
+            self._touched[path] = now
+        self._evict(keep=path)
+
+    def touch(self, path: str) -> None:
+        """Mark path as used now; written at most every NARRATION_TOUCH_SECONDS."""
+        now = time.time()
+        with self._lock:
+            if now - self._touched.get(path, 0) < NARRATION_TOUCH_SECONDS:
+                return
+            if len(self._touched) >= NARRATION_TOUCHED_MAX:
+                self._touched.clear()
+            self._touched[path] = now
+            self._connection.execute(
+                "UPDATE narrations SET last_used = ? WHERE path = ? AND last_used < ?",
+                (now, path, now - NARRATION_TOUCH_SECONDS),
+            )
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM narrations").fetchone()[0]
+
+    def _evict(self, keep: str) -> None:
+        # Picking and deleting victims is one write transaction, so two processes
+        # never both evict for the same overflow
+        victims = []
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                total = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM narrations").fetchone()[0]
+                if total > self.max_bytes:
+                    rows = self._connection.execute(
+                        "SELECT path, size FROM narrations WHERE path != ? ORDER BY last_used", (keep,)
+                    ).fetchall()
+                    for path, size in rows:
+                        if total <= self.max_bytes:
+                            break
+                        victims.append(path)
+                        total -= size
+                    self._connection.executemany("DELETE FROM narrations WHERE path = ?", [(p,) for p in victims])
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        if not victims:
+            return
+        for path in victims:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        logger.info("Evicted %d narration files", len(victims))
+        if self.on_evict is not None:
+            self.on_evict(victims)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> NarrationCache:
+    """Return the process-wide narration cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = NarrationCache()
+        return _cache
@@ -0,0 +1,108 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import BinaryIO, Iterator
+
+from dotenv import find_dotenv, load_dotenv
+from PyPDF2 import PdfReader
+
+logger = logging.getLogger(__name__)
+
+_ = load_dotenv(find_dotenv())
+
+PDF_MAX_BYTES = int(os.getenv("PDF_MAX_BYTES", str(50 * 1024**2)))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "300"))
+PDF_EXTRACTION_WORKERS = int(os.getenv("PDF_EXTRACTION_WORKERS", str(os.cpu_count() or 1)))
+# Below this many pages, process start-up costs more than it saves
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "16"))
+PAGES_PER_TASK = 8
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+
+class PDFLimitError(ValueError):
+    """Raised when an upload exceeds the configured byte or page limits."""
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Forking a process that already runs request and job threads can copy
+            # a lock some other thread holds; workers start from a clean process instead
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _executor = ProcessPoolExecutor(
+                max_workers=PDF_EXTRACTION_WORKERS, mp_context=multiprocessing.get_context(start_method)
+            )
+        return _executor
+
+
+def _extract_page_range(path: str, start: int, stop: int) -> list[str]:
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def spool_to_file(pdf_file: BinaryIO, max_bytes: int = PDF_MAX_BYTES) -> str:
+    """Copy an upload to a temporary file in fixed-size chunks and return its path.
+
+    The caller owns the file and must remove it.
+    """
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+        try:
+            copied = 0
+            while chunk := pdf_file.read(SPOOL_CHUNK_SIZE):
+                copied += len(chunk)
+                if copied > max_bytes:
+                    raise PDFLimitError(f"PDF is larger than {max_bytes} bytes")
+                f.write(chunk)
+        except BaseException:
+            f.close()
+            os.remove(f.name)
+            raise
+    return f.name
+
+
+def iter_pdf_pages(
+    path: str,
+    max_pages: int = PDF_MAX_PAGES,
+    parallel: bool = True,
+) -> Iterator[str]:
+    """Yield the text of each page of the PDF at path, in page order.
+
+    Long documents are extracted in page ranges on a process pool; pages are yielded
+    as soon as their range is done, so consumers can start before the last page is
+    parsed.
+    """
+    num_pages = len(PdfReader(path).pages)
+    if num_pages > max_pages:
+        raise PDFLimitError(f"PDF has {num_pages} pages, the limit is {max_pages}")
+
+    if not parallel or num_pages < PDF_PARALLEL_MIN_PAGES or PDF_EXTRACTION_WORKERS < 2:
+        yield from _extract_page_range(path, 0, num_pages)
+        return
+
+    starts = range(0, num_pages, PAGES_PER_TASK)
+    stops = [min(start + PAGES_PER_TASK, num_pages) for start in starts]
+    for texts in _get_executor().map(_extract_page_range, repeat(path), starts, stops):
+        yield from texts
+
+
+def extract_text(
+    pdf_file: BinaryIO,
+    max_bytes: int = PDF_MAX_BYTES,
+    max_pages: int = PDF_MAX_PAGES,
+) -> str:
+    """Return the text of an uploaded PDF, enforcing byte and page limits."""
+    path = spool_to_file(pdf_file, max_bytes)
+    try:
+        return "".join(iter_pdf_pages(path, max_pages))
+    finally:
+        os.remove(path)
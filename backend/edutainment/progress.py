@@ -0,0 +1,172 @@
+import atexit
+import logging
+import os
+import threading
+
+import sqlalchemy
+from dotenv import find_dotenv, load_dotenv
+from flask import Flask
+
+from edutainment.database import db
+from edutainment.lesson_planner import bulk_upsert
+from edutainment.models import CustomerSession, Lesson, LessonCompletion
+from edutainment.tracing import stage
+
+logger = logging.getLogger(__name__)
+
+_ = load_dotenv(find_dotenv())
+
+# Flush buffered completions at least this often, or as soon as this many are waiting
+PROGRESS_FLUSH_SECONDS = float(os.getenv("PROGRESS_FLUSH_SECONDS", "1"))
+PROGRESS_FLUSH_ROWS = int(os.getenv("PROGRESS_FLUSH_ROWS", "500"))
+# Completions held at most, per worker process, before submissions are refused
+PROGRESS_MAX_BUFFERED = int(os.getenv("PROGRESS_MAX_BUFFERED", "50000"))
+# Session and lesson ids remembered as valid, per kind, so bursts skip the lookup
+PROGRESS_KNOWN_IDS = int(os.getenv("PROGRESS_KNOWN_IDS", "100000"))
+
+COMPLETION_KEY = ["customer_session_id", "lesson_id"]
+COMPLETION_UPDATES = ["lesson_complete", "answer_correct"]
+
+
+class ProgressBufferFull(Exception):
+    pass
+
+
+class UnknownProgressTarget(ValueError):
+    pass
+
+
+def _key(row: dict) -> tuple:
+    return tuple(row[k] for k in COMPLETION_KEY)
+
+
+class CompletionBuffer:
+    """Collects LessonCompletion rows in memory and writes them in batches.
+
+    A background thread upserts everything buffered every flush_seconds, or sooner
+    once flush_rows are waiting, one INSERT ... ON CONFLICT per flush_rows. Rows are
+    keyed on (customer_session_id, lesson_id), so resubmitting an answer, in the same
+    batch or a later one, updates the existing row and the latest submission wins.
+
+    Session and lesson ids are checked before rows are accepted, so an accepted row
+    is not rejected by a foreign key later. Rows still buffered when the process dies
+    are lost; the rest are flushed at exit.
+    """
+
+    def __init__(
+        self,
+        app: Flask,
+        flush_seconds: float = PROGRESS_FLUSH_SECONDS,
+        flush_rows: int = PROGRESS_FLUSH_ROWS,
+        max_rows: int = PROGRESS_MAX_BUFFERED,
+    ) -> None:
+        self.app = app
+        self.flush_seconds = flush_seconds
+        self.flush_rows = flush_rows
+        self.max_rows = max_rows
+        self._rows = {}
+        self._lock = threading.Lock()
+        # Only one flush writes at a time, so a later answer never lands before an earlier one
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._known_ids = {}
+        self._known_ids_lock = threading.Lock()
+
+    @property
+    def buffered(self) -> int:
+        return len(self._rows)
+
+    def _check_ids(self, column, ids: set) -> None:
+        # Request threads share the remembered ids; the lookup itself runs unlocked
+        with self._known_ids_lock:
+            missing = ids - self._known_ids.get(column.key, set())
+        if not missing:
+            return
+        with self.app.app_context():
+            found = set(db.session.scalars(db.select(column).where(column.in_(missing))))
+            db.session.rollback()
+        with self._known_ids_lock:
+            known = self._known_ids.setdefault(column.key, set())
+            if len(known) + len(found) > PROGRESS_KNOWN_IDS:
+                known.clear()
+            known.update(found)
+        if missing - found:
+            raise UnknownProgressTarget(f"Unknown {column.key}: {', '.join(sorted(missing - found))}")
+
+    def add(self, rows: list[dict]) -> None:
+        """Buffer completion rows, replacing any buffered row with the same key.
+
+        Raises:
+        -------
+        UnknownProgressTarget
+            If a session or lesson does not exist; none of the rows are buffered.
+        ProgressBufferFull
+            If the rows would not fit; none of them are buffered.
+        """
+        self._check_ids(CustomerSession.customer_session_id, {r["customer_session_id"] for r in rows})
+        self._check_ids(Lesson.lesson_id, {r["lesson_id"] for r in rows})
+        with self._lock:
+            new_keys = {_key(row) for row in rows} - self._rows.keys()
+            if len(self._rows) + len(new_keys) > self.max_rows:
+                raise ProgressBufferFull(f"{len(self._rows)} completions are already waiting to be written")
+            for row in rows:
+                self._rows[_key(row)] = row
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="progress-flush", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+            if len(self._rows) >= self.flush_rows:
+                self._wake.set()
+
+    def flush(self) -> int:
+        """Write everything buffered now. Returns the number of rows written."""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = list(self._rows.values()), {}
+            return sum(self._write(rows[i : i + self.flush_rows]) for i in range(0, len(rows), self.flush_rows))
+
+    def _upsert(self, rows: list[dict]) -> None:
+        with self.app.app_context(), db.session.begin():
+            bulk_upsert(db.session, LessonCompletion, rows, COMPLETION_KEY, update_columns=COMPLETION_UPDATES)
+
+    def _write(self, rows: list[dict]) -> int:
+        try:
+            with stage("progress_flush", rows=len(rows)):
+                self._upsert(rows)
+            return len(rows)
+        except sqlalchemy.exc.IntegrityError as e:
+            # A session or lesson deleted since it was checked; find it so the rest land
+            logger.error("Batch of %d completions rejected, retrying one by one: %s", len(rows), e.orig)
+        except sqlalchemy.exc.SQLAlchemyError as e:
+            logger.error("Unable to write %d completions, keeping them for the next flush: %s", len(rows), e)
+            self._requeue(rows)
+            return 0
+
+        written = 0
+        for row in rows:
+            try:
+                self._upsert([row])
+                written += 1
+            except sqlalchemy.exc.IntegrityError as e:
+                logger.error("Dropping completion of lesson %s: %s", row["lesson_id"], e.orig)
+            except sqlalchemy.exc.SQLAlchemyError as e:
+                logger.error("Unable to write completion of lesson %s, keeping it: %s", row["lesson_id"], e)
+                self._requeue([row])
+        return written
+
+    def _requeue(self, rows: list[dict]) -> None:
+        # Rows submitted since the flush started are newer and win; the cap is
+        # ignored, since dropping accepted answers would be worse
+        with self._lock:
+            for row in rows:
+                self._rows.setdefault(_key(row), row)
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Lesson completion flush failed")
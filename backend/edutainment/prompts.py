@@ -0,0 +1,133 @@
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from string import Template
+
+import yaml
+from dotenv import find_dotenv, load_dotenv
+
+logger = logging.getLogger(__name__)
+
+_ = load_dotenv(find_dotenv())
+
+LLM_PROMPTS_PATH = os.getenv(
+    "LLM_PROMPTS_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "llm_prompts.yml"),
+)
+# How often, at most, the prompts file is stat'ed for changes
+PROMPTS_RELOAD_CHECK_SECONDS = float(os.getenv("PROMPTS_RELOAD_CHECK_SECONDS", "5"))
+
+# Placeholders each template must use, and the only ones it may use
+TEMPLATE_FIELDS = {
+    "topics_prompt": {"article"},
+    "lessons_prompt": {"article", "topic"},
+}
+# Like TEMPLATE_FIELDS, for templates a prompt set may leave out
+OPTIONAL_TEMPLATE_FIELDS = {
+    "batch_lessons_prompt": {"article", "topics"},
+}
+
+
+class PromptError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class PromptSet:
+    system_prompt: str
+    topics_prompt: Template
+    lessons_prompt: Template
+    batch_lessons_prompt: Template = None
+
+
+def compile_prompt_set(model: str, prompts: dict) -> PromptSet:
+    """Build a PromptSet from one model's entry in llm_prompts.yml.
+
+    Raises:
+    -------
+    PromptError: A prompt is missing, or a template is malformed or uses the wrong
+        placeholders.
+    """
+    if not isinstance(prompts, dict) or not isinstance(prompts.get("system_prompt"), str):
+        raise PromptError(f"{model}: system_prompt is missing.")
+    templates = {}
+    for name, fields in {**TEMPLATE_FIELDS, **OPTIONAL_TEMPLATE_FIELDS}.items():
+        if name in OPTIONAL_TEMPLATE_FIELDS and name not in prompts:
+            continue
+        if not isinstance(prompts.get(name), str):
+            raise PromptError(f"{model}: {name} is missing.")
+        template = Template(prompts[name])
+        if not template.is_valid():
+            raise PromptError(f"{model}: {name} has an invalid placeholder.")
+        identifiers = set(template.get_identifiers())
+        if identifiers != fields:
+            raise PromptError(
+                f"{model}: {name} uses placeholders {sorted(identifiers)}, expected {sorted(fields)}."
+            )
+        templates[name] = template
+    return PromptSet(system_prompt=prompts["system_prompt"], **templates)
+
+
+class PromptRegistry:
+    """The compiled prompt sets of a prompts file, loaded once per process and reloaded
+    when the file changes. A reload that fails validation keeps the previous prompts."""
+
+    def __init__(self, path: str = LLM_PROMPTS_PATH, check_interval: float = PROMPTS_RELOAD_CHECK_SECONDS) -> None:
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = 0.0
+        self._prompt_sets = {}
+        self.reload()
+
+    def reload(self) -> None:
+        """Load and validate every prompt set in the file."""
+        with self._lock:
+            mtime = os.stat(self.path).st_mtime_ns
+            with open(self.path) as f:
+                data = yaml.safe_load(f)
+            if not isinstance(data, dict) or not data:
+                raise PromptError(f"{self.path} defines no prompt sets.")
+            prompt_sets = {model: compile_prompt_set(model, prompts) for model, prompts in data.items()}
+            self._prompt_sets = prompt_sets
+            self._mtime = mtime
+            self._checked_at = time.monotonic()
+        logger.info("Loaded prompts for %s from %s", ", ".join(prompt_sets), self.path)
+
+    def _reload_if_changed(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        try:
+            if os.stat(self.path).st_mtime_ns == self._mtime:
+                return
+            self.reload()
+        except (OSError, yaml.YAMLError, PromptError) as e:
+            logger.error("Keeping previous prompts, could not reload %s: %s", self.path, e)
+
+    def models(self) -> list[str]:
+        return list(self._prompt_sets)
+
+    def get(self, model: str) -> PromptSet:
+        self._reload_if_changed()
+        try:
+            return self._prompt_sets[model]
+        except KeyError:
+            raise PromptError(f"No prompts for model {model} in {self.path}.") from None
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_prompt_registry(path: str = None) -> PromptRegistry:
+    """Return the process-wide registry for path, loading it on first use."""
+    path = os.path.abspath(path or LLM_PROMPTS_PATH)
+    with _registries_lock:
+        if path not in _registries:
+            _registries[path] = PromptRegistry(path)
+        return _registries[path]
@@ -0,0 +1,282 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from dotenv import find_dotenv, load_dotenv
+
+from edutainment.text import BaseLessonText, ClaudeLessonText, GPTLessonText
+from edutainment.tracing import in_current_context
+
+logger = logging.getLogger(__name__)
+
+_ = load_dotenv(find_dotenv())
+
+# Comma-separated; more than one routes every call between them
+LESSON_TEXT_PROVIDERS = os.getenv("LESSON_TEXT_PROVIDERS", "openai")
+# Start the same call on the next-best provider if the first hasn't answered by then
+LLM_HEDGE_AFTER_SECONDS = float(os.getenv("LLM_HEDGE_AFTER_SECONDS", "30"))
+PROVIDER_COST_PER_1K_TOKENS = {
+    "openai": float(os.getenv("OPENAI_COST_PER_1K_TOKENS", "0.003")),
+    "anthropic": float(os.getenv("ANTHROPIC_COST_PER_1K_TOKENS", "0.008")),
+}
+# How many seconds of latency one dollar per 1k tokens is worth when ranking providers
+COST_WEIGHT_SECONDS = float(os.getenv("ROUTER_COST_WEIGHT_SECONDS", "1000"))
+# Added to the score for a provider failing every call
+ERROR_PENALTY_SECONDS = 60
+EWMA_ALPHA = 0.2
+
+PROVIDERS = {
+    "openai": GPTLessonText,
+    "anthropic": ClaudeLessonText,
+}
+
+
+class ProviderStats:
+    """Moving averages of one provider's latency and error rate, shared by every
+    request in the process."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.latency_seconds = None
+        self.error_rate = 0.0
+
+    def record(self, seconds: float, ok: bool) -> None:
+        with self._lock:
+            self.calls += 1
+            self.error_rate += EWMA_ALPHA * ((0.0 if ok else 1.0) - self.error_rate)
+            if ok:
+                if self.latency_seconds is None:
+                    self.latency_seconds = seconds
+                else:
+                    self.latency_seconds += EWMA_ALPHA * (seconds - self.latency_seconds)
+
+    def record_censored(self, seconds: float) -> None:
+        """Record a call abandoned after `seconds` because another provider answered
+        first. Its latency is at least that, so the sample can raise the average but
+        never lower it."""
+        with self._lock:
+            self.calls += 1
+            if self.latency_seconds is None:
+                self.latency_seconds = seconds
+            elif seconds > self.latency_seconds:
+                self.latency_seconds += EWMA_ALPHA * (seconds - self.latency_seconds)
+
+    def score(self, cost_per_1k_tokens: float) -> float:
+        """Lower is better. Providers without a successful call yet score on cost
+        alone, so each gets tried."""
+        return (
+            (self.latency_seconds or 0.0)
+            + ERROR_PENALTY_SECONDS * self.error_rate
+            + COST_WEIGHT_SECONDS * cost_per_1k_tokens
+        )
+
+
+_stats = {}
+_stats_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="router")
+_END = object()
+
+
+def get_provider_stats(name: str) -> ProviderStats:
+    with _stats_lock:
+        if name not in _stats:
+            _stats[name] = ProviderStats()
+        return _stats[name]
+
+
+class _Attempt:
+    """One provider's share of a routed call. Its outcome is recorded once: when the
+    provider finishes, or as a censored latency when another answers first, so a
+    slow provider that keeps losing hedges is still demoted."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self._recorded = False
+
+    def record(self, ok: bool = True, censored: bool = False) -> None:
+        with self._lock:
+            if self._recorded:
+                return
+            self._recorded = True
+        seconds = time.monotonic() - self.started
+        if censored:
+            get_provider_stats(self.name).record_censored(seconds)
+        else:
+            get_provider_stats(self.name).record(seconds, ok)
+
+
+class RoutedLessonText(BaseLessonText):
+    """Sends each call to the provider with the best observed latency, error rate and
+    token cost, hedging with the next provider when the first is slow or failing."""
+
+    def __init__(
+        self,
+        article_text: str,
+        providers: dict[str, BaseLessonText],
+        hedge_after: float = LLM_HEDGE_AFTER_SECONDS,
+    ) -> None:
+        super().__init__(article_text)
+        self.providers = providers
+        self.hedge_after = hedge_after
+
+    @property
+    def passage_index(self):
+        return next(iter(self.providers.values())).passage_index
+
+    @passage_index.setter
+    def passage_index(self, passage_index):
+        for provider in self.providers.values():
+            provider.passage_index = passage_index
+
+    def get_passages(self):
+        return next(iter(self.providers.values())).get_passages()
+
+    def ranked_providers(self) -> list[str]:
+        return sorted(
+            self.providers,
+            key=lambda name: get_provider_stats(name).score(
+                PROVIDER_COST_PER_1K_TOKENS.get(name, 0.0)
+            ),
+        )
+
+    def _call(self, attempt, method, *args):
+        try:
+            result = getattr(self.providers[attempt.name], method)(*args)
+        except Exception:
+            attempt.record(ok=False)
+            raise
+        attempt.record(ok=True)
+        return result
+
+    def _hedged(self, method, *args):
+        remaining = self.ranked_providers()
+        pending = {}  # future -> attempt
+
+        def launch():
+            attempt = _Attempt(remaining.pop(0))
+            pending[_executor.submit(in_current_context(self._call), attempt, method, *args)] = attempt
+
+        launch()
+        last_error = None
+        while pending:
+            done, _ = wait(
+                pending,
+                timeout=self.hedge_after if remaining else None,
+                return_when=FIRST_COMPLETED,
+            )
+            if not done:
+                logger.info(
+                    "Hedging %s on %s with %s", method, [a.name for a in pending.values()], remaining[0]
+                )
+                launch()
+                continue
+            for future in done:
+                attempt = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    last_error = e
+                    logger.warning("%s failed on %s: %s", method, attempt.name, e)
+                    continue
+                for loser in pending.values():
+                    loser.record(censored=True)
+                return result
+            if not pending and remaining:
+                launch()
+        raise last_error
+
+    def get_topics(self):
+        return self._hedged("get_topics")
+
+    def get_lessons(self, topic):
+        return self._hedged("get_lessons", topic)
+
+    def get_lessons_batch(self, topics):
+        return self._hedged("get_lessons_batch", topics)
+
+    def _stream_into(self, attempt, topic, events, stop):
+        """Run one provider's stream on the router pool, putting (name, lesson, error)
+        on events, then (name, _END, None) when it finishes."""
+        name = attempt.name
+        stream = self.providers[name].stream_lessons(topic)
+        try:
+            for lesson in stream:
+                if stop.is_set():
+                    return
+                events.put((name, lesson, None))
+        except Exception as e:
+            attempt.record(ok=False)
+            events.put((name, None, e))
+            return
+        finally:
+            stream.close()
+        if not stop.is_set():
+            attempt.record(ok=True)
+        events.put((name, _END, None))
+
+    def stream_lessons(self, topic):
+        """Stream from the best provider, hedging like the other calls: if it has not
+        yielded a lesson after hedge_after seconds, or fails before its first lesson,
+        the next provider is started too. The first to yield a lesson is streamed to
+        the end and the others are stopped."""
+        remaining = self.ranked_providers()
+        events = queue.Queue()
+        running = {}  # provider name -> (attempt, stop event)
+        winner = None
+        last_error = None
+
+        def launch():
+            attempt = _Attempt(remaining.pop(0))
+            running[attempt.name] = attempt, threading.Event()
+            _executor.submit(
+                in_current_context(self._stream_into), attempt, topic, events, running[attempt.name][1]
+            )
+
+        launch()
+        try:
+            while True:
+                try:
+                    name, lesson, error = events.get(timeout=self.hedge_after if winner is None and remaining else None)
+                except queue.Empty:
+                    logger.info("Hedging stream_lessons on %s with %s", list(running), remaining[0])
+                    launch()
+                    continue
+                if winner is not None and name != winner:
+                    continue
+                if error is not None:
+                    if winner is not None:
+                        raise error
+                    last_error = error
+                    logger.warning("stream_lessons failed on %s: %s", name, error)
+                    del running[name]
+                    if not running:
+                        if not remaining:
+                            raise last_error
+                        launch()
+                    continue
+                if winner is None:
+                    winner = name
+                    for other, (attempt, stop) in running.items():
+                        if other != winner:
+                            stop.set()
+                            attempt.record(censored=True)
+                if lesson is _END:
+                    return
+                yield lesson
+        finally:
+            for _, stop in running.values():
+                stop.set()
+
+
+def get_lesson_text(article_text: str, providers: str = LESSON_TEXT_PROVIDERS) -> BaseLessonText:
+    """Return the lesson text backend configured by LESSON_TEXT_PROVIDERS."""
+    names = [name.strip() for name in providers.split(",") if name.strip()]
+    if len(names) == 1:
+        return PROVIDERS[names[0]](article_text)
+    return RoutedLessonText(article_text, {name: PROVIDERS[name](article_text) for name in names})
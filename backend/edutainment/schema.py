@@ -0,0 +1,216 @@
+import logging
+
+import sqlalchemy
+from sqlalchemy import text
+
+from edutainment.database import db
+from edutainment.models import Article, ArticleTopic, Lesson, LessonCompletion, article_fingerprint
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_BATCH_SIZE = 500
+
+# Unique keys the code relies on (ON CONFLICT targets and lookups), by table. Older
+# databases predate them; they are added as unique indexes, which both Postgres and
+# SQLite accept as conflict targets.
+UNIQUE_KEYS = [
+    (Article.__table__, ["content_hash"]),
+    (ArticleTopic.__table__, ["article_id", "topic_name"]),
+    (Lesson.__table__, ["article_topic_id", "order_num"]),
+    (LessonCompletion.__table__, ["customer_session_id", "lesson_id"]),
+]
+
+
+def _add_missing_columns(connection, inspector) -> list[str]:
+    added = []
+    for table in db.metadata.sorted_tables:
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable:
+                raise RuntimeError(f"Cannot add NOT NULL column {table.name}.{column.name} to existing rows")
+            column_type = column.type.compile(dialect=connection.dialect)
+            connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            added.append(f"{table.name}.{column.name}")
+    return added
+
+
+def _merge_article_into(connection, duplicate: str, kept: str) -> None:
+    """Move a duplicate article's topics to the article with the same text. A topic
+    the kept article already has is merged into it, dropping the duplicate's lessons
+    so a topic never mixes two generations."""
+    colliding = connection.execute(
+        text(
+            "SELECT d.article_topic_id, k.article_topic_id FROM article_topic d "
+            "JOIN article_topic k ON k.topic_name = d.topic_name AND k.article_id = :kept "
+            "WHERE d.article_id = :duplicate"
+        ),
+        {"duplicate": duplicate, "kept": kept},
+    ).all()
+    for duplicate_topic, kept_topic in colliding:
+        ids = {"duplicate_topic": duplicate_topic, "kept_topic": kept_topic}
+        connection.execute(
+            text(
+                "UPDATE customer_article_topic SET article_topic_id = :kept_topic "
+                "WHERE article_topic_id = :duplicate_topic"
+            ),
+            ids,
+        )
+        connection.execute(
+            text(
+                "DELETE FROM lesson_completion WHERE lesson_id IN "
+                "(SELECT lesson_id FROM lesson WHERE article_topic_id = :duplicate_topic)"
+            ),
+            ids,
+        )
+        connection.execute(text("DELETE FROM lesson WHERE article_topic_id = :duplicate_topic"), ids)
+        connection.execute(text("DELETE FROM article_topic WHERE article_topic_id = :duplicate_topic"), ids)
+    ids = {"duplicate": duplicate, "kept": kept}
+    connection.execute(text("UPDATE article_topic SET article_id = :kept WHERE article_id = :duplicate"), ids)
+    connection.execute(text("DELETE FROM article WHERE article_id = :duplicate"), ids)
+
+
+def _backfill_content_hash(connection) -> tuple[int, int]:
+    """Fingerprint articles stored before content_hash existed. Where several hold
+    the same text, the first keeps it and the others are merged into it, so no
+    article is left without a fingerprint. Returns the articles fingerprinted and
+    merged."""
+    articles = Article.__table__
+    fingerprinted = sqlalchemy.select(articles.c.content_hash, articles.c.article_id).where(
+        articles.c.content_hash.is_not(None)
+    )
+    seen = dict(connection.execute(fingerprinted).all())
+    filled = merged = 0
+    last_id = ""
+    while True:
+        batch = connection.execute(
+            sqlalchemy.select(articles.c.article_id, articles.c.content)
+            .where(articles.c.content_hash.is_(None), articles.c.article_id > last_id)
+            .order_by(articles.c.article_id)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not batch:
+            return filled, merged
+        for article_id, content in batch:
+            fingerprint = article_fingerprint(content or "")
+            if fingerprint in seen:
+                _merge_article_into(connection, article_id, seen[fingerprint])
+                merged += 1
+                continue
+            seen[fingerprint] = article_id
+            connection.execute(
+                articles.update().where(articles.c.article_id == article_id).values(content_hash=fingerprint)
+            )
+            filled += 1
+        last_id = batch[-1][0]
+
+
+def _keepers(table: str, pk: str, columns: list[str]) -> str:
+    """SQL selecting the row kept for each value of columns: the lowest primary key."""
+    return f"SELECT MIN({pk}) FROM {table} GROUP BY {', '.join(columns)}"
+
+
+def _replacement(table: str, pk: str, columns: list[str], reference: str) -> str:
+    """SQL for the kept row that has the same key as the row reference points at."""
+    same_key = " AND ".join(f"k.{c} = d.{c}" for c in columns)
+    return f"(SELECT MIN(k.{pk}) FROM {table} k JOIN {table} d ON {same_key} WHERE d.{pk} = {reference})"
+
+
+def _merge_duplicates(connection) -> dict[str, int]:
+    """Remove rows that would break the unique keys, keeping the lowest id per key.
+
+    Customers keep their topics, and answers move to the kept lesson with the same
+    position. A duplicate topic's own lessons are dropped rather than merged, so a
+    topic never mixes two generations.
+    """
+    removed = {}
+
+    def delete_duplicates(table, pk, columns):
+        result = connection.execute(text(f"DELETE FROM {table} WHERE {pk} NOT IN ({_keepers(table, pk, columns)})"))
+        removed[table] = result.rowcount
+
+    topic_key = ["article_id", "topic_name"]
+    duplicate_topics = f"SELECT article_topic_id FROM article_topic WHERE article_topic_id NOT IN ({_keepers('article_topic', 'article_topic_id', topic_key)})"
+    connection.execute(
+        text(
+            f"UPDATE customer_article_topic SET article_topic_id = "
+            f"{_replacement('article_topic', 'article_topic_id', topic_key, 'customer_article_topic.article_topic_id')} "
+            f"WHERE article_topic_id IN ({duplicate_topics})"
+        )
+    )
+    connection.execute(
+        text(
+            f"DELETE FROM lesson_completion WHERE lesson_id IN "
+            f"(SELECT lesson_id FROM lesson WHERE article_topic_id IN ({duplicate_topics}))"
+        )
+    )
+    connection.execute(text(f"DELETE FROM lesson WHERE article_topic_id IN ({duplicate_topics})"))
+    delete_duplicates("article_topic", "article_topic_id", topic_key)
+
+    lesson_key = ["article_topic_id", "order_num"]
+    duplicate_lessons = f"SELECT lesson_id FROM lesson WHERE lesson_id NOT IN ({_keepers('lesson', 'lesson_id', lesson_key)})"
+    connection.execute(
+        text(
+            f"UPDATE lesson_completion SET lesson_id = "
+            f"{_replacement('lesson', 'lesson_id', lesson_key, 'lesson_completion.lesson_id')} "
+            f"WHERE lesson_id IN ({duplicate_lessons})"
+        )
+    )
+    delete_duplicates("lesson", "lesson_id", lesson_key)
+
+    delete_duplicates("lesson_completion", "lesson_completion_id", ["customer_session_id", "lesson_id"])
+    return {table: count for table, count in removed.items() if count}
+
+
+def _missing_unique_keys(inspector) -> list:
+    missing = []
+    for table, columns in UNIQUE_KEYS:
+        unique_sets = [set(c["column_names"]) for c in inspector.get_unique_constraints(table.name)]
+        unique_sets += [set(i["column_names"]) for i in inspector.get_indexes(table.name) if i["unique"]]
+        if set(columns) not in unique_sets:
+            missing.append((table, columns))
+    return missing
+
+
+def _add_unique_keys(connection, missing) -> list[str]:
+    added = []
+    for table, columns in missing:
+        name = f"uq_{table.name}_{'_'.join(columns)}"
+        connection.execute(text(f"CREATE UNIQUE INDEX {name} ON {table.name} ({', '.join(columns)})"))
+        added.append(name)
+    return added
+
+
+def upgrade_schema() -> dict:
+    """Bring tables created by older versions up to the current models: add missing
+    columns, fingerprint existing articles, and add the unique keys, first merging
+    rows that would violate them. Runs in one transaction, and only scans for
+    duplicates while a unique key is missing, so a rerun on an upgraded database
+    is cheap.
+
+    Call inside an app context after db.create_all(), once per release rather than
+    from every replica, since concurrent runs race to create the same indexes.
+
+    Returns:
+    --------
+    dict
+        What was changed: columns and keys added, articles fingerprinted and
+        merged, and duplicate rows removed per table.
+    """
+    with db.engine.begin() as connection:
+        inspector = sqlalchemy.inspect(connection)
+        columns = _add_missing_columns(connection, inspector)
+        fingerprinted, merged = _backfill_content_hash(connection)
+        missing_keys = _missing_unique_keys(inspector)
+        removed = _merge_duplicates(connection) if missing_keys else {}
+        keys = _add_unique_keys(connection, missing_keys)
+    report = {
+        "columns": columns,
+        "fingerprinted": fingerprinted,
+        "merged_articles": merged,
+        "removed_duplicates": removed,
+        "unique_keys": keys,
+    }
+    logger.info("Schema upgrade: %s", report)
+    return report
@@ -2,18 +2,71 @@ import inspect
 import json
 import logging
 import os
+import time
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from json import JSONDecodeError
-from string import Template
+from typing import Iterator
 
 import openai
-import yaml
 from dotenv import find_dotenv, load_dotenv
 
+from edutainment.chunking import estimate_tokens, select_relevant_chunks, split_into_chunks
+from edutainment.embeddings import PassageIndex
+from edutainment.json_stream import JSONArrayItemParser
+from edutainment.llm_client import BaseCompletionClient, get_default_claude_client, get_default_client
+from edutainment.llm_cache import BaseResponseCache, get_default_cache, response_cache_key
+from edutainment.prompts import get_prompt_registry
+from edutainment.tracing import describe_text, in_current_context, record_stage, stage
+
 logger = logging.getLogger(__name__)
 
 _ = load_dotenv(find_dotenv())
 
+# Articles longer than this are split into segments whose topics are extracted
+# separately and then merged
+TOPIC_SEGMENT_TOKENS = int(os.getenv("TOPIC_SEGMENT_TOKENS", "10000"))
+# Size of the passages that get_lessons picks from, and how many tokens of them it sends
+PASSAGE_TOKENS = int(os.getenv("PASSAGE_TOKENS", "500"))
+LESSON_CONTEXT_TOKENS = int(os.getenv("LESSON_CONTEXT_TOKENS", "3000"))
+# Cap on the topics merged from a segmented article; a single segment keeps all its topics
+MAX_TOPICS = int(os.getenv("MAX_TOPICS", "6"))
+# Topics per get_lessons_batch completion; bounded by the model's output length
+LESSON_BATCH_TOPICS = int(os.getenv("LESSON_BATCH_TOPICS", "4"))
+TOPIC_MAP_WORKERS = 4
+
+RELEVANCE_RANK = {"low": 0, "medium": 1, "high": 2}
+LESSON_KEYS = ("lesson", "question", "right_answer", "wrong_answer", "right_answer_explanation")
+
+
+def _message_tokens(messages: list[dict]) -> int:
+    return sum(estimate_tokens(m["content"]) for m in messages)
+
+
+def merge_topics(topic_lists: list[list[dict]], max_topics: int = MAX_TOPICS) -> list[str]:
+    """Merge topics extracted from separate segments of an article.
+
+    Topics with the same name (ignoring case) are combined, keeping their highest
+    relevance. Medium and high relevance topics are returned. With several segments
+    they are ranked by relevance and then by how many segments mention them, and at
+    most max_topics are kept; a single segment's topics keep their order, uncapped.
+    """
+    merged = {}
+    for topics in topic_lists:
+        for t in topics:
+            key = " ".join(t["topic"].split()).casefold()
+            rank = RELEVANCE_RANK.get(t["relevance_to_subject"], 0)
+            if key not in merged:
+                merged[key] = {"topic": t["topic"], "rank": rank, "count": 0, "order": len(merged)}
+            merged[key]["rank"] = max(merged[key]["rank"], rank)
+            merged[key]["count"] += 1
+
+    relevant = [m for m in merged.values() if m["rank"] >= RELEVANCE_RANK["medium"]]
+    if len(topic_lists) == 1:
+        return [m["topic"] for m in relevant]
+    ranked = sorted(relevant, key=lambda m: (-m["rank"], -m["count"], m["order"]))
+    return [m["topic"] for m in ranked[:max_topics]]
+
 
 class BaseLessonText(ABC):
     """Represents a lesson for learning an article.
@@ -70,48 +123,140 @@ class BaseLessonText(ABC):
         """
         pass
 
+    def stream_lessons(self, topic) -> Iterator[dict[str, str]]:
+        """Yield the lessons of `get_lessons` one at a time.
+
+        Backends that can stream completions yield each lesson as soon as it has been
+        generated, so callers can start working on it before the rest arrive. This
+        default just yields from `get_lessons`.
+        """
+        yield from self.get_lessons(topic)
+
+    def get_lessons_batch(self, topics: list[str]) -> dict[str, list[dict[str, str]]]:
+        """Return {topic: lessons} for several topics.
+
+        Backends that can write lessons for many topics in one completion override this
+        to save round trips and repeated input tokens. This default calls `get_lessons`
+        per topic.
+        """
+        return {topic: self.get_lessons(topic) for topic in topics}
+
+
+class PromptLessonText(BaseLessonText):
+    """Lesson text from a chat model prompted with the templates in llm_prompts.yml.
+
+    Subclasses pick the model and the completion client.
+    """
+
+    default_model: str
+
+    @staticmethod
+    @abstractmethod
+    def default_client() -> BaseCompletionClient:
+        pass
 
-class GPTLessonText(BaseLessonText):
     def __init__(
         self,
         article_text: str,
-        model="gpt-3.5-turbo-16k",
+        model=None,
         temperature=0.6,
-        prompt_yml="llm_prompts.yml",
+        prompt_yml: str = None,
+        cache: BaseResponseCache = None,
+        topic_segment_tokens: int = TOPIC_SEGMENT_TOKENS,
+        passage_tokens: int = PASSAGE_TOKENS,
+        lesson_context_tokens: int = LESSON_CONTEXT_TOKENS,
+        passage_index: PassageIndex = None,
+        client: BaseCompletionClient = None,
     ) -> None:
-        """Initialize with cleaned text from article."""
+        """Initialize with cleaned text from article.
+
+        Responses are cached by their rendered messages and model parameters; pass a
+        BaseResponseCache to override the process-wide default.
+
+        Long articles are never sent whole: topics are extracted per segment of
+        topic_segment_tokens and merged, and each get_lessons call only sends the
+        passages most relevant to its topic, up to lesson_context_tokens. Passages are
+        ranked by embedding similarity when a passage_index built from get_passages()
+        is set, and by keyword overlap otherwise.
+
+        Prompts come precompiled from the process-wide registry for prompt_yml
+        (LLM_PROMPTS_PATH by default), which reloads the file when it changes.
+        """
 
         openai.api_key = os.getenv("OPENAI_API_KEY")
         self.article_text = article_text
-        self.model = model
+        self.model = model or self.default_model
         self.temperature = temperature
-        with open("llm_prompts.yml") as f:
-            self.prompts = yaml.safe_load(f)[self.model]
+        self.cache = cache if cache is not None else get_default_cache()
+        self.client = client or self.default_client()
+        self.topic_segment_tokens = topic_segment_tokens
+        self.passage_tokens = passage_tokens
+        self.lesson_context_tokens = lesson_context_tokens
+        self.passage_index = passage_index
+        self._passages = None
+        self.prompts = get_prompt_registry(prompt_yml).get(self.model)
+
+    def _complete(self, messages, parse):
+        """Return parse(response content), serving the content from cache if possible.
+
+        Only responses that parse successfully are cached, so a malformed completion
+        is retried on the next request instead of being replayed.
+        """
+        key = response_cache_key(self.model, messages, temperature=self.temperature)
+        content = self.cache.get(key)
+        if content is not None:
+            return parse(content)
+
+        with stage("llm_completion", model=self.model) as span:
+            content = self.client.complete(self.model, messages, temperature=self.temperature)
+            span.set(tokens=_message_tokens(messages) + estimate_tokens(content), bytes=len(content))
+        result = parse(content)
+        self.cache.set(key, content)
+        return result
 
     def get_topics(self):
-        system_prompt = self.prompts["system_prompt"]
-        topics_prompt = Template(self.prompts["topics_prompt"]).substitute(
-            article=self.article_text
+        if estimate_tokens(self.article_text) <= self.topic_segment_tokens:
+            topic_lists = [self._get_segment_topics(self.article_text)]
+        else:
+            # Map: extract topics per segment; reduce: merge them
+            segments = split_into_chunks(self.article_text, self.topic_segment_tokens)
+            with ThreadPoolExecutor(max_workers=TOPIC_MAP_WORKERS) as executor:
+                topic_lists = list(executor.map(in_current_context(self._try_get_segment_topics), segments))
+            if not any(topic_lists):
+                raise KeyError("No topics could be extracted from any article segment.")
+        return merge_topics(topic_lists)
+
+    def _get_segment_topics(self, segment):
+        system_prompt = self.prompts.system_prompt
+        topics_prompt = self.prompts.topics_prompt.substitute(
+            article=segment
         )
 
         messages = [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": topics_prompt},
         ]
-        topics_response = openai.ChatCompletion.create(
-            model=self.model,
-            messages=messages,
-            temperature=self.temperature,
-        )
+        return self._complete(messages, self._parse_topics)
+
+    def _try_get_segment_topics(self, segment):
+        try:
+            return self._get_segment_topics(segment)
+        except KeyError as e:
+            logger.error("Skipping article segment: %s", e)
+            return []
 
-        topics_response_content = topics_response.choices[0].message.content.strip()
+    @staticmethod
+    def _parse_topics(topics_response_content):
+        """Return the topics as dicts with "topic" and "relevance_to_subject" keys."""
+        topics_json = None
         try:
             topics_json = json.loads(topics_response_content)["topics"]
 
             topics = []
             for t in topics_json:
-                if t["relevance_to_subject"] in ["medium", "high"]:
-                    topics.append(t["topic"])
+                topics.append(
+                    {"topic": t["topic"], "relevance_to_subject": t["relevance_to_subject"]}
+                )
         except KeyError as e:
             logger.error(
                 "Expected key missing in GPT-generated json:\n%s",
@@ -126,34 +271,198 @@ class GPTLessonText(BaseLessonText):
             raise KeyError("GPT response not formatted as json.") from e
         return topics
 
-    def get_lessons(self, topic):
-        system_prompt = self.prompts["system_prompt"]
-        lessons_prompt = Template(self.prompts["lessons_prompt"]).substitute(
-            article=self.article_text,
+    def get_passages(self) -> list[str]:
+        """Return the passages get_lessons picks from; empty if the whole article fits
+        in a lesson prompt."""
+        if estimate_tokens(self.article_text) <= self.lesson_context_tokens:
+            return []
+        if self._passages is None:
+            self._passages = split_into_chunks(self.article_text, self.passage_tokens)
+        return self._passages
+
+    def _relevant_passages(self, topic) -> list[str]:
+        if self.passage_index is not None:
+            return self.passage_index.select(topic, self.lesson_context_tokens)
+        return select_relevant_chunks(self.get_passages(), topic, self.lesson_context_tokens)
+
+    def get_lesson_context(self, topic) -> str:
+        """Return the part of the article to send when writing lessons on topic."""
+        if not self.get_passages():
+            return self.article_text
+        return "\n\n".join(self._relevant_passages(topic))
+
+    def get_batch_context(self, topics) -> str:
+        """Return the part of the article to send when writing lessons on all of topics:
+        the union of each topic's passages, each passage sent once."""
+        if not self.get_passages():
+            return self.article_text
+        passages = []
+        for topic in topics:
+            passages.extend(self._relevant_passages(topic))
+        return "\n\n".join(dict.fromkeys(passages))
+
+    def _lessons_messages(self, topic):
+        system_prompt = self.prompts.system_prompt
+        lessons_prompt = self.prompts.lessons_prompt.substitute(
+            article=self.get_lesson_context(topic),
             topic=topic,
         )
-        messages = [
+        return [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": lessons_prompt},
         ]
-        lessons_response = openai.ChatCompletion.create(
+
+    def get_lessons(self, topic):
+        return self._complete(self._lessons_messages(topic), self._parse_lessons)
+
+    def get_lessons_batch(self, topics):
+        """Write lessons for LESSON_BATCH_TOPICS topics per completion, running the
+        completions concurrently.
+
+        Topics missing or malformed in a batch response are retried with their own
+        get_lessons call, so one bad entry never costs the rest of the batch; topics
+        that still fail are left out of the result. Without a batch_lessons_prompt
+        this is the per-topic default.
+        """
+        if self.prompts.batch_lessons_prompt is None:
+            return super().get_lessons_batch(topics)
+
+        lessons = {}
+        batches = [topics[i : i + LESSON_BATCH_TOPICS] for i in range(0, len(topics), LESSON_BATCH_TOPICS)]
+        with ThreadPoolExecutor(max_workers=min(len(batches), TOPIC_MAP_WORKERS) or 1) as executor:
+            for batch_lessons in executor.map(in_current_context(self._get_lesson_batch), batches):
+                lessons.update(batch_lessons)
+
+        missing = [t for t in topics if t not in lessons]
+        if missing:
+            logger.warning("Falling back to per-topic lessons for %d topics", len(missing))
+            with ThreadPoolExecutor(max_workers=TOPIC_MAP_WORKERS) as executor:
+                fallback = executor.map(in_current_context(self._try_get_lessons), missing)
+                for topic, topic_lessons in zip(missing, fallback):
+                    if topic_lessons is not None:
+                        lessons[topic] = topic_lessons
+        return {t: lessons[t] for t in topics if t in lessons}
+
+    def _try_get_lessons(self, topic):
+        try:
+            return self.get_lessons(topic)
+        except Exception as e:
+            logger.error("Skipping lessons for a topic: %s", e)
+            return None
+
+    def _batch_lessons_messages(self, topics):
+        batch_lessons_prompt = self.prompts.batch_lessons_prompt.substitute(
+            article=self.get_batch_context(topics),
+            topics="\n".join(f"- {t}" for t in topics),
+        )
+        return [
+            {"role": "system", "content": self.prompts.system_prompt},
+            {"role": "user", "content": batch_lessons_prompt},
+        ]
+
+    def _get_lesson_batch(self, topics):
+        """Return {topic: lessons} for the topics a single completion got right.
+
+        The response is only cached if it covers every topic.
+        """
+        messages = self._batch_lessons_messages(topics)
+        key = response_cache_key(self.model, messages, temperature=self.temperature)
+        content = self.cache.get(key)
+        if content is not None:
+            return self._parse_lesson_batch(content, topics)
+
+        try:
+            with stage("llm_completion", model=self.model, batch=len(topics)) as span:
+                content = self.client.complete(self.model, messages, temperature=self.temperature)
+                span.set(tokens=_message_tokens(messages) + estimate_tokens(content), bytes=len(content))
+        except Exception as e:
+            logger.error("Batch lesson completion failed: %s", e)
+            return {}
+        lessons = self._parse_lesson_batch(content, topics)
+        if len(lessons) == len(topics):
+            self.cache.set(key, content)
+        return lessons
+
+    @staticmethod
+    def _parse_lesson_batch(content, topics):
+        """Split a batch response into {topic: lessons}, leaving out topics that are
+        missing, unrecognized or have malformed lessons."""
+        try:
+            entries = json.loads(content)["topics"]
+            if not isinstance(entries, list):
+                raise TypeError("topics is not a list")
+        except (KeyError, TypeError, json.JSONDecodeError) as e:
+            logger.error("Malformed batch lessons response (%s): %s", describe_text(content), e)
+            return {}
+
+        by_name = {t.strip().casefold(): t for t in topics}
+        lessons = {}
+        for entry in entries:
+            try:
+                topic = by_name.get(str(entry["topic"]).strip().casefold())
+                topic_lessons = entry["instruction"]
+                if topic is None or not topic_lessons:
+                    continue
+                if all(isinstance(l, dict) and all(k in l for k in LESSON_KEYS) for l in topic_lessons):
+                    lessons[topic] = topic_lessons
+            except (KeyError, TypeError):
+                continue
+        return lessons
+
+    def stream_lessons(self, topic):
+        """Yield each lesson as soon as its JSON object is complete in the streamed
+        completion. The full response is validated and cached once it has ended."""
+        messages = self._lessons_messages(topic)
+        key = response_cache_key(self.model, messages, temperature=self.temperature)
+        content = self.cache.get(key)
+        if content is not None:
+            yield from self._parse_lessons(content)
+            return
+
+        pieces = []
+        parser = JSONArrayItemParser("instruction")
+        # A generator cannot hold a span open across yields, so time it by hand
+        started = time.perf_counter()
+        try:
+            for piece in self.client.stream(self.model, messages, temperature=self.temperature):
+                pieces.append(piece)
+                for lesson in parser.feed(piece):
+                    missing = [k for k in LESSON_KEYS if k not in lesson]
+                    if missing:
+                        logger.error("Expected keys %s missing in GPT-generated lesson", missing)
+                        raise KeyError("Expected key missing in GPT-generated json.")
+                    yield lesson
+        except Exception as e:
+            record_stage("llm_completion", time.perf_counter() - started, e, model=self.model, stream=True)
+            raise
+
+        content = "".join(pieces).strip()
+        record_stage(
+            "llm_completion",
+            time.perf_counter() - started,
             model=self.model,
-            messages=messages,
-            temperature=self.temperature,
+            stream=True,
+            tokens=_message_tokens(messages) + estimate_tokens(content),
+            bytes=len(content),
         )
-        lessons_response_content = lessons_response.choices[0].message.content.strip()
+        self._parse_lessons(content)
+        self.cache.set(key, content)
 
+    @staticmethod
+    def _parse_lessons(lessons_response_content):
         try:
             lessons_json = json.loads(lessons_response_content)["instruction"]
         except KeyError as e:
             logger.error(
-                "Expected key missing in GPT-generated json:\n%s",
-                str(lessons_json),
+                "Expected key missing in GPT-generated json (%s): %.200s",
+                describe_text(lessons_response_content),
+                lessons_response_content,
             )
             raise KeyError("Expected key missing in GPT-generated json.") from e
         except json.JSONDecodeError as e:
             logger.error(
-                "GPT response not formatted as json:",
+                "GPT response not formatted as json (%s): %.200s",
+                describe_text(lessons_response_content),
                 lessons_response_content,
             )
             raise KeyError("GPT response not formatted as json.") from e
@@ -161,6 +470,17 @@ class GPTLessonText(BaseLessonText):
         return lessons_json
 
 
-class ClaudeLessonText(BaseLessonText):
-    def get_topics(self):
-        pass
+class GPTLessonText(PromptLessonText):
+    default_model = "gpt-3.5-turbo-16k"
+
+    @staticmethod
+    def default_client():
+        return get_default_client()
+
+
+class ClaudeLessonText(PromptLessonText):
+    default_model = "claude-2.1"
+
+    @staticmethod
+    def default_client():
+        return get_default_claude_client()
@@ -0,0 +1,252 @@
+import functools
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+
+from dotenv import find_dotenv, load_dotenv
+
+logger = logging.getLogger(__name__)
+
+_ = load_dotenv(find_dotenv())
+
+# Recent durations kept per stage for percentiles
+STAGE_SAMPLES = 10000
+# Upper bounds of the /metrics duration histogram buckets, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# Append every finished span to this file as a JSON line, if set
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH")
+
+_current_span = ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed run of a pipeline stage.
+
+    Attributes are free-form; numeric "bytes" and "tokens" attributes are also summed
+    per stage for /metrics. Spans started while another is current in the same thread
+    (or context) share its trace id and record it as their parent.
+    """
+
+    def __init__(self, name: str, parent: "Span" = None, **attributes) -> None:
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.outcome = "ok"
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.seconds = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def finish(self, error: BaseException = None) -> None:
+        self.seconds = time.perf_counter() - self._started
+        if error is not None:
+            self.outcome = "error"
+            self.attributes["error"] = type(error).__name__
+        _timer.record(self)
+        if _exporter is not None:
+            _exporter.export(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "started_at": self.started_at,
+            "seconds": self.seconds,
+            "outcome": self.outcome,
+            "attributes": self.attributes,
+        }
+
+
+class StageTimer:
+    """Process-wide aggregates of finished spans per stage: counts by outcome, a
+    duration histogram, byte and token totals, and the most recent STAGE_SAMPLES
+    durations for percentiles."""
+
+    def __init__(self, samples: int = STAGE_SAMPLES) -> None:
+        self.samples = samples
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def record(self, span: Span) -> None:
+        with self._lock:
+            stage = self._stages.get(span.name)
+            if stage is None:
+                stage = self._stages[span.name] = {
+                    "count": 0,
+                    "errors": 0,
+                    "seconds_total": 0.0,
+                    "buckets": [0] * len(DURATION_BUCKETS),
+                    "bytes_total": 0,
+                    "tokens_total": 0,
+                    "recent": deque(maxlen=self.samples),
+                }
+            stage["count"] += 1
+            stage["errors"] += 0 if span.outcome == "ok" else 1
+            stage["seconds_total"] += span.seconds
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if span.seconds <= bound:
+                    stage["buckets"][i] += 1
+            stage["bytes_total"] += span.attributes.get("bytes", 0)
+            stage["tokens_total"] += span.attributes.get("tokens", 0)
+            stage["recent"].append(span.seconds)
+
+    def snapshot(self) -> dict:
+        """Return a copy of the aggregates, by stage name, with recent as a list."""
+        with self._lock:
+            return {
+                name: {**stage, "buckets": list(stage["buckets"]), "recent": list(stage["recent"])}
+                for name, stage in self._stages.items()
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages.clear()
+
+
+class TraceExporter:
+    """Appends finished spans to a file as JSON lines."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), default=str)
+        try:
+            with self._lock, open(self.path, "a") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            logger.error("Unable to export span to %s: %s", self.path, e)
+
+
+_timer = StageTimer()
+_exporter = TraceExporter(TRACE_EXPORT_PATH) if TRACE_EXPORT_PATH else None
+
+
+def get_stage_timer() -> StageTimer:
+    return _timer
+
+
+def start_span(name: str, **attributes) -> tuple[Span, object]:
+    """Start a span and make it current. Pass both return values to end_span."""
+    span = Span(name, _current_span.get(), **attributes)
+    return span, _current_span.set(span)
+
+
+def end_span(span: Span, token, error: BaseException = None) -> None:
+    _current_span.reset(token)
+    span.finish(error)
+
+
+@contextmanager
+def stage(name: str, **attributes):
+    """Time the enclosed block as one span of the named stage, yielding the Span so
+    the block can add attributes."""
+    span, token = start_span(name, **attributes)
+    try:
+        yield span
+    except BaseException as e:
+        end_span(span, token, e)
+        raise
+    end_span(span, token)
+
+
+def record_stage(name: str, seconds: float, error: BaseException = None, **attributes) -> None:
+    """Record an already measured span, for code that cannot wrap a block, such as
+    generators and connection event hooks."""
+    span = Span(name, _current_span.get(), **attributes)
+    span._started = time.perf_counter() - seconds
+    span.started_at = time.time() - seconds
+    span.finish(error)
+
+
+def in_current_context(fn):
+    """Wrap fn so each call runs in a copy of the caller's context. Work handed to a
+    thread pool loses the current span otherwise, and its spans start new traces."""
+    context = copy_context()
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+
+    return run
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile of values, q in [0, 100]; None if values is empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def describe_text(text: str) -> str:
+    """Summarize text for logs by size and hash instead of content."""
+    data = (text or "").encode("utf-8")
+    return f"{len(data)} bytes, sha256 {hashlib.sha256(data).hexdigest()[:12]}"
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: dict) -> str:
+    return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels.items()) + "}"
+
+
+def render_prometheus(
+    gauges: dict[str, float] = None,
+    counters: dict[str, list[tuple[dict, float]]] = None,
+) -> str:
+    """Render the stage aggregates, and any extra gauges and counters, in the
+    Prometheus text exposition format. Counters map a metric name to its
+    (labels, value) samples. Figures are for this worker process only."""
+    snapshot = _timer.snapshot()
+    lines = [
+        "# HELP edutainment_stage_duration_seconds Wall-clock duration of pipeline stages.",
+        "# TYPE edutainment_stage_duration_seconds histogram",
+    ]
+    for name, stage in sorted(snapshot.items()):
+        for bound, count in zip(DURATION_BUCKETS, stage["buckets"]):
+            labels = _format_labels({"stage": name, "le": bound})
+            lines.append(f"edutainment_stage_duration_seconds_bucket{labels} {count}")
+        labels = _format_labels({"stage": name, "le": "+Inf"})
+        lines.append(f"edutainment_stage_duration_seconds_bucket{labels} {stage['count']}")
+        labels = _format_labels({"stage": name})
+        lines.append(f"edutainment_stage_duration_seconds_sum{labels} {stage['seconds_total']}")
+        lines.append(f"edutainment_stage_duration_seconds_count{labels} {stage['count']}")
+
+    for metric, key, help_text in (
+        ("edutainment_stage_errors_total", "errors", "Pipeline stage runs that raised."),
+        ("edutainment_stage_bytes_total", "bytes_total", "Bytes processed by pipeline stages."),
+        ("edutainment_stage_tokens_total", "tokens_total", "Estimated LLM tokens by pipeline stage."),
+    ):
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} counter")
+        for name, stage in sorted(snapshot.items()):
+            lines.append(f"{metric}{_format_labels({'stage': name})} {stage[key]}")
+
+    for name, samples in sorted((counters or {}).items()):
+        lines.append(f"# TYPE {name} counter")
+        for labels, value in samples:
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    for name, value in sorted((gauges or {}).items()):
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -1,4 +1,11 @@
-import io
+import time
+
+# Measured from the first import of this module, see STARTUP_BUDGET_SECONDS
+_startup_started = time.perf_counter()
+
+import functools
+import hashlib
+import hmac
 import json
 import logging
 import os
@@ -6,42 +13,126 @@ import tempfile
 from datetime import datetime
 from pathlib import Path
 
+import click
 import yaml
 from bs4 import BeautifulSoup
 from dotenv import find_dotenv, load_dotenv
-from flask import Flask, jsonify, request
+from flask import Blueprint, Flask, Response, current_app, g, jsonify, request, stream_with_context
+from flask.cli import with_appcontext
 from flask_bcrypt import Bcrypt
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
-from flask_sqlalchemy import SQLAlchemy
-from PyPDF2 import PdfReader
+from PyPDF2.errors import PdfReadError
 from sqlalchemy import text
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
 
 from config import debug_status, whitelist_origins
 from debug import debug_only
 
+from edutainment.courses import get_course_cache, get_course_json
+from edutainment.database import db, pool_metrics
+from edutainment.ingest import (
+    INGEST_JOB_MAX_WORKERS,
+    INGEST_JOBS_DB_PATH,
+    INGEST_MAX_ARTICLES,
+    ingest,
+    run_ingest_job,
+    spool_archive,
+)
+from edutainment.jobs import JobQueue, JobStore
+from edutainment.lesson_planner import LessonPlan, forget_audio
+from edutainment.llm_cache import get_default_cache
 from edutainment.narration import get_narration
-from edutainment.text import GPTLessonText
-from gpt_utils import test
-from video import get_course_videos
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
+from edutainment.narration_cache import file_etag, get_cache, is_content_addressed
+from edutainment.pdf import PDFLimitError, extract_text, spool_to_file
+from edutainment.progress import PROGRESS_FLUSH_SECONDS, CompletionBuffer, ProgressBufferFull
+from edutainment.prompts import get_prompt_registry
+from edutainment.schema import upgrade_schema
+from edutainment.tracing import describe_text, end_span, render_prometheus, stage, start_span
 from config import Config
 #from flask_migrate import Migrate
-from flask import send_from_directory
+from flask import send_file
 
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
-app = Flask(__name__)
-app.config.from_object(Config)
-CORS(app, origins=whitelist_origins)
-db = SQLAlchemy(app)
-#migrate = Migrate(app, db)
-
-with app.app_context():
+routes = Blueprint("edutainment", __name__)
+
+IMMUTABLE_MAX_AGE_SECONDS = 365 * 24 * 3600
+
+
+def create_app(config=Config):
+    """Build the Flask app. Nothing here talks to the database, so workers boot fast;
+    create the tables once per deployment with `flask --app server init-db`."""
+    app = Flask(__name__)
+    app.config.from_object(config)
+    CORS(app, origins=whitelist_origins)
+    db.init_app(app)
+    #migrate = Migrate(app, db)
+    app.extensions["course_jobs"] = JobQueue()
+    app.extensions["ingest_jobs"] = JobQueue(
+        JobStore(INGEST_JOBS_DB_PATH), max_workers=INGEST_JOB_MAX_WORKERS, name="ingest-jobs"
+    )
+    app.extensions["lesson_progress"] = CompletionBuffer(app)
+    get_cache().on_evict = functools.partial(forget_audio, app)
+    # Load and validate the prompts before serving, so a broken llm_prompts.yml fails the boot
+    app.extensions["prompts"] = get_prompt_registry()
+    app.register_blueprint(routes)
+    app.before_request(_start_request_span)
+    app.teardown_request(_end_request_span)
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(ingest_command)
+    return app
+
+
+def _start_request_span():
+    rule = request.url_rule.rule if request.url_rule else "unmatched"
+    g.request_span = start_span("http_request", route=rule, method=request.method)
+
+
+def _end_request_span(error=None):
+    request_span = g.pop("request_span", None)
+    if request_span is not None:
+        end_span(*request_span, error=error)
+
+
+@click.command("init-db")
+@with_appcontext
+def init_db_command():
+    """Create any missing tables and upgrade ones created by older versions."""
     db.create_all()
+    click.echo("Database tables created.")
+    report = upgrade_schema()
+    click.echo(f"Schema upgraded: {json.dumps(report)}")
+
+
+@click.command("ingest")
+@click.argument("path", type=click.Path(exists=True))
+@click.option("--workers", type=int, default=INGEST_MAX_ARTICLES, show_default=True, help="Articles processed at once.")
+@click.option("--report", "report_path", type=click.Path(), help="Write the JSON report here.")
+@with_appcontext
+def ingest_command(path, workers, report_path):
+    """Generate courses for every PDF in a directory or zip/tar archive.
+
+    Safe to rerun: complete courses are skipped and partial ones resume.
+    """
+    report = ingest(
+        current_app._get_current_object(),
+        path,
+        max_articles=workers,
+        on_result=lambda result, _: click.echo(
+            f"{result['status']:>8}  {result['article']}  "
+            f"{result['lessons']} lessons in {result['seconds']}s  {result.get('error', '')}"
+        ),
+    )
+    click.echo(json.dumps(report["summary"]))
+    if report_path:
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+    if report["summary"]["failed"]:
+        raise SystemExit(1)
+
 
 def sanitize_html(html_input):
     # Remove leading/trailing white space and control characters
@@ -80,22 +171,105 @@ def sanitize_cv(cv_text):
 
 
 def extract_text_from_pdf(pdf_file):
-    reader = PdfReader(io.BytesIO(pdf_file.read()))
+    with stage("pdf_extract") as span:
+        text = extract_text(pdf_file)
+        span.set(bytes=len(text.encode("utf-8")))
+    return text
 
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text()
 
-    return text
+def iter_course(article_text, article_filename, session_id, age, expertise):
+    """Run the LessonPlan pipeline, yielding results as soon as they exist.
+
+    Yields ("topics", topics, article_id) once, then ("lessons", topic, lessons) for
+    each topic in completion order; lessons is None for a topic that failed.
+    """
+    lesson_plan = LessonPlan(
+        session_id=session_id,
+        article_filename=article_filename,
+        article_text=article_text,
+        age=int(age) if age else None,
+        debug=True if os.getenv("DEBUG") == "TRUE" else False,
+    )
+
+    topics = lesson_plan.get_topics()
+    if topics is None:
+        raise RuntimeError("Topic generation failed")
+    yield "topics", topics, lesson_plan.article_id
+
+    for topic_name, topic_lessons in lesson_plan.iter_lessons(topics, expertise):
+        yield "lessons", topic_name, topic_lessons
+
+
+def build_course(
+    article_text,
+    article_filename,
+    session_id,
+    age,
+    expertise,
+    on_topics=None,
+    on_lessons=None,
+):
+    """Run the LessonPlan pipeline and return {topic: lessons}.
+
+    on_topics(topics, article_id) is called once the topics are known, and
+    on_lessons(topic, lessons) as each topic's lessons finish.
+    """
+    topics = []
+    lessons = {}
+    for event in iter_course(article_text, article_filename, session_id, age, expertise):
+        if event[0] == "topics":
+            _, topics, article_id = event
+            if on_topics:
+                on_topics(topics, article_id)
+        else:
+            _, topic_name, topic_lessons = event
+            lessons[topic_name] = topic_lessons
+            if on_lessons:
+                on_lessons(topic_name, topic_lessons)
+    return {t: lessons.get(t) for t in topics}
+
+
+def run_course_job(progress, app, pdf_path, article_filename, session_id, age, expertise):
+    """Job body for /generate-course/jobs; removes the spooled PDF when done."""
+    with app.app_context():
+        return _run_course_job(progress, pdf_path, article_filename, session_id, age, expertise)
+
+
+def _run_course_job(progress, pdf_path, article_filename, session_id, age, expertise):
+    try:
+        with open(pdf_path, "rb") as pdf_file:
+            article_text = sanitize_cv(extract_text_from_pdf(pdf_file))
+    finally:
+        os.remove(pdf_path)
+
+    topic_status = {}
+
+    def on_topics(topics, article_id):
+        topic_status.update({t: "pending" for t in topics})
+        progress(article_id=article_id, topics=topic_status)
+
+    def on_lessons(topic_name, topic_lessons):
+        topic_status[topic_name] = "done" if topic_lessons is not None else "failed"
+        progress(topics=topic_status)
+
+    return build_course(
+        article_text,
+        article_filename,
+        session_id,
+        age,
+        expertise,
+        on_topics=on_topics,
+        on_lessons=on_lessons,
+    )
 
 
 # Just for testing connection with backend; debugging purpose only
-@app.route("/test", methods=["GET"])
+@routes.route("/test", methods=["GET"])
 def hello():
     return "Hello!"
 
 
-@app.route("/generate-course", methods=["POST"])
+@routes.route("/generate-course", methods=["POST"])
 def generate_course():
     try:
         # Extracting the PDF file
@@ -109,70 +283,305 @@ def generate_course():
         expertise = request.form.get("expertise")
         topic = request.form.get("change_topic")
 
-        logging.info(expertise)
-
         article_text = extract_text_from_pdf(article)
         article_text = sanitize_cv(article_text)
+        logger.info(
+            "Generating course from %s (%s), expertise %s",
+            article_filename,
+            describe_text(article_text),
+            expertise,
+        )
+
+        lessons = build_course(
+            article_text, article_filename, user_session_id, age, expertise
+        )
+        logger.info(
+            "Generated %d lessons on %d topics",
+            sum(len(l) for l in lessons.values() if l),
+            len(lessons),
+        )
+
+    except PDFLimitError as e:
+        logging.error(str(e))
+        return jsonify({"error": str(e)}), 413
+    except PdfReadError as e:
+        logging.error(str(e))
+        return jsonify({"error": "Could not read the PDF"}), 400
+    except Exception as e:
+        logging.error(str(e))
+        return jsonify({"error": "Something went wrong"}), 500
 
-        lesson_generator = GPTLessonText(article_text)
-
-        # lessons = lesson_generator.get_lessons(topic)
-        lessons = ["a lesson"]
-
-        for lesson in lessons:
-            # get_narration(lesson["lesson"])
-            logging.info(lesson)
-
-        # lessons = get_course_videos(lessons)
-
-        ### Not yet functional below here
-        print("here?")
-        print(user_session_id)
-        print(article_filename)
-        print(article_text)
-        print(age)
-        from edutainment.lesson_planner import LessonPlan
-        with app.app_context():
-            lesson_plan = LessonPlan(
-                session_id=user_session_id,
-                article_filename=article_filename,
-                article_text=article_text,
-                age=int(age),
-                debug=True if os.getenv("DEBUG") == "TRUE" else False,
-            )
+    return jsonify(lessons), 200
 
-        print("here2")
-        topics = lesson_plan.get_topics()
-        lessons = {}
-        print("here3")
-        print(topics)
-        for t in topics:
-            lessons[t] = lesson_plan.get_lessons(t, expertise)
-            print("t")
-            print(t)
-        print("here5")
-        print(lessons)
 
+@routes.route("/generate-course/stream", methods=["POST"])
+def stream_course():
+    """Generate a course as newline-delimited JSON.
+
+    Emits {"type": "topics", ...} as soon as the topics are known, then one
+    {"type": "lessons", ...} line per topic as it finishes, and a final
+    {"type": "done"} (or {"type": "error"}) line.
+    """
+    article = request.files.get("selectedFile")
+    if not article:
+        return jsonify({"error": "No file uploaded"}), 400
+
+    try:
+        article_text = sanitize_cv(extract_text_from_pdf(article))
+    except PDFLimitError as e:
+        logging.error(str(e))
+        return jsonify({"error": str(e)}), 413
+    except PdfReadError as e:
+        logging.error(str(e))
+        return jsonify({"error": "Could not read the PDF"}), 400
     except Exception as e:
-        print(f"error: {e}")
         logging.error(str(e))
         return jsonify({"error": "Something went wrong"}), 500
 
-    return jsonify(lessons), 200
-
+    course = iter_course(
+        article_text,
+        secure_filename(article.filename),
+        request.form.get("sessionId"),
+        request.form.get("age"),
+        request.form.get("expertise"),
+    )
+
+    def lines():
+        try:
+            for event in course:
+                if event[0] == "topics":
+                    line = {"type": "topics", "topics": event[1], "article_id": event[2]}
+                else:
+                    line = {"type": "lessons", "topic": event[1], "lessons": event[2]}
+                yield current_app.json.dumps(line) + "\n"
+        except Exception as e:
+            logging.error(str(e))
+            yield current_app.json.dumps({"type": "error", "error": "Something went wrong"}) + "\n"
+            return
+        yield current_app.json.dumps({"type": "done"}) + "\n"
+
+    return Response(
+        stream_with_context(lines()),
+        mimetype="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@routes.route("/generate-course/jobs", methods=["POST"])
+def submit_course_job():
+    """Queue course generation and return its job id immediately."""
+    article = request.files.get("selectedFile")
+    if not article:
+        return jsonify({"error": "No file uploaded"}), 400
 
-@app.route('/narration/<path:filename>', methods=['GET'])
+    try:
+        pdf_path = spool_to_file(article)
+    except PDFLimitError as e:
+        logging.error(str(e))
+        return jsonify({"error": str(e)}), 413
+
+    job_id = current_app.extensions["course_jobs"].submit(
+        run_course_job,
+        current_app._get_current_object(),
+        pdf_path,
+        secure_filename(article.filename),
+        request.form.get("sessionId"),
+        request.form.get("age"),
+        request.form.get("expertise"),
+    )
+    return jsonify({"job_id": job_id}), 202, {"Location": f"/generate-course/jobs/{job_id}"}
+
+
+@routes.route("/generate-course/jobs/<job_id>", methods=["GET"])
+def get_course_job(job_id):
+    """Poll a course job: status, per-topic progress, and the lessons once done."""
+    job = current_app.extensions["course_jobs"].get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job), 200
+
+
+@routes.route("/generate-course/jobs/<job_id>/events", methods=["GET"])
+def stream_course_job(job_id):
+    """Server-sent events with a job snapshot each time it changes."""
+    # Bound now: the generator runs after the request's app context is gone
+    jobs = current_app.extensions["course_jobs"]
+    if jobs.get(job_id) is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    def events():
+        for job in jobs.iter_updates(job_id):
+            yield f"event: {job['status']}\ndata: {json.dumps(job)}\n\n"
+
+    return Response(events(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+def _ingest_authorized():
+    token = current_app.config.get("INGEST_API_TOKEN")
+    supplied = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    return bool(token) and hmac.compare_digest(supplied.encode(), token.encode())
+
+
+@routes.route("/ingest", methods=["POST"])
+def submit_ingest_job():
+    """Queue bulk ingestion of an uploaded zip/tar archive of PDFs ("archive"), or of
+    a directory under INGEST_ROOT ("path"). Requires the INGEST_API_TOKEN bearer token."""
+    if not _ingest_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+
+    archive = request.files.get("archive")
+    if archive:
+        try:
+            path = spool_archive(archive)
+        except PDFLimitError as e:
+            return jsonify({"error": str(e)}), 413
+        remove_after = True
+    else:
+        root = current_app.config.get("INGEST_ROOT")
+        relative_path = request.form.get("path") or (request.get_json(silent=True) or {}).get("path")
+        path = safe_join(root, relative_path) if root and relative_path else None
+        if path is None or not os.path.exists(path):
+            return jsonify({"error": "Upload an archive or give a path under INGEST_ROOT"}), 400
+        remove_after = False
+
+    job_id = current_app.extensions["ingest_jobs"].submit(
+        run_ingest_job, current_app._get_current_object(), path, remove_after
+    )
+    return jsonify({"job_id": job_id}), 202, {"Location": f"/ingest/{job_id}"}
+
+
+@routes.route("/ingest/<job_id>", methods=["GET"])
+def get_ingest_job(job_id):
+    """Poll an ingestion job: per-article results and throughput so far."""
+    if not _ingest_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    job = current_app.extensions["ingest_jobs"].get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job), 200
+
+
+@routes.route("/courses/<article_id>", methods=["GET"])
+def get_course(article_id):
+    """An already generated course. Never calls the LLM; served from cache when the
+    course is complete."""
+    payload = get_course_json(article_id)
+    if payload is None:
+        return jsonify({"error": "Course not found"}), 404
+    response = Response(payload, mimetype="application/json")
+    response.set_etag(hashlib.sha256(payload.encode("utf-8")).hexdigest())
+    return response.make_conditional(request)
+
+
+def _completion_rows(payload: dict) -> list[dict]:
+    """Turn a progress submission into LessonCompletion rows; raises ValueError."""
+    session_id = payload.get("sessionId")
+    completions = payload.get("completions", [payload])
+    if not isinstance(session_id, str) or not session_id or not isinstance(completions, list):
+        raise ValueError("Expected a sessionId and a lesson or a list of completions")
+    rows = []
+    for completion in completions:
+        if not isinstance(completion, dict):
+            raise ValueError("Each completion must be an object")
+        lesson_id = completion.get("lessonId")
+        lesson_complete = completion.get("lessonComplete", True)
+        answer_correct = completion.get("answerCorrect")
+        if not isinstance(lesson_id, str) or not lesson_id:
+            raise ValueError("Each completion needs a lessonId")
+        if not isinstance(lesson_complete, bool) or not isinstance(answer_correct, bool):
+            raise ValueError("lessonComplete and answerCorrect must be true or false")
+        rows.append(
+            {
+                "customer_session_id": session_id,
+                "lesson_id": lesson_id,
+                "lesson_complete": lesson_complete,
+                "answer_correct": answer_correct,
+                "debug": debug_status,
+            }
+        )
+    return rows
+
+
+@routes.route("/lesson-progress", methods=["POST"])
+def submit_lesson_progress():
+    """Record answers as {"sessionId", "lessonId", "lessonComplete", "answerCorrect"},
+    or several at once as {"sessionId", "completions": [{"lessonId", ...}, ...]}.
+
+    Answers are buffered and written in batches, so 202 means accepted, not yet
+    stored; unknown sessions or lessons are refused up front with 400. Resubmitting
+    an answer to the same lesson replaces it.
+    """
+    try:
+        rows = _completion_rows(request.get_json(silent=True) or {})
+        current_app.extensions["lesson_progress"].add(rows)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except ProgressBufferFull as e:
+        logger.warning("Refusing lesson progress: %s", e)
+        return jsonify({"error": "Too many answers waiting to be saved"}), 503, {
+            "Retry-After": str(max(1, round(PROGRESS_FLUSH_SECONDS)))
+        }
+    return jsonify({"accepted": len(rows)}), 202
+
+
+@routes.route("/metrics", methods=["GET"])
+def get_metrics():
+    """Stage timings and pool figures for this worker process, in the Prometheus text
+    format."""
+    gauges = {
+        f"edutainment_db_pool_{name}": value
+        for name, value in pool_metrics(db.engine).items()
+        if isinstance(value, (int, float))
+    }
+    gauges["edutainment_lesson_progress_buffered"] = current_app.extensions["lesson_progress"].buffered
+    counters = get_default_cache().counters("llm")
+    for name, samples in get_course_cache().counters("course").items():
+        counters[name] += samples
+    return Response(render_prometheus(gauges, counters), mimetype="text/plain; version=0.0.4")
+
+
+@routes.route("/metrics/db-pool", methods=["GET"])
+def get_pool_metrics():
+    """Connection pool figures for this worker process."""
+    return jsonify(pool_metrics(db.engine)), 200
+
+
+@routes.route("/narration/<path:filename>", methods=["GET"])
 def serve_audio(filename):
-    # Get the current working directory
-    current_directory = os.getcwd()
-    
-    # Define the directory where audio files are stored relative to the current working directory
-    narration_dir = os.path.join(current_directory, 'narration')
-    
-    # Use send_from_directory to serve the file
-    return send_from_directory(narration_dir, filename, as_attachment=True)
+    """Serve a narration inline, with Range, ETag and long-lived caching support."""
+    narration_dir = current_app.config["NARRATION_DIR"]
+    path = safe_join(narration_dir, filename)
+    if path is None or not os.path.isfile(path):
+        return jsonify({"error": "Narration not found"}), 404
+
+    immutable = is_content_addressed(path)
+    # Listening keeps a narration in the LRU cache, like regenerating it would
+    get_cache().touch(os.path.join(get_cache().directory, filename))
+    response = send_file(
+        path,
+        mimetype="audio/mpeg",
+        etag=file_etag(path),
+        conditional=True,
+        max_age=IMMUTABLE_MAX_AGE_SECONDS if immutable else current_app.config["NARRATION_MAX_AGE_SECONDS"],
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = immutable
+    response.headers["Accept-Ranges"] = "bytes"
+    return response
+
+
+app = create_app()
+
+startup_seconds = time.perf_counter() - _startup_started
+logger.info("App started in %.0f ms", startup_seconds * 1000)
+if startup_seconds > app.config["STARTUP_BUDGET_SECONDS"]:
+    logger.warning(
+        "Startup took %.2fs, over the %.2fs budget",
+        startup_seconds,
+        app.config["STARTUP_BUDGET_SECONDS"],
+    )
 
 if __name__ == "__main__":
-    #with app.app_context():
-        #db.create_all()
+    with app.app_context():
+        db.create_all()
     app.run(debug=debug_status, port=4000)  # toggled for prod
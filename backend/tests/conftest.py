@@ -0,0 +1,87 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Settings are read at import time, so throwaway state is configured before the
+# app is imported; nothing here reaches a real LLM, TTS service or database
+_workdir = tempfile.mkdtemp(prefix="edutainment-tests-")
+os.environ.update(
+    {
+        "OPENAI_API_KEY": "test",
+        "ELEVEN_LABS_API_KEY": "test",
+        "EMBEDDING_BACKEND": "hashing",
+        "LLM_CACHE_PATH": "",
+        "JOBS_DB_PATH": os.path.join(_workdir, "jobs.sqlite3"),
+        "INGEST_JOBS_DB_PATH": os.path.join(_workdir, "ingest_jobs.sqlite3"),
+        "COURSE_CACHE_PATH": os.path.join(_workdir, "course_cache.sqlite3"),
+        "NARRATION_DIR": os.path.join(_workdir, "narration"),
+    }
+)
+os.makedirs(os.environ["NARRATION_DIR"], exist_ok=True)
+
+from config import Config
+from edutainment.database import db
+from edutainment.models import Article, ArticleTopic, Customer, CustomerSession, Lesson
+from server import create_app
+
+
+@pytest.fixture
+def app(tmp_path):
+    class TestConfig(Config):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'test.sqlite3'}"
+        SQLALCHEMY_ENGINE_OPTIONS = {
+            # statement_timeout is a Postgres option
+            k: v for k, v in Config.SQLALCHEMY_ENGINE_OPTIONS.items() if k != "connect_args"
+        }
+
+    app = create_app(TestConfig)
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def lesson_rows(app):
+    """A customer session and a topic with two lessons; returns their ids."""
+    with app.app_context(), db.session.begin():
+        customer = Customer()
+        article = Article(filename="article.pdf", content="Some article.")
+        db.session.add_all([customer, article])
+        db.session.flush()
+        session = CustomerSession(customer_id=customer.customer_id)
+        topic = ArticleTopic(article_id=article.article_id, topic_name="Energy")
+        db.session.add_all([session, topic])
+        db.session.flush()
+        lessons = [
+            Lesson(
+                article_topic_id=topic.article_topic_id,
+                lesson_content=f"Lesson {i}",
+                question="Q",
+                right_answer="R",
+                wrong_answer="W",
+                right_answer_explanation="E",
+                order_num=i,
+            )
+            for i in range(2)
+        ]
+        db.session.add_all(lessons)
+        db.session.flush()
+        return {
+            "session_id": session.customer_session_id,
+            "article_id": article.article_id,
+            "article_topic_id": topic.article_topic_id,
+            "lesson_ids": [lesson.lesson_id for lesson in lessons],
+        }
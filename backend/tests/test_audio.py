@@ -0,0 +1,34 @@
+from edutainment.audio import concatenate_mp3, iter_mp3_frames
+
+# MPEG-1 layer III, 32 kbit/s, 44.1 kHz: 104 bytes and 1152 samples per frame
+FRAME = b"\xff\xfb\x10\xc0" + bytes(100)
+FRAME_SECONDS = 1152 / 44100
+
+
+def id3_tag(size: int) -> bytes:
+    syncsafe = bytes((size >> shift) & 0x7F for shift in (21, 14, 7, 0))
+    return b"ID3\x04\x00\x00" + syncsafe + bytes(size)
+
+
+def test_frames_skip_tags_junk_and_the_xing_header():
+    xing = b"\xff\xfb\x10\xc0" + b"\x00" * 32 + b"Xing" + bytes(64)
+    data = id3_tag(20) + xing + FRAME * 2 + b"junk" + FRAME + FRAME[:50]
+    frames = list(iter_mp3_frames(data))
+    assert [length for _, length, _ in frames] == [104, 104, 104]
+    assert all(data[offset : offset + length] == FRAME for offset, length, _ in frames)
+
+
+def test_concatenation_joins_frames_and_reports_chapters(tmp_path):
+    clips = []
+    for i, count in enumerate((10, 25, 5)):
+        path = tmp_path / f"{i}.mp3"
+        path.write_bytes(id3_tag(10) + FRAME * count)
+        clips.append(str(path))
+    output = tmp_path / "track.mp3"
+
+    chapters = concatenate_mp3(clips, str(output))
+
+    assert output.read_bytes() == FRAME * 40
+    assert [c["duration_seconds"] for c in chapters] == [round(n * FRAME_SECONDS, 3) for n in (10, 25, 5)]
+    starts = [c["start_seconds"] for c in chapters]
+    assert starts == [0.0, round(10 * FRAME_SECONDS, 3), round(35 * FRAME_SECONDS, 3)]
@@ -0,0 +1,34 @@
+from edutainment.chunking import estimate_tokens, select_relevant_chunks, split_into_chunks
+
+
+def test_chunks_respect_the_token_budget_and_keep_all_text():
+    paragraphs = [f"Paragraph {i} " + "word " * (i * 7 % 40 + 1) for i in range(60)]
+    text = "\n\n".join(paragraphs)
+    chunks = split_into_chunks(text, 50)
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 50 for chunk in chunks)
+    # Paragraphs over the budget are cut by length, possibly mid-word
+    assert "".join("".join(chunks).split()) == "".join(text.split())
+
+
+def test_splits_on_paragraph_boundaries():
+    text = "First paragraph here.\n\nSecond paragraph here.\n\n\nThird one."
+    assert split_into_chunks(text, 8) == ["First paragraph here.", "Second paragraph here.", "Third one."]
+    assert split_into_chunks(text, 1000) == ["First paragraph here.\n\nSecond paragraph here.\n\nThird one."]
+
+
+def test_long_paragraphs_are_split_by_sentence_then_by_length():
+    sentence = "A" * 30 + ". "
+    chunks = split_into_chunks(sentence * 4 + "B" * 100, 10)
+    assert all(len(chunk) <= 40 for chunk in chunks)
+    assert "".join(chunks).replace(" ", "").replace("\n", "") == ("A" * 30 + ".") * 4 + "B" * 100
+
+
+def test_blank_text_has_no_chunks():
+    assert split_into_chunks(" \n\n \n", 10) == []
+
+
+def test_relevant_chunks_fit_the_budget_in_article_order():
+    chunks = ["cats purr loudly", "the weather today", "cats and more cats", "stock markets fell"]
+    assert select_relevant_chunks(chunks, "cats", 10) == ["cats purr loudly", "cats and more cats"]
+    assert select_relevant_chunks(chunks, "cats", 5) == ["cats and more cats"]
@@ -0,0 +1,128 @@
+import time
+
+import pytest
+
+from benchmarks.corpus import write_pdf
+from edutainment import ingest
+from edutainment.database import db
+from edutainment.ingest import DONE, SKIPPED, PDFSource, ingest_article
+from edutainment.jobs import FINISHED_STATUSES
+from edutainment.lesson_planner import LessonPlan
+from edutainment.models import Article, ArticleTopic, Lesson, article_fingerprint
+from edutainment.pdf import extract_text
+
+TOKEN = "ingest-secret"
+
+
+@pytest.fixture
+def ingest_app(app, tmp_path):
+    app.config.update(INGEST_API_TOKEN=TOKEN, INGEST_ROOT=str(tmp_path))
+    (tmp_path / "empty").mkdir()
+    return app
+
+
+def auth(token=TOKEN):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def wait_until_finished(client, job_id):
+    for _ in range(100):
+        job = client.get(f"/ingest/{job_id}", headers=auth()).json
+        if job["status"] in FINISHED_STATUSES:
+            return job
+        time.sleep(0.05)
+    raise AssertionError("ingest job did not finish")
+
+
+def test_ingest_requires_the_token(ingest_app):
+    client = ingest_app.test_client()
+    assert client.post("/ingest", data={"path": "empty"}).status_code == 401
+    assert client.post("/ingest", data={"path": "empty"}, headers=auth("wrong")).status_code == 401
+    assert client.get("/ingest/some-job").status_code == 401
+
+    ingest_app.config["INGEST_API_TOKEN"] = None
+    assert client.post("/ingest", data={"path": "empty"}, headers=auth("")).status_code == 401
+
+
+def test_ingest_paths_stay_under_the_root(ingest_app):
+    client = ingest_app.test_client()
+    response = client.post("/ingest", data={"path": "../.."}, headers=auth())
+    assert response.status_code == 400
+
+
+def test_ingest_jobs_have_their_own_queue(ingest_app):
+    client = ingest_app.test_client()
+    response = client.post("/ingest", data={"path": "empty"}, headers=auth())
+    assert response.status_code == 202
+    job_id = response.json["job_id"]
+    assert response.headers["Location"] == f"/ingest/{job_id}"
+
+    job = wait_until_finished(client, job_id)
+    assert job["status"] == "succeeded"
+    assert job["result"]["summary"]["articles"] == 0
+    # Course job lookups need no token, so they must not reveal ingestion jobs
+    assert client.get(f"/generate-course/jobs/{job_id}").status_code == 404
+    assert ingest_app.extensions["course_jobs"].get(job_id) is None
+
+
+@pytest.fixture
+def pdf_source(tmp_path):
+    path = write_pdf(str(tmp_path / "article.pdf"), seed=3, pages=1)
+    with open(path, "rb") as f:
+        text = extract_text(f).strip()
+    return PDFSource("article.pdf", path), text
+
+
+def store_course(app, text, narrated):
+    with app.app_context(), db.session.begin():
+        article = Article(filename="article.pdf", content=text, content_hash=article_fingerprint(text))
+        db.session.add(article)
+        db.session.flush()
+        topic = ArticleTopic(article_id=article.article_id, topic_name="Energy")
+        db.session.add(topic)
+        db.session.flush()
+        db.session.add(
+            Lesson(
+                article_topic_id=topic.article_topic_id,
+                lesson_content="Lesson",
+                question="Q",
+                right_answer="R",
+                wrong_answer="W",
+                right_answer_explanation="E",
+                order_num=0,
+                narration_file="narration/done.mp3" if narrated else None,
+            )
+        )
+        return article.article_id
+
+
+def test_complete_courses_are_skipped(app, monkeypatch, pdf_source):
+    source, text = pdf_source
+    article_id = store_course(app, text, narrated=True)
+    monkeypatch.setattr(ingest, "LessonPlan", None)
+
+    result = ingest_article(app, source)
+
+    assert result["status"] == SKIPPED
+    assert result["article_id"] == article_id
+
+
+def test_partial_courses_resume_from_the_stored_article(app, monkeypatch, pdf_source):
+    source, text = pdf_source
+    article_id = store_course(app, text, narrated=False)
+
+    class ResumingPlan(LessonPlan):
+        # Narrating the stored lesson would call the TTS service
+        def iter_lessons(self, topics):
+            for topic in topics:
+                yield topic, [{"lesson_id": "l"}]
+
+    monkeypatch.setattr(ingest, "LessonPlan", ResumingPlan)
+
+    result = ingest_article(app, source)
+
+    # The stored article and its topics are reused; no topics were generated
+    assert result["status"] == DONE
+    assert result["article_id"] == article_id
+    assert result["topics"] == 1
+    assert result["lessons"] == 1
@@ -0,0 +1,49 @@
+import time
+
+import pytest
+
+from edutainment.lesson_planner import LessonPlan
+
+
+@pytest.fixture
+def plan(app):
+    with app.app_context():
+        return LessonPlan("session", "article.pdf", "A short article about energy.")
+
+
+def fake_get_lessons(delays):
+    def get_lessons(topic_name, topic_expertise):
+        delay = delays[topic_name]
+        if delay is None:
+            raise RuntimeError("generation failed")
+        time.sleep(delay)
+        return [{"lesson_content": topic_name}]
+
+    return get_lessons
+
+
+def test_topics_are_yielded_in_completion_order(plan):
+    plan.get_lessons = fake_get_lessons({"slow": 0.3, "fast": 0.05, "broken": None})
+    results = list(plan.iter_lessons(["slow", "fast", "broken"], max_workers=3, timeout=5))
+    assert [topic for topic, _ in results] == ["broken", "fast", "slow"]
+    assert dict(results) == {
+        "broken": None,
+        "fast": [{"lesson_content": "fast"}],
+        "slow": [{"lesson_content": "slow"}],
+    }
+
+
+def test_a_topic_over_its_timeout_yields_none_without_waiting(plan):
+    plan.get_lessons = fake_get_lessons({"stuck": 3, "fast": 0.01})
+    started = time.monotonic()
+    results = dict(plan.iter_lessons(["stuck", "fast"], max_workers=2, timeout=0.3))
+    assert results == {"stuck": None, "fast": [{"lesson_content": "fast"}]}
+    assert time.monotonic() - started < 1
+
+
+def test_the_timeout_counts_from_when_a_topic_starts(plan):
+    # With one worker the second topic queues behind the first; together they take
+    # longer than the timeout, but neither does alone
+    plan.get_lessons = fake_get_lessons({"first": 0.2, "second": 0.2})
+    results = dict(plan.iter_lessons(["first", "second", "first"], max_workers=1, timeout=0.3))
+    assert results == {"first": [{"lesson_content": "first"}], "second": [{"lesson_content": "second"}]}
@@ -0,0 +1,66 @@
+import threading
+import time
+
+import pytest
+
+from edutainment.jobs import FAILED, RUNNING, SUCCEEDED, JobQueue, JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.sqlite3"))
+
+
+def age(store, job_id, seconds):
+    with store._connection:
+        store._connection.execute(
+            "UPDATE jobs SET updated_at = updated_at - ? WHERE job_id = ?", (seconds, job_id)
+        )
+
+
+def test_prune_deletes_only_old_finished_jobs(store):
+    jobs = {"old-done": SUCCEEDED, "old-failed": FAILED, "old-running": RUNNING, "new": SUCCEEDED}
+    for job_id, status in jobs.items():
+        store.create(job_id)
+        store.update(job_id, status=status)
+        if job_id.startswith("old"):
+            age(store, job_id, 3600)
+
+    store.prune(time.time() - 60)
+
+    assert store.get("old-done") is None
+    assert store.get("old-failed") is None
+    assert store.get("old-running")["status"] == RUNNING
+    assert store.get("new")["status"] == SUCCEEDED
+
+
+def test_starting_a_queue_fails_jobs_abandoned_by_an_exited_worker(store):
+    store.create("abandoned")
+    store.update("abandoned", status=RUNNING, progress={"topics": 2})
+    age(store, "abandoned", 3600)
+    store.create("queued-elsewhere")
+
+    JobQueue(store, stale_seconds=60)
+
+    abandoned = store.get("abandoned")
+    assert abandoned["status"] == FAILED
+    assert abandoned["error"]
+    assert abandoned["progress"] == {"topics": 2}
+    assert store.get("queued-elsewhere")["status"] == "queued"
+
+
+def test_running_jobs_are_kept_fresh_by_the_heartbeat(store):
+    release = threading.Event()
+    queue = JobQueue(store, heartbeat_seconds=0.05, stale_seconds=0.5)
+    job_id = queue.submit(lambda progress: release.wait(5) and "done")
+
+    time.sleep(1)
+    JobQueue(store, stale_seconds=0.5)
+    assert store.get(job_id)["status"] == RUNNING
+
+    release.set()
+    for _ in range(50):
+        if store.get(job_id)["status"] == SUCCEEDED:
+            break
+        time.sleep(0.05)
+    assert store.get(job_id)["result"] == "done"
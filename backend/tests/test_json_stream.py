@@ -0,0 +1,36 @@
+import json
+
+from edutainment.json_stream import JSONArrayItemParser, iter_array_items
+
+LESSONS = [
+    {"lesson": "Braces { and } in text", "question": "A \"quoted\" [bracket]?"},
+    {"lesson": "Nested", "detail": {"items": [1, 2, {"deep": True}]}},
+    {"lesson": "Escaped backslash \\", "question": "Unicode é"},
+]
+DOCUMENT = json.dumps({"title": "t", "other": [{"skip": 1}], "instruction": LESSONS, "after": [{"x": 1}]})
+
+
+def test_yields_each_item_once_its_brace_closes():
+    parser = JSONArrayItemParser("instruction")
+    first_end = DOCUMENT.index(json.dumps(LESSONS[0])) + len(json.dumps(LESSONS[0]))
+    assert parser.feed(DOCUMENT[: first_end - 1]) == []
+    assert parser.feed(DOCUMENT[first_end - 1 : first_end]) == [LESSONS[0]]
+    assert parser.feed(DOCUMENT[first_end:]) == LESSONS[1:]
+    assert parser.done
+
+
+def test_any_split_gives_the_same_items():
+    for size in (1, 2, 7, 64):
+        chunks = [DOCUMENT[i : i + size] for i in range(0, len(DOCUMENT), size)]
+        assert list(iter_array_items(chunks, "instruction")) == LESSONS
+
+
+def test_ignores_arrays_under_other_keys_and_nested_keys():
+    document = json.dumps({"x": {"instruction": [{"nested": 1}]}, "instruction": [{"top": 1}]})
+    assert list(iter_array_items([document], "instruction")) == [{"top": 1}]
+
+
+def test_missing_key_yields_nothing():
+    parser = JSONArrayItemParser("instruction")
+    assert parser.feed(json.dumps({"lessons": LESSONS})) == []
+    assert not parser.done
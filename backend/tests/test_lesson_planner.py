@@ -0,0 +1,125 @@
+import pytest
+
+from edutainment.database import db
+from edutainment.embeddings import get_embedder
+from edutainment.lesson_planner import LessonPlan, bulk_insert_new, bulk_upsert, get_or_create
+from edutainment.models import Article, ArticleTopic, Lesson
+
+LONG_ARTICLE = "\n\n".join(
+    f"Paragraph {i} is about {topic} and how {topic} shapes the world around us. " * 8
+    for i, topic in enumerate(["energy", "water", "soil", "climate"] * 10)
+)
+
+
+def generated(tag, count):
+    return [
+        {
+            "lesson": f"{tag} lesson {i}",
+            "question": "Q",
+            "right_answer": "R",
+            "wrong_answer": "W",
+            "right_answer_explanation": "E",
+        }
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def articles(app):
+    with app.app_context(), db.session.begin():
+        rows = [Article(filename=f"{i}.pdf", content=f"Article {i}") for i in range(2)]
+        db.session.add_all(rows)
+        db.session.flush()
+        return [row.article_id for row in rows]
+
+
+def test_get_or_create_matches_on_every_kwarg(app, articles):
+    with app.app_context(), db.session.begin():
+        first = get_or_create(db.session, ArticleTopic, article_id=articles[0], topic_name="Energy")
+        second = get_or_create(db.session, ArticleTopic, article_id=articles[1], topic_name="Energy")
+        again = get_or_create(
+            db.session, ArticleTopic, article_id=articles[1], topic_name="Energy", defaults={"debug": True}
+        )
+        assert first.article_id == articles[0]
+        assert second.article_id == articles[1]
+        assert again is second
+        assert not again.debug
+        assert db.session.query(ArticleTopic).count() == 2
+
+
+def test_bulk_upsert_returns_new_and_existing_rows(app, articles):
+    with app.app_context(), db.session.begin():
+        rows = bulk_upsert(
+            db.session,
+            ArticleTopic,
+            [
+                {"article_id": articles[0], "topic_name": "Energy", "debug": False},
+                {"article_id": articles[0], "topic_name": "Water", "debug": False},
+            ],
+            index_elements=["article_id", "topic_name"],
+        )
+        ids = {row.topic_name: row.article_topic_id for row in rows}
+
+    with app.app_context(), db.session.begin():
+        rows = bulk_upsert(
+            db.session,
+            ArticleTopic,
+            [
+                {"article_id": articles[0], "topic_name": "Energy", "debug": False},
+                {"article_id": articles[0], "topic_name": "Energy", "debug": True},
+                {"article_id": articles[0], "topic_name": "Soil", "debug": True},
+            ],
+            index_elements=["article_id", "topic_name"],
+            update_columns=["debug"],
+        )
+        assert len(rows) == 2
+        by_name = {row.topic_name: row for row in rows}
+        # The existing row keeps its id; the last duplicate in the batch wins
+        assert by_name["Energy"].article_topic_id == ids["Energy"]
+        assert by_name["Energy"].debug
+        assert db.session.query(ArticleTopic).count() == 3
+
+
+def test_bulk_insert_new_returns_only_inserted_rows(app, articles):
+    row = {"article_id": articles[0], "topic_name": "Energy", "debug": False}
+    with app.app_context(), db.session.begin():
+        assert len(bulk_insert_new(db.session, ArticleTopic, [row], ["article_id", "topic_name"])) == 1
+    with app.app_context(), db.session.begin():
+        other = {**row, "topic_name": "Water"}
+        inserted = bulk_insert_new(db.session, ArticleTopic, [row, other], ["article_id", "topic_name"])
+        assert [r.topic_name for r in inserted] == ["Water"]
+
+
+def test_losing_a_lesson_race_keeps_the_first_generation(app):
+    with app.app_context():
+        plan = LessonPlan("session", "article.pdf", "A short article about energy.")
+        with db.session.begin():
+            topic = ArticleTopic(article_id=plan.article_id, topic_name="Energy")
+            db.session.add(topic)
+            db.session.flush()
+            topic_id = topic.article_topic_id
+
+        first = plan._insert_lessons(topic_id, generated("first", 3))
+        assert [l["lesson_content"] for l in first] == ["first lesson 0", "first lesson 1", "first lesson 2"]
+        assert {l["article_id"] for l in first} == {plan.article_id}
+
+        assert plan._insert_lessons(topic_id, generated("second", 5)) == []
+        stored = db.session.scalars(db.select(Lesson.lesson_content).order_by(Lesson.order_num)).all()
+        assert stored == ["first lesson 0", "first lesson 1", "first lesson 2"]
+
+
+def test_passage_index_is_stored_and_reused(app):
+    with app.app_context():
+        plan = LessonPlan("session", "article.pdf", LONG_ARTICLE)
+        assert plan.text_generator.get_passages()
+        assert plan.text_generator.passage_index is not None
+
+        article = db.session.get(Article, plan.article_id)
+        assert article.passage_embeddings is not None
+        assert article.embedding_model == get_embedder().name
+        stored = article.passage_embeddings
+        db.session.rollback()
+
+        again = LessonPlan("other session", "copy.pdf", LONG_ARTICLE)
+        assert again.article_id == plan.article_id
+        assert again.text_generator.passage_index.to_bytes() == stored
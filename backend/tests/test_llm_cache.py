@@ -0,0 +1,74 @@
+import time
+
+import pytest
+
+from edutainment.llm_cache import MemoryResponseCache, SQLiteResponseCache, TieredResponseCache, response_cache_key
+
+
+@pytest.fixture
+def sqlite_cache(tmp_path):
+    return SQLiteResponseCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=60)
+
+
+def rows(cache):
+    return cache._connection.execute("SELECT key FROM llm_response_cache ORDER BY key").fetchall()
+
+
+def test_keys_depend_on_the_rendered_request():
+    messages = [{"role": "user", "content": "hi"}]
+    key = response_cache_key("gpt", messages, temperature=0)
+    assert key == response_cache_key("gpt", [dict(m) for m in messages], temperature=0)
+    assert key != response_cache_key("gpt", messages, temperature=1)
+    assert key != response_cache_key("other", messages, temperature=0)
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = MemoryResponseCache(max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+    assert [cache.get(k) for k in "abc"] == ["1", None, "3"]
+    assert cache.stats() == {"hits": 3, "misses": 1}
+
+
+def test_entries_expire_after_their_ttl(sqlite_cache):
+    memory = MemoryResponseCache(ttl_seconds=0.05)
+    for cache in (memory, sqlite_cache):
+        cache.ttl_seconds = 0.05
+        cache.set("key", "value")
+        assert cache.get("key") == "value"
+    time.sleep(0.1)
+    assert memory.get("key") is None
+    assert sqlite_cache.get("key") is None
+    assert rows(sqlite_cache) == []
+
+
+def test_tiers_backfill_faster_tiers_and_count_hits(sqlite_cache):
+    memory = MemoryResponseCache()
+    sqlite_cache.set("key", "value")
+    cache = TieredResponseCache(memory, sqlite_cache)
+
+    assert cache.get("key") == "value"
+    assert memory.get("key") == "value"
+    assert cache.get("missing") is None
+    counters = cache.counters("llm")
+    assert counters["edutainment_response_cache_hits_total"] == [
+        ({"cache": "llm", "tier": "all"}, 1),
+        ({"cache": "llm", "tier": "memory"}, 1),
+        ({"cache": "llm", "tier": "sqlite"}, 1),
+    ]
+    assert [value for _, value in counters["edutainment_response_cache_misses_total"]] == [1, 2, 1]
+
+    cache.delete("key")
+    assert memory.get("key") is None and sqlite_cache.get("key") is None
+
+
+def test_expired_rows_are_purged_on_writes(tmp_path):
+    cache = SQLiteResponseCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=0.01, purge_seconds=0.05)
+    for i in range(5):
+        cache.set(f"old{i}", "value")
+    time.sleep(0.06)
+    cache.ttl_seconds = 60
+    cache.set("new", "value")
+    assert rows(cache) == [("new",)]
@@ -0,0 +1,47 @@
+import asyncio
+import time
+
+from edutainment.llm_client import BACKOFF_MAX_SECONDS, CompletionError, TokenBucket, backoff_delay, is_retryable
+
+
+def test_token_bucket_allows_a_burst_then_waits_for_refill():
+    async def run():
+        bucket = TokenBucket(rate_per_minute=6000)  # 100 per second
+        started = time.monotonic()
+        await bucket.acquire(6000)
+        burst = time.monotonic() - started
+        await bucket.acquire(10)
+        return burst, time.monotonic() - started - burst
+
+    burst, refill = asyncio.run(run())
+    assert burst < 0.05
+    assert 0.08 <= refill < 0.5
+
+
+def test_token_bucket_clamps_requests_larger_than_its_capacity():
+    async def run():
+        bucket = TokenBucket(rate_per_minute=60)
+        started = time.monotonic()
+        await bucket.acquire(10**6)
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) < 0.05
+
+
+def test_backoff_is_jittered_and_capped():
+    for attempt in range(12):
+        delays = [backoff_delay(attempt) for _ in range(50)]
+        assert all(0 <= d <= min(BACKOFF_MAX_SECONDS, 2**attempt) for d in delays)
+    assert len({backoff_delay(3) for _ in range(20)}) > 1
+
+
+def test_backoff_honors_a_longer_retry_after():
+    assert backoff_delay(0, CompletionError("slow down", 429, {"retry-after": "120"})) == 120
+    assert backoff_delay(0, CompletionError("slow down", 429, {"retry-after": "soon"})) <= 1
+
+
+def test_only_transient_statuses_are_retried():
+    assert is_retryable(CompletionError("rate limited", 429))
+    assert is_retryable(CompletionError("overloaded", 529))
+    assert not is_retryable(CompletionError("bad request", 400))
+    assert not is_retryable(ValueError("not an API error"))
@@ -0,0 +1,34 @@
+from edutainment.llm_cache import get_default_cache
+from edutainment.tracing import stage
+
+
+def test_metrics_export_response_cache_counters(client):
+    cache = get_default_cache()
+    cache.set("metrics-key", "value")
+    cache.get("metrics-key")
+    hits = cache.stats()["hits"]
+
+    body = client.get("/metrics").get_data(as_text=True)
+
+    assert "# TYPE edutainment_response_cache_hits_total counter" in body
+    assert f'edutainment_response_cache_hits_total{{cache="llm",tier="all"}} {hits}' in body
+    assert 'edutainment_response_cache_misses_total{cache="course",tier="memory"}' in body
+
+
+def test_metrics_report_stage_histograms_and_gauges(client):
+    with stage("metrics_test", bytes=10):
+        pass
+    client.get("/courses/missing")
+
+    body = client.get("/metrics").get_data(as_text=True)
+
+    assert "# TYPE edutainment_stage_duration_seconds histogram" in body
+    assert 'edutainment_stage_duration_seconds_bucket{stage="metrics_test",le="+Inf"}' in body
+    assert 'edutainment_stage_duration_seconds_count{stage="http_request"}' in body
+    assert 'edutainment_stage_bytes_total{stage="metrics_test"}' in body
+    assert "# TYPE edutainment_db_pool_size gauge" in body
+    assert "edutainment_lesson_progress_buffered 0" in body
+    # Every sample line is "name{labels} value" or "name value"
+    for line in body.splitlines():
+        if not line.startswith("#"):
+            float(line.rsplit(" ", 1)[1])
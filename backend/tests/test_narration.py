@@ -0,0 +1,63 @@
+import os
+import uuid
+
+import pytest
+
+from benchmarks.fake_services import FakeTTSServer
+from edutainment import narration
+from edutainment.narration import ELEVEN_LABS_MAX_CONCURRENCY, NarrationPipeline, get_narration, get_session
+
+
+@pytest.fixture
+def tts(monkeypatch):
+    server = FakeTTSServer(latency=0.01, audio_bytes=4096).start()
+    monkeypatch.setattr(narration, "url", f"{server.url}/v1/text-to-speech/voice")
+    yield server
+    server.stop()
+
+
+def unique(text):
+    return f"{text} {uuid.uuid4()}"
+
+
+def test_pipeline_yields_every_saved_narration(tts):
+    texts = [unique(f"Lesson {i}") for i in range(6)]
+    with NarrationPipeline(max_workers=3) as pipeline:
+        for text in texts:
+            pipeline.submit(text)
+        results = dict(pipeline.as_completed())
+    assert sorted(results) == list(range(6))
+    assert len(set(results.values())) == 6
+    assert all(os.path.getsize(path) == 4096 // 104 * 104 for path in results.values())
+    assert tts.requests == {"tts": 6}
+
+
+def test_identical_text_is_synthesized_once(tts):
+    text = unique("Same lesson")
+    assert get_narration(text) == get_narration(text)
+    assert tts.requests == {"tts": 1}
+
+
+class UnavailableTTSServer(FakeTTSServer):
+    def handle(self, handler, path, body):
+        self.count("tts")
+        handler.send_response(503)
+        handler.send_header("Content-Length", "0")
+        handler.end_headers()
+
+
+def test_failed_narrations_are_skipped(monkeypatch):
+    server = UnavailableTTSServer().start()
+    monkeypatch.setattr(narration, "url", f"{server.url}/v1/text-to-speech/voice")
+    try:
+        with NarrationPipeline() as pipeline:
+            pipeline.submit(unique("Lost lesson"))
+            assert list(pipeline.as_completed()) == []
+        assert server.requests == {"tts": 1}
+    finally:
+        server.stop()
+
+
+def test_session_keeps_a_connection_per_concurrent_request():
+    adapter = get_session().get_adapter("https://api.elevenlabs.io")
+    assert adapter._pool_maxsize == ELEVEN_LABS_MAX_CONCURRENCY
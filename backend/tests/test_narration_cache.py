@@ -0,0 +1,112 @@
+import json
+import os
+
+import pytest
+
+from edutainment import narration_cache
+from edutainment.courses import get_course_json
+from edutainment.database import db
+from edutainment.lesson_planner import forget_audio
+from edutainment.models import ArticleTopic, Lesson
+from edutainment.narration_cache import NarrationCache
+
+
+class CountingConnection:
+    """Wraps the index connection to count the statements it runs."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.statements = []
+
+    def execute(self, sql, *args):
+        self.statements.append(sql)
+        return self.connection.execute(sql, *args)
+
+
+def stored(cache, name, size=100):
+    path = os.path.join(cache.directory, name)
+    with open(path, "wb") as f:
+        f.write(bytes(size))
+    cache.add(path)
+    return path
+
+
+@pytest.fixture
+def cache(tmp_path):
+    evicted = []
+    cache = NarrationCache(str(tmp_path), max_bytes=250, on_evict=evicted.extend)
+    cache.evicted = evicted
+    return cache
+
+
+def last_used(cache, path):
+    return cache._connection.execute("SELECT last_used FROM narrations WHERE path = ?", (path,)).fetchone()[0]
+
+
+def test_least_recently_used_files_are_evicted(cache, monkeypatch):
+    monkeypatch.setattr(narration_cache, "NARRATION_TOUCH_SECONDS", 0)
+    first, second = stored(cache, "a.mp3"), stored(cache, "b.mp3")
+    cache._connection.execute("UPDATE narrations SET last_used = last_used - 10")
+    cache.touch(first)
+
+    third = stored(cache, "c.mp3")
+
+    assert cache.evicted == [second]
+    assert not os.path.exists(second)
+    assert os.path.exists(first) and os.path.exists(third)
+    assert cache.total_bytes() == 200
+
+
+def test_a_missing_file_is_a_miss(cache):
+    partial = os.path.join(cache.directory, "download.part")
+    with open(partial, "wb") as f:
+        f.write(bytes(10))
+    path = cache.put("k" * 64, partial)
+    assert cache.get("k" * 64) == path
+    os.remove(path)
+    assert cache.get("k" * 64) is None
+
+
+def test_touches_are_written_at_most_once_per_interval(cache):
+    path = stored(cache, "a.mp3")
+    cache._connection.execute("UPDATE narrations SET last_used = 0")
+    cache._touched.clear()
+    cache._connection = CountingConnection(cache._connection)
+
+    for _ in range(100):
+        cache.touch(path)
+
+    assert len(cache._connection.statements) == 1
+    assert last_used(cache, path) > 0
+
+
+def test_caches_share_one_index(tmp_path):
+    first = NarrationCache(str(tmp_path), max_bytes=250)
+    second = NarrationCache(str(tmp_path), max_bytes=250)
+    stored(first, "a.mp3")
+    stored(second, "b.mp3")
+    stored(first, "c.mp3")
+    assert first.total_bytes() == second.total_bytes() == 200
+    assert not os.path.exists(tmp_path / "a.mp3")
+
+
+def test_forgetting_audio_clears_references_and_cached_courses(app, lesson_rows, tmp_path):
+    narration, track = str(tmp_path / "lesson.mp3"), str(tmp_path / "track.mp3")
+    with app.app_context(), db.session.begin():
+        first_lesson = Lesson.lesson_id == lesson_rows["lesson_ids"][0]
+        db.session.execute(db.update(Lesson).where(first_lesson).values(narration_file=narration))
+        db.session.execute(
+            db.update(ArticleTopic).values(narration_track=track, narration_chapters=json.dumps([]))
+        )
+    with app.app_context():
+        before = json.loads(get_course_json(lesson_rows["article_id"]))
+    assert before["topics"][0]["narration_track"] == track
+
+    forget_audio(app, [narration, track])
+
+    with app.app_context():
+        assert db.session.scalars(db.select(Lesson.narration_file)).all() == [None, None]
+        assert db.session.scalars(db.select(ArticleTopic.narration_track)).all() == [None]
+        after = json.loads(get_course_json(lesson_rows["article_id"]))
+    assert after["topics"][0]["narration_track"] is None
+    assert all(lesson["narration_file"] is None for lesson in after["topics"][0]["lessons"])
@@ -0,0 +1,56 @@
+import io
+import os
+
+import pytest
+
+from benchmarks.corpus import article_text, write_pdf
+from edutainment import pdf
+from edutainment.pdf import PDFLimitError, extract_text, iter_pdf_pages, spool_to_file
+
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    return write_pdf(str(tmp_path / "article.pdf"), seed=1, pages=3)
+
+
+def test_spool_to_file_copies_upload(pdf_path):
+    with open(pdf_path, "rb") as f:
+        data = f.read()
+    path = spool_to_file(io.BytesIO(data))
+    try:
+        with open(path, "rb") as f:
+            assert f.read() == data
+    finally:
+        os.remove(path)
+
+
+def test_spool_to_file_rejects_large_upload_and_removes_it(monkeypatch, tmp_path):
+    monkeypatch.setattr(pdf, "SPOOL_CHUNK_SIZE", 4)
+    monkeypatch.setattr(pdf.tempfile, "tempdir", str(tmp_path))
+    with pytest.raises(PDFLimitError):
+        spool_to_file(io.BytesIO(b"x" * 10), max_bytes=8)
+    assert os.listdir(tmp_path) == []
+
+
+def test_page_limit(pdf_path):
+    with pytest.raises(PDFLimitError, match="3 pages"):
+        list(iter_pdf_pages(pdf_path, max_pages=2))
+
+
+def test_extract_text_reads_every_page(pdf_path):
+    with open(pdf_path, "rb") as f:
+        text = extract_text(f)
+    lines = article_text(seed=1, pages=3)
+    assert lines[0] in text and lines[-1] in text
+
+
+def test_parallel_extraction_keeps_page_order(monkeypatch, tmp_path):
+    path = write_pdf(str(tmp_path / "long.pdf"), seed=2, pages=20)
+    monkeypatch.setattr(pdf, "PDF_EXTRACTION_WORKERS", 2)
+    monkeypatch.setattr(pdf, "_executor", None)
+    try:
+        parallel = list(iter_pdf_pages(path))
+    finally:
+        pdf._executor.shutdown()
+    assert parallel == list(iter_pdf_pages(path, parallel=False))
+    assert len(parallel) == 20
@@ -0,0 +1,105 @@
+import threading
+
+import pytest
+
+from edutainment import progress
+from edutainment.database import db
+from edutainment.models import LessonCompletion
+from edutainment.progress import CompletionBuffer, ProgressBufferFull, UnknownProgressTarget
+
+
+def completion(ids, lesson=0, correct=True):
+    return {
+        "customer_session_id": ids["session_id"],
+        "lesson_id": ids["lesson_ids"][lesson],
+        "lesson_complete": True,
+        "answer_correct": correct,
+    }
+
+
+def stored(app):
+    with app.app_context():
+        rows = db.session.scalars(db.select(LessonCompletion)).all()
+        return {row.lesson_id: row.answer_correct for row in rows}
+
+
+@pytest.fixture
+def buffer(app):
+    # Flushed by hand; the background thread stays idle
+    return CompletionBuffer(app, flush_seconds=3600, flush_rows=1000)
+
+
+def test_resubmitted_answers_are_written_once_and_latest_wins(app, lesson_rows, buffer):
+    buffer.add([completion(lesson_rows, correct=False), completion(lesson_rows, correct=True)])
+    buffer.add([completion(lesson_rows, lesson=1)])
+    assert buffer.buffered == 2
+    assert buffer.flush() == 2
+    assert buffer.buffered == 0
+
+    buffer.add([completion(lesson_rows, correct=False)])
+    assert buffer.flush() == 1
+    assert stored(app) == {lesson_rows["lesson_ids"][0]: False, lesson_rows["lesson_ids"][1]: True}
+
+
+def test_flush_writes_in_batches_of_flush_rows(app, lesson_rows):
+    buffer = CompletionBuffer(app, flush_seconds=3600, flush_rows=1)
+    buffer.add([completion(lesson_rows, lesson=0), completion(lesson_rows, lesson=1)])
+    assert buffer.flush() == 2
+    assert len(stored(app)) == 2
+
+
+def test_a_full_buffer_refuses_the_whole_submission(lesson_rows, app):
+    buffer = CompletionBuffer(app, flush_seconds=3600, max_rows=1)
+    buffer.add([completion(lesson_rows)])
+    # Replacing a buffered answer takes no room
+    buffer.add([completion(lesson_rows, correct=False)])
+    with pytest.raises(ProgressBufferFull):
+        buffer.add([completion(lesson_rows, lesson=1)])
+    assert buffer.buffered == 1
+
+
+def test_unknown_sessions_and_lessons_are_refused_up_front(lesson_rows, buffer):
+    with pytest.raises(UnknownProgressTarget):
+        buffer.add([completion(lesson_rows), {**completion(lesson_rows, lesson=1), "lesson_id": "missing"}])
+    with pytest.raises(UnknownProgressTarget):
+        buffer.add([{**completion(lesson_rows), "customer_session_id": "missing"}])
+    assert buffer.buffered == 0
+
+
+def test_progress_route_accepts_known_ids_and_refuses_the_rest(app, client, lesson_rows):
+    completions = [{"lessonId": lesson_id, "answerCorrect": True} for lesson_id in lesson_rows["lesson_ids"]]
+    response = client.post(
+        "/lesson-progress", json={"sessionId": lesson_rows["session_id"], "completions": completions}
+    )
+    assert response.status_code == 202
+    assert response.json == {"accepted": 2}
+
+    unknown_session = {"sessionId": "missing", "lessonId": lesson_rows["lesson_ids"][0], "answerCorrect": True}
+    assert client.post("/lesson-progress", json=unknown_session).status_code == 400
+    unknown_lesson = {"sessionId": lesson_rows["session_id"], "lessonId": "missing", "answerCorrect": True}
+    assert client.post("/lesson-progress", json=unknown_lesson).status_code == 400
+    assert client.post("/lesson-progress", json={"sessionId": lesson_rows["session_id"]}).status_code == 400
+
+    app.extensions["lesson_progress"].flush()
+    assert stored(app) == {lesson_id: True for lesson_id in lesson_rows["lesson_ids"]}
+
+
+def test_known_ids_are_shared_safely_between_threads(app, lesson_rows, buffer, monkeypatch):
+    # Remembering at most one id forces the cache to be cleared on nearly every add
+    monkeypatch.setattr(progress, "PROGRESS_KNOWN_IDS", 1)
+    errors = []
+
+    def submit():
+        try:
+            for i in range(20):
+                buffer.add([completion(lesson_rows, lesson=i % 2)])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=submit) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert buffer.buffered == 2
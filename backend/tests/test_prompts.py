@@ -0,0 +1,62 @@
+import os
+
+import pytest
+import yaml
+
+from edutainment.prompts import LLM_PROMPTS_PATH, PromptError, PromptRegistry, compile_prompt_set
+
+PROMPTS = {
+    "system_prompt": "You teach.",
+    "topics_prompt": "Topics of $article",
+    "lessons_prompt": "Lessons on $topic from $article",
+}
+
+
+def write(path, prompt_sets, mtime=None):
+    with open(path, "w") as f:
+        yaml.safe_dump(prompt_sets, f)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def test_shipped_prompts_are_valid():
+    assert PromptRegistry(LLM_PROMPTS_PATH).models()
+
+
+def test_templates_substitute_their_placeholders():
+    prompt_set = compile_prompt_set("gpt", PROMPTS)
+    assert prompt_set.lessons_prompt.substitute(topic="Energy", article="text") == "Lessons on Energy from text"
+    assert prompt_set.batch_lessons_prompt is None
+
+
+@pytest.mark.parametrize(
+    "change, message",
+    [
+        ({"system_prompt": None}, "system_prompt is missing"),
+        ({"lessons_prompt": None}, "lessons_prompt is missing"),
+        ({"topics_prompt": "Topics of ${article"}, "invalid placeholder"),
+        ({"lessons_prompt": "Lessons on $topic"}, "expected ['article', 'topic']"),
+        ({"batch_lessons_prompt": "Lessons on $topic"}, "batch_lessons_prompt uses placeholders"),
+    ],
+)
+def test_malformed_prompts_are_rejected(change, message):
+    prompts = {k: v for k, v in {**PROMPTS, **change}.items() if v is not None}
+    with pytest.raises(PromptError) as error:
+        compile_prompt_set("gpt", prompts)
+    assert message in str(error.value)
+
+
+def test_changed_file_is_reloaded_and_bad_edits_are_ignored(tmp_path):
+    path = str(tmp_path / "prompts.yml")
+    write(path, {"gpt": PROMPTS}, mtime=1000)
+    registry = PromptRegistry(path, check_interval=0)
+    assert registry.get("gpt").system_prompt == "You teach."
+
+    write(path, {"gpt": {**PROMPTS, "system_prompt": "You explain."}}, mtime=2000)
+    assert registry.get("gpt").system_prompt == "You explain."
+
+    write(path, {"gpt": {**PROMPTS, "lessons_prompt": "Lessons on $subject"}}, mtime=3000)
+    assert registry.get("gpt").system_prompt == "You explain."
+
+    with pytest.raises(PromptError):
+        registry.get("claude")
@@ -0,0 +1,108 @@
+import time
+
+import pytest
+
+from edutainment import routing
+from edutainment.routing import RoutedLessonText, get_provider_stats
+
+
+class FakeProvider:
+    """Stands in for a lesson text backend: answers after `delay` seconds, or fails."""
+
+    passage_index = None
+
+    def __init__(self, name, delay=0.0, error=None):
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    def get_topics(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return [self.name]
+
+    def stream_lessons(self, topic):
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        for i in range(2):
+            yield {"lesson": f"{self.name} {i}"}
+
+
+@pytest.fixture(autouse=True)
+def fresh_stats(monkeypatch):
+    monkeypatch.setattr(routing, "_stats", {})
+    monkeypatch.setattr(routing, "PROVIDER_COST_PER_1K_TOKENS", {})
+
+
+def router(*providers, hedge_after=0.05):
+    return RoutedLessonText("article", {p.name: p for p in providers}, hedge_after=hedge_after)
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_a_slow_primary_is_hedged_and_demoted():
+    slow, fast = FakeProvider("slow", delay=0.5), FakeProvider("fast")
+    text = router(slow, fast)
+
+    assert text.get_topics() == ["fast"]
+    # The loser is counted as soon as the hedge wins, not when it finally answers
+    stats = get_provider_stats("slow")
+    assert stats.calls == 1
+    assert stats.latency_seconds >= 0.05
+    assert text.ranked_providers() == ["fast", "slow"]
+
+    # Its late answer does not add a second sample
+    time.sleep(0.6)
+    assert stats.calls == 1
+
+    assert text.get_topics() == ["fast"]
+    assert slow.calls == 1
+
+
+def test_censored_samples_only_raise_the_latency():
+    stats = get_provider_stats("p")
+    stats.record(2.0, ok=True)
+    stats.record_censored(1.0)
+    assert stats.latency_seconds == 2.0
+    stats.record_censored(12.0)
+    assert stats.latency_seconds == pytest.approx(4.0)
+    assert stats.error_rate == 0.0
+
+
+def test_a_failing_primary_falls_back_and_is_demoted():
+    broken, backup = FakeProvider("broken", error=RuntimeError("down")), FakeProvider("backup")
+    text = router(broken, backup, hedge_after=10)
+
+    assert text.get_topics() == ["backup"]
+    assert get_provider_stats("broken").error_rate > 0
+    assert text.ranked_providers() == ["backup", "broken"]
+
+
+def test_every_provider_failing_raises_the_last_error():
+    text = router(FakeProvider("a", error=RuntimeError("a down")), FakeProvider("b", error=ValueError("b down")))
+    with pytest.raises(ValueError):
+        text.get_topics()
+
+
+def test_a_slow_stream_is_hedged_and_demoted():
+    slow, fast = FakeProvider("slow", delay=0.5), FakeProvider("fast")
+    text = router(slow, fast)
+
+    assert list(text.stream_lessons("Energy")) == [{"lesson": "fast 0"}, {"lesson": "fast 1"}]
+    stats = get_provider_stats("slow")
+    assert stats.calls == 1
+    assert stats.latency_seconds >= 0.05
+    wait_for(lambda: get_provider_stats("fast").calls)
+    assert text.ranked_providers() == ["fast", "slow"]
+
+    time.sleep(0.6)
+    assert stats.calls == 1
+    assert stats.error_rate == 0.0
@@ -0,0 +1,114 @@
+import sqlalchemy
+from sqlalchemy import text
+
+from edutainment.database import db
+from edutainment.models import Article, ArticleTopic, Lesson, article_fingerprint
+from edutainment.schema import upgrade_schema
+
+
+def legacy_tables(app):
+    """Recreate the tables the way older versions did: no unique keys and no
+    content_hash column."""
+    legacy = sqlalchemy.MetaData()
+    for table in db.metadata.sorted_tables:
+        copy = table.to_metadata(legacy)
+        copy.constraints = {c for c in copy.constraints if not isinstance(c, sqlalchemy.UniqueConstraint)}
+        copy.indexes.clear()
+    with app.app_context():
+        db.drop_all()
+        legacy.create_all(db.engine)
+        with db.engine.begin() as connection:
+            connection.execute(text("ALTER TABLE article DROP COLUMN content_hash"))
+
+
+def insert(connection, table, **values):
+    placeholders = ", ".join(f":{column}" for column in values)
+    connection.execute(text(f"INSERT INTO {table} ({', '.join(values)}) VALUES ({placeholders})"), values)
+
+
+def lesson(connection, lesson_id, topic_id, order_num):
+    insert(
+        connection,
+        "lesson",
+        lesson_id=lesson_id,
+        article_topic_id=topic_id,
+        lesson_content=f"Lesson {lesson_id}",
+        question="Q",
+        right_answer="R",
+        wrong_answer="W",
+        right_answer_explanation="E",
+        order_num=order_num,
+    )
+
+
+def test_upgrade_merges_duplicate_articles_once(app):
+    legacy_tables(app)
+    with app.app_context(), db.engine.begin() as connection:
+        insert(connection, "customer", customer_id="c")
+        insert(connection, "customer_session", customer_session_id="s", customer_id="c")
+        # the same document uploaded twice under different names and spacing
+        insert(connection, "article", article_id="a1", filename="one.pdf", content="Some   article.")
+        insert(connection, "article", article_id="a2", filename="two.pdf", content="some article.")
+        insert(connection, "article_topic", article_topic_id="t1", article_id="a1", topic_name="Energy")
+        insert(connection, "article_topic", article_topic_id="t2", article_id="a2", topic_name="Energy")
+        insert(connection, "article_topic", article_topic_id="t3", article_id="a2", topic_name="Heat")
+        insert(
+            connection, "customer_article_topic", customer_article_topic_id="ct", article_topic_id="t2", customer_id="c"
+        )
+        lesson(connection, "l1", "t1", 0)
+        lesson(connection, "l2", "t2", 0)
+        lesson(connection, "l3", "t3", 0)
+        lesson(connection, "l4", "t3", 0)
+        insert(
+            connection,
+            "lesson_completion",
+            lesson_completion_id="lc",
+            customer_session_id="s",
+            lesson_id="l4",
+            lesson_complete=True,
+            answer_correct=True,
+        )
+
+    with app.app_context():
+        report = upgrade_schema()
+        assert report["columns"] == ["article.content_hash"]
+        assert report["fingerprinted"] == 1
+        assert report["merged_articles"] == 1
+        assert report["removed_duplicates"] == {"lesson": 1}
+        assert len(report["unique_keys"]) == 4
+
+        articles = db.session.execute(sqlalchemy.select(Article)).scalars().all()
+        assert [(a.article_id, a.content_hash) for a in articles] == [("a1", article_fingerprint("Some article."))]
+        topics = db.session.execute(sqlalchemy.select(ArticleTopic.topic_name, ArticleTopic.article_id)).all()
+        assert sorted(topics) == [("Energy", "a1"), ("Heat", "a1")]
+        assert db.session.execute(text("SELECT article_topic_id FROM customer_article_topic")).scalar() == "t1"
+        # the answer moved to the kept lesson at the same position
+        assert db.session.execute(text("SELECT lesson_id FROM lesson_completion")).scalar() == "l3"
+        assert {l.lesson_id for l in db.session.execute(sqlalchemy.select(Lesson)).scalars()} == {"l1", "l3"}
+
+        assert upgrade_schema() == {
+            "columns": [],
+            "fingerprinted": 0,
+            "merged_articles": 0,
+            "removed_duplicates": {},
+            "unique_keys": [],
+        }
+
+
+def test_upgrade_skips_merge_on_current_schema(app, monkeypatch):
+    def fail(connection):
+        raise AssertionError("duplicates scanned although the unique keys exist")
+
+    monkeypatch.setattr("edutainment.schema._merge_duplicates", fail)
+    with app.app_context():
+        assert upgrade_schema()["unique_keys"] == []
+
+
+def test_reuploaded_article_is_deduplicated(app):
+    from edutainment.lesson_planner import LessonPlan
+
+    with app.app_context():
+        first = LessonPlan("session-1", "one.pdf", "Water boils at 100 degrees.", app=app)
+        second = LessonPlan("session-2", "two.pdf", "Water  boils at 100 degrees.\n", app=app)
+        assert first.article_id == second.article_id
+        assert db.session.execute(sqlalchemy.select(sqlalchemy.func.count()).select_from(Article)).scalar() == 1
@@ -0,0 +1,140 @@
+import hashlib
+import io
+import json
+import os
+
+import pytest
+
+import server
+from benchmarks.corpus import write_pdf
+
+AUDIO = bytes(range(256)) * 8
+
+
+@pytest.fixture
+def pdf_upload(tmp_path):
+    path = write_pdf(str(tmp_path / "article.pdf"), seed=1, pages=1)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def post_stream(client, data):
+    return client.post(
+        "/generate-course/stream",
+        data={"selectedFile": (io.BytesIO(data), "article.pdf"), "sessionId": "s", "expertise": "beginner"},
+    )
+
+
+def test_stream_course_emits_topics_then_lessons(client, monkeypatch, pdf_upload):
+    def iter_course(article_text, article_filename, session_id, age, expertise):
+        assert article_text
+        yield "topics", ["Energy", "Heat"], "article-1"
+        yield "lessons", "Heat", [{"lesson_id": "l2"}]
+        yield "lessons", "Energy", None
+
+    monkeypatch.setattr(server, "iter_course", iter_course)
+    response = post_stream(client, pdf_upload)
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert lines == [
+        {"type": "topics", "topics": ["Energy", "Heat"], "article_id": "article-1"},
+        {"type": "lessons", "topic": "Heat", "lessons": [{"lesson_id": "l2"}]},
+        {"type": "lessons", "topic": "Energy", "lessons": None},
+        {"type": "done"},
+    ]
+
+
+def test_stream_course_reports_failures_after_the_headers(client, monkeypatch, pdf_upload):
+    def iter_course(*args):
+        yield "topics", ["Energy"], "article-1"
+        raise RuntimeError("LLM down")
+
+    monkeypatch.setattr(server, "iter_course", iter_course)
+    lines = [json.loads(line) for line in post_stream(client, pdf_upload).get_data(as_text=True).splitlines()]
+    assert lines[-1] == {"type": "error", "error": "Something went wrong"}
+
+
+def test_stream_course_rejects_unreadable_uploads_as_json(client):
+    response = post_stream(client, b"not a pdf")
+    assert response.status_code == 400
+    assert response.json == {"error": "Could not read the PDF"}
+
+    response = client.post("/generate-course/stream", data={})
+    assert response.status_code == 400
+    assert response.json == {"error": "No file uploaded"}
+
+
+def test_job_events_stream_after_the_request_ends(app, client):
+    def job(progress):
+        progress(step="one")
+        return {"lessons": 1}
+
+    job_id = app.extensions["course_jobs"].submit(job)
+    response = client.get(f"/generate-course/jobs/{job_id}/events")
+    assert response.mimetype == "text/event-stream"
+    # The body is produced after the request (and its app context) is gone
+    events = [block.split("\n") for block in response.get_data(as_text=True).strip().split("\n\n")]
+    last_event, last_data = events[-1]
+    assert last_event == "event: succeeded"
+    snapshot = json.loads(last_data.removeprefix("data: "))
+    assert snapshot["result"] == {"lessons": 1}
+    assert snapshot["progress"] == {"step": "one"}
+
+    assert client.get("/generate-course/jobs/missing/events").status_code == 404
+
+
+def test_course_is_served_with_an_etag(client, lesson_rows):
+    response = client.get(f"/courses/{lesson_rows['article_id']}")
+    assert response.status_code == 200
+    assert response.json["article_id"] == lesson_rows["article_id"]
+    assert [len(topic["lessons"]) for topic in response.json["topics"]] == [2]
+    etag = response.headers["ETag"]
+    assert client.get(f"/courses/{lesson_rows['article_id']}", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/courses/missing").status_code == 404
+
+
+@pytest.fixture
+def narration(app):
+    filename = hashlib.sha256(AUDIO).hexdigest() + ".mp3"
+    with open(os.path.join(app.config["NARRATION_DIR"], filename), "wb") as f:
+        f.write(AUDIO)
+    return f"/narration/{filename}"
+
+
+def test_narration_is_immutable_with_an_etag(client, narration):
+    response = client.get(narration)
+    assert response.status_code == 200
+    assert response.data == AUDIO
+    assert response.mimetype == "audio/mpeg"
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert response.headers["ETag"]
+    assert response.cache_control.immutable
+    assert response.cache_control.max_age == 365 * 24 * 3600
+
+
+def test_narration_ranges(client, narration):
+    response = client.get(narration, headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.data == AUDIO[10:20]
+    assert response.headers["Content-Range"] == f"bytes 10-19/{len(AUDIO)}"
+
+    response = client.get(narration, headers={"Range": "bytes=-16"})
+    assert response.status_code == 206
+    assert response.data == AUDIO[-16:]
+
+    response = client.get(narration, headers={"Range": f"bytes={len(AUDIO)}-"})
+    assert response.status_code == 416
+
+
+def test_narration_revalidation(client, narration):
+    etag = client.get(narration).headers["ETag"]
+    response = client.get(narration, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert client.get(narration, headers={"If-None-Match": '"stale"'}).status_code == 200
+
+
+def test_missing_and_outside_narrations_are_not_found(client):
+    assert client.get("/narration/" + "0" * 64 + ".mp3").status_code == 404
+    assert client.get("/narration/../config.py").status_code == 404
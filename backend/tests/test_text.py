@@ -0,0 +1,76 @@
+import json
+
+from edutainment.llm_cache import MemoryResponseCache
+from edutainment.text import LESSON_KEYS, GPTLessonText, merge_topics
+
+
+def topics(*names, relevance="high"):
+    return [{"topic": name, "relevance_to_subject": relevance} for name in names]
+
+
+def test_a_single_segment_keeps_all_relevant_topics_in_order():
+    segment = topics("b", "a") + topics("low", relevance="low")
+    segment += topics("c", "d", "e", "f", "g", relevance="medium")
+    assert merge_topics([segment], max_topics=3) == ["b", "a", "c", "d", "e", "f", "g"]
+
+
+def test_segments_merge_by_name_and_rank_by_relevance_then_mentions():
+    segments = [
+        topics("Energy", "Soil", relevance="medium"),
+        topics("energy ") + topics("Water", relevance="medium"),
+        topics("Water", "Air", relevance="medium") + topics("Noise", relevance="low"),
+    ]
+    assert merge_topics(segments) == ["Energy", "Water", "Soil", "Air"]
+    assert merge_topics(segments, max_topics=2) == ["Energy", "Water"]
+
+
+def lessons(tag, count=2):
+    return [{key: f"{tag} {key} {i}" for key in LESSON_KEYS} for i in range(count)]
+
+
+def test_batch_parsing_keeps_only_well_formed_topics():
+    content = json.dumps(
+        {
+            "topics": [
+                {"topic": " energy ", "instruction": lessons("energy")},
+                {"topic": "Water", "instruction": [{"lesson": "no question"}]},
+                {"topic": "Unasked", "instruction": lessons("unasked")},
+                {"topic": "Soil", "instruction": []},
+                {"instruction": lessons("nameless")},
+            ]
+        }
+    )
+    parsed = GPTLessonText._parse_lesson_batch(content, ["Energy", "Water", "Soil"])
+    assert parsed == {"Energy": lessons("energy")}
+    assert GPTLessonText._parse_lesson_batch("not json", ["Energy"]) == {}
+    assert GPTLessonText._parse_lesson_batch('{"topics": {"Energy": []}}', ["Energy"]) == {}
+
+
+class BatchClient:
+    """Answers batch prompts with lessons for only the first topic, and per-topic
+    prompts with that topic's lessons."""
+
+    def __init__(self):
+        self.prompts = []
+
+    def complete(self, model, messages, **params):
+        prompt = messages[-1]["content"]
+        self.prompts.append(prompt)
+        if "these topics" in prompt:
+            return json.dumps({"topics": [{"topic": "Energy", "instruction": lessons("batch")}]})
+        topic = "Water" if "Water" in prompt else "Soil"
+        return json.dumps({"instruction": lessons(topic)})
+
+
+def test_topics_missing_from_a_batch_fall_back_to_their_own_completion():
+    client = BatchClient()
+    text = GPTLessonText("Energy, water and soil.", cache=MemoryResponseCache(), client=client)
+
+    result = text.get_lessons_batch(["Energy", "Water", "Soil"])
+
+    assert result == {"Energy": lessons("batch"), "Water": lessons("Water"), "Soil": lessons("Soil")}
+    assert list(result) == ["Energy", "Water", "Soil"]
+    assert len(client.prompts) == 3
+    # The incomplete batch response is not cached, so it is requested again
+    text.get_lessons_batch(["Energy", "Water", "Soil"])
+    assert len(client.prompts) == 4
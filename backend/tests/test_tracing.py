@@ -0,0 +1,33 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from edutainment import tracing
+from edutainment.tracing import in_current_context, percentile, stage
+
+
+def test_spans_on_pool_threads_join_the_callers_trace(monkeypatch):
+    finished = []
+    monkeypatch.setattr(tracing._timer, "record", finished.append)
+
+    def child(i):
+        with stage("child", i=i):
+            pass
+
+    with stage("parent") as parent, ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(in_current_context(child), range(4)))
+        executor.submit(in_current_context(child), 4).result()
+        executor.submit(child, 5).result()
+
+    children = {span.attributes["i"]: span for span in finished if span.name == "child"}
+    for i in range(5):
+        assert children[i].trace_id == parent.trace_id
+        assert children[i].parent_id == parent.span_id
+    # Without the wrapper the worker thread starts a trace of its own
+    assert children[5].parent_id is None
+    assert children[5].trace_id != parent.trace_id
+
+
+def test_percentile_uses_the_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([], 50) is None
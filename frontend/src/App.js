@@ -151,21 +151,42 @@ function App() {
       formData.append('expertise', expertise);
       formData.append('sessionId', sessionId);
   
-      fetch(`${process.env.REACT_APP_API_BASE_URL}/generate-course`, {
+      // Topics arrive first and each topic's lessons as soon as they are ready,
+      // one JSON object per line
+      const handleLine = (line) => {
+        const message = JSON.parse(line);
+        if (message.type === "topics") {
+          setCourseData(message.topics.map(topicName => ({ topicName, lessons: [] })));
+        } else if (message.type === "lessons") {
+          setCourseData(prev => prev.map(topic =>
+            topic.topicName === message.topic ? { ...topic, lessons: message.lessons } : topic
+          ));
+        } else if (message.type === "error") {
+          throw new Error(message.error);
+        }
+      };
+
+      fetch(`${process.env.REACT_APP_API_BASE_URL}/generate-course/stream`, {
         method: "POST",
         mode: "cors",
         body: formData,
       })
-      .then((res) => res.json())
-      .then((data) => {
-        if (data) {
-          const formattedData = Object.keys(data).map(topicName => ({
-            topicName,
-            lessons: data[topicName],
-          }));
-          setCourseData(formattedData);
-          setShowSuccessToast(true);
-        }     
+      .then(async (res) => {
+        if (!res.ok) {
+          const data = await res.json();
+          throw new Error(data.error);
+        }
+        const reader = res.body.getReader();
+        const decoder = new TextDecoder();
+        let buffered = "";
+        for (;;) {
+          const { done, value } = await reader.read();
+          buffered += decoder.decode(value, { stream: !done });
+          const lines = buffered.split("\n");
+          buffered = lines.pop();
+          lines.filter(line => line.trim()).forEach(handleLine);
+          if (done) break;
+        }
         setShowSuccessToast(true);
       })
       .catch(error => {